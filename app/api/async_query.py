@@ -0,0 +1,71 @@
+"""
+asyncio variant of query2.run_event_query. The pipelines are built by query2
+and run with the motor driver
+"""
+from . import guardrails, query2
+from .cache import report_cache
+from .guardrails import admission
+from .slow_reports import slow_reports
+from ..data import rollups
+from ..data.async_models import AsyncEventDocument, motor_connections
+from ..data.partitions import AsyncPartitionedCollection
+from ..settings import REPORT_CACHE_ENABLED
+
+
+async def get_target(collection, pipeline):
+    """
+    The motor collection to run pipeline on, the events are merged from
+    their partitions by the pipeline, and the collection to count them
+    """
+    events = AsyncEventDocument.collection
+    if collection.name == events.name and \
+            isinstance(events, AsyncPartitionedCollection):
+        target, pipeline = await events.resolve(pipeline)
+        return target, pipeline, events
+    target = motor_connections.get_collection(collection.name)
+    return target, pipeline, target
+
+
+async def query_events(options):
+    # Slow pipelines are explained through the collection of query2
+    collection, pipeline = query2.select_pipeline(options)
+    normalized = query2.normalize_options(options)
+    rollups_per_day = None
+    if collection.name == rollups.collection.name:
+        rollups_per_day = await rollups.stats.get_per_day_async(
+            AsyncEventDocument.rollup_collection)
+    cost = query2.get_cost(options, rollups_per_day)
+    aggregate_options = guardrails.get_aggregate_options(cost)
+
+    count_mode = query2.get_value_or_default(options, "count_mode")
+    with await admission.acquire_async(cost), guardrails.translate_errors():
+        if count_mode == query2.ESTIMATED_COUNT:
+            target, merged, counted = await get_target(collection, pipeline)
+            with slow_reports.measure(normalized, collection, pipeline):
+                rows = await target.aggregate(
+                    merged, **aggregate_options).to_list(None)
+            total_count = await counted.estimated_document_count()
+        else:
+            pipeline = query2.count_pipeline(pipeline)
+            target, merged, _ = await get_target(collection, pipeline)
+            with slow_reports.measure(normalized, collection, pipeline):
+                result, = await target.aggregate(
+                    merged, **aggregate_options).to_list(None)
+            rows = result["rows"]
+            total_count = sum(count["count"]
+                              for count in result["total_count"])
+
+    return query2.get_page(options, rows, total_count)
+
+
+async def run_event_query(**kwargs):
+    options = kwargs.copy()
+    query2.verify_options(options)
+    if not REPORT_CACHE_ENABLED:
+        return await query_events(options)
+
+    return await report_cache.get_or_compute_async(
+        query2.normalize_options(options),
+        await AsyncEventDocument.get_write_generation(),
+        lambda: query_events(options),
+    )
@@ -0,0 +1,144 @@
+"""
+Cache of report results keyed by the normalized report options and the
+write generation of the events collection. Every write bumps the generation,
+so entries computed before it are never served again and age out of the LRU.
+
+Cached values are shared between requests, treat them as read-only.
+"""
+import collections
+import hashlib
+import importlib
+import threading
+import time
+
+from bson import json_util
+
+from ..settings import (REPORT_CACHE_BACKEND,
+                        REPORT_CACHE_MAX_BYTES,
+                        REPORT_CACHE_TTL)
+
+
+class CacheBackend:
+    """
+    Storage of the report cache. Subclass it to share the cache between
+    processes (memcached, redis...) and point REPORT_CACHE_BACKEND to it.
+    Without WRITE_GENERATION_SHARED the generation is counted per process,
+    a shared backend then only sees the writes of other processes once
+    their entries expire
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, size):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Least recently used entries are evicted once the total size is above
+    max_bytes, expired ones when they are read
+    """
+
+    def __init__(self, max_bytes=REPORT_CACHE_MAX_BYTES, ttl=REPORT_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _pop(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, _, value = entry
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                self.evictions += 1
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._pop(key)
+            self.entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "evictions": self.evictions,
+        }
+
+
+class ReportCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(options, generation):
+        normalized = json_util.dumps(options, sort_keys=True)
+        return hashlib.sha1(f"{generation}:{normalized}".encode()).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, len(json_util.dumps(value)))
+
+    def get_or_compute(self, options, generation, compute):
+        key = self.get_key(options, generation)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    async def get_or_compute_async(self, options, generation, compute):
+        key = self.get_key(options, generation)
+        value = self.get(key)
+        if value is None:
+            value = await compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses}
+        stats.update(self.backend.stats())
+        return stats
+
+
+def load_backend(path):
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+report_cache = ReportCache(load_backend(REPORT_CACHE_BACKEND))
@@ -0,0 +1,133 @@
+"""
+Columnar variant of query2.run_event_query: the rows are grouped by the
+in-memory store of app.data.columnar and the page stages (sort, cursor or
+offset, limit and row shape) run in python with the semantics of MongoDB
+"""
+import datetime as _dt
+import functools
+
+import pymongo
+
+from . import query2
+from .cache import report_cache
+from ..data.columnar import store
+from ..data.models import EventDocument
+from ..settings import REPORT_CACHE_ENABLED
+
+# Order of the BSON types a group field can hold, as MongoDB sorts them
+TYPE_ORDER = [(type(None), 0), (bool, 4), ((int, float), 1), (str, 2),
+              (_dt.datetime, 5)]
+
+
+def get_type_order(value):
+    for types, order in TYPE_ORDER:
+        if isinstance(value, types):
+            return order
+    return 3
+
+
+def compare_values(left, right):
+    left_key, right_key = get_type_order(left), get_type_order(right)
+    if left_key != right_key:
+        return -1 if left_key < right_key else 1
+    if left is None or left == right:
+        return 0
+    return -1 if left < right else 1
+
+
+def compare_group_ids(left, right, sort_query):
+    for field, sign in sort_query.items():
+        name = field[len("_id."):]
+        result = compare_values(left.get(name), right.get(name))
+        if result:
+            return result if sign == pymongo.ASCENDING else -result
+    return 0
+
+
+def project_row(row):
+    group_id = row["_id"]
+    projected = {"_id": group_id}
+    for name, default in query2.ROW_DEFAULTS.items():
+        value = group_id.get(name)
+        projected[name] = default if value is None else value
+    projected.update({
+        "mean": 0.0 if row["mean"] is None else row["mean"],
+        "sum": row["sum"],
+        "count": row["count"],
+    })
+    return projected
+
+
+def get_cursor_rows(options, rows):
+    """
+    Python equivalent of query2.get_cursor_query: the grouped rows after the
+    cursor, all of them without one
+    """
+    cursor = options.get("cursor")
+    if not cursor:
+        return rows
+    sort_query = query2.get_group_sort_query(options)
+    group_id = query2.decode_cursor(cursor)
+    return [row for row in rows
+            if compare_group_ids(row["_id"], group_id, sort_query) > 0]
+
+
+def get_page_rows(options, rows):
+    """
+    Python equivalent of query2.get_page_stages over the grouped rows
+    """
+    sort_query = query2.get_group_sort_query(options)
+
+    def compare(left, right):
+        return compare_group_ids(left["_id"], right["_id"], sort_query)
+
+    rows = sorted(rows, key=functools.cmp_to_key(compare))
+    if not options.get("cursor"):
+        rows = rows[query2.get_value_or_default(options, "offset"):]
+
+    limit = query2.get_value_or_default(options, "limit")
+    return [project_row(row) for row in rows[:limit]]
+
+
+def get_grouped_rows(options):
+    store.ensure_loaded(query2.collection)
+    return store.group(query2.get_match_query(options),
+                       query2.get_group_ids(options))
+
+
+def query_events(options):
+    # Every event is in memory, reports are always exact
+    options = {name: value for name, value in options.items()
+               if name != "sample_rate"}
+    rows = get_grouped_rows(options)
+    if query2.get_value_or_default(options, "count_mode") == \
+            query2.ESTIMATED_COUNT:
+        total_count = len(store)
+    else:
+        total_count = len(rows)
+    return query2.get_page(
+        options, get_page_rows(options, get_cursor_rows(options, rows)),
+        total_count)
+
+
+def run_event_query(**kwargs):
+    options = kwargs.copy()
+    query2.verify_options(options)
+    if not REPORT_CACHE_ENABLED:
+        return query_events(options)
+
+    return report_cache.get_or_compute(
+        query2.normalize_options(options),
+        EventDocument.get_write_generation(),
+        lambda: query_events(options),
+    )
+
+
+def stream_event_query(**kwargs):
+    """
+    The rows are already in memory, they are streamed from the computed page
+    """
+    options = kwargs.copy()
+    query2.verify_options(options)
+    rows, pagination = query_events(options)
+    return iter(rows), lambda: pagination
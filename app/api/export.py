@@ -0,0 +1,208 @@
+"""
+Raw events matching the report filters, read from a projected cursor and
+encoded batch by batch as CSV, an Arrow IPC stream or Parquet (one row group
+per batch), so the memory used doesn't depend on the size of the export
+"""
+import csv
+import datetime as _dt
+import io
+import re
+
+from . import query2
+from .utils import TimeRangeNameEnum
+from ..settings import EXPORT_BATCH_SIZE
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Only needed for the arrow and parquet formats
+    pyarrow = None
+
+CSV = "csv"
+ARROW = "arrow"
+PARQUET = "parquet"
+
+MIMETYPES = {
+    CSV: "text/csv",
+    ARROW: "application/vnd.apache.arrow.stream",
+    PARQUET: "application/vnd.apache.parquet",
+}
+EXTENSIONS = {CSV: "csv", ARROW: "arrows", PARQUET: "parquet"}
+
+FIELDS = ["id", "client", "client_group", "device_type", "category", "valid",
+          "timestamp", "value"]
+PROJECTION = {name: 1 for name in FIELDS[1:]}
+FILTERS = list(query2.MONGO_MATCH_NAMES) + TimeRangeNameEnum.values()
+TIMESTAMP_FORMATS = ["%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z",
+                     "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"]
+# strptime reads at most microseconds
+EXTRA_DIGITS = re.compile(r"(\.\d{6})\d+")
+
+
+def get_schema():
+    return pyarrow.schema([
+        ("id", pyarrow.string()),
+        ("client", pyarrow.int64()),
+        ("client_group", pyarrow.int64()),
+        ("device_type", pyarrow.string()),
+        ("category", pyarrow.int64()),
+        ("valid", pyarrow.bool_()),
+        ("timestamp", pyarrow.timestamp("ms")),
+        ("value", pyarrow.float64()),
+    ])
+
+
+def parse_timestamp(value):
+    """
+    Timestamps are stored as datetimes or as the ISO strings of the API,
+    both become naive datetimes in UTC like the ones MongoDB returns
+    """
+    if isinstance(value, str):
+        value = EXTRA_DIGITS.sub(r"\1", value)
+        for timestamp_format in TIMESTAMP_FORMATS:
+            try:
+                value = _dt.datetime.strptime(value, timestamp_format)
+                break
+            except ValueError:
+                continue
+    if not isinstance(value, _dt.datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(_dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def get_match_query(options):
+    """
+    The match query of the reports, with a time range matching timestamps
+    stored as datetimes as well as the ISO strings the API stores
+    """
+    match_query = query2.get_match_query(options)
+    timestamp = match_query.pop("timestamp", None)
+    if timestamp:
+        as_datetimes, as_strings = {}, {}
+        for operator, value in timestamp.items():
+            date = value if isinstance(value, _dt.datetime) \
+                else parse_timestamp(value)
+            as_datetimes[operator] = date
+            as_strings[operator] = date.isoformat() if date else value
+        match_query["$or"] = [{"timestamp": as_datetimes},
+                              {"timestamp": as_strings}]
+    return match_query
+
+
+def to_row(document):
+    row = [document.get("_id")]
+    row.extend(document.get(name) for name in FIELDS[1:])
+    row[FIELDS.index("timestamp")] = parse_timestamp(document.get("timestamp"))
+    return row
+
+
+def get_batches(cursor, batch_size):
+    batch = []
+    for document in cursor:
+        batch.append(to_row(document))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ChunkSink:
+    """
+    File object collecting what the pyarrow writers write, drained after
+    every batch
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for batch in batches:
+        for row in batch:
+            timestamp = row[FIELDS.index("timestamp")]
+            if timestamp is not None:
+                row[FIELDS.index("timestamp")] = timestamp.isoformat() + "Z"
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def to_record_batch(batch, schema):
+    columns = list(zip(*batch))
+    return pyarrow.record_batch(
+        [pyarrow.array(column, type=field.type)
+         for column, field in zip(columns, schema)],
+        schema=schema)
+
+
+def encode_arrow(batches):
+    schema = get_schema()
+    sink = ChunkSink()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    for batch in batches:
+        writer.write_batch(to_record_batch(batch, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def encode_parquet(batches):
+    schema = get_schema()
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for batch in batches:
+        writer.write_batch(to_record_batch(batch, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {CSV: encode_csv, ARROW: encode_arrow, PARQUET: encode_parquet}
+
+
+def get_formats():
+    return [CSV] if pyarrow is None else [CSV, ARROW, PARQUET]
+
+
+def verify_options(options, export_format):
+    extra = set(options) - set(FILTERS)
+    if extra:
+        raise ValueError(f"Invalid Extra Parameter(s): {extra}")
+    if export_format not in get_formats():
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def export_events(export_format=CSV, batch_size=EXPORT_BATCH_SIZE, **kwargs):
+    """
+    Returns an iterator over the encoded chunks of the export, the cursor
+    reads batch_size events at a time
+    """
+    options = kwargs.copy()
+    verify_options(options, export_format)
+    cursor = query2.collection.find(get_match_query(options),
+                                    PROJECTION, batch_size=batch_size)
+    return ENCODERS[export_format](get_batches(cursor, batch_size))
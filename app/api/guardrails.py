@@ -0,0 +1,262 @@
+"""
+Guardrails around the report aggregations, so a huge report can't take all
+of MongoDB and of the workers away from the event writes:
+
+- a cost estimate from the match query, the date span and the cardinality
+  of the grouped fields decides which reports are expensive
+- every report takes one of REPORT_MAX_CONCURRENT slots and an expensive
+  one also takes one of REPORT_MAX_EXPENSIVE_CONCURRENT, waiting at most
+  REPORT_QUEUE_TIMEOUT seconds for them before it is rejected, with 429
+  when too many expensive reports run and 503 when every slot is taken
+- the aggregations get a maxTimeMS budget and allowDiskUse is set by the
+  REPORT_ALLOW_DISK_USE policy, reports going over them are answered
+  with 503
+
+Slots are counted per worker process, like the connection pool.
+"""
+import asyncio
+import contextlib
+import datetime as _dt
+import threading
+import time
+
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from ..metrics import REPORT_REJECTIONS
+from ..settings import (REPORT_MAX_CONCURRENT,
+                        REPORT_MAX_EXPENSIVE_CONCURRENT,
+                        REPORT_QUEUE_TIMEOUT,
+                        REPORT_MAX_TIME_MS,
+                        REPORT_EXPENSIVE_MAX_TIME_MS,
+                        REPORT_ALLOW_DISK_USE,
+                        REPORT_EXPENSIVE_COST,
+                        REPORT_EVENTS_PER_DAY,
+                        REPORT_HISTORY_DAYS)
+
+ALWAYS = "always"
+NEVER = "never"
+EXPENSIVE = "expensive"
+
+# Rough number of distinct values per field, for the cost estimate
+CARDINALITIES = {
+    "client": 128,
+    "client_group": 11,
+    "device_type": 4,
+    "category": 33,
+    "valid": 3,
+}
+# Buckets of a time dimension per day
+BUCKETS_PER_DAY = {"day": 1, "hour": 24, "week": 1 / 7}
+# Server errors of a $group or $sort going over its memory limit
+MEMORY_LIMIT_CODES = {292, 16819, 16820, 16945}
+POLL_INTERVAL = 0.01
+
+
+class ReportRejected(Exception):
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def to_date(value):
+    if isinstance(value, _dt.datetime):
+        return value.date()
+    if isinstance(value, _dt.date):
+        return value
+    try:
+        return _dt.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def get_span_days(match_query):
+    """
+    Days covered by the timestamp (events) or day (rollups) range, the
+    whole history when it is open
+    """
+    condition = match_query.get("timestamp") or match_query.get("day") or {}
+    start = to_date(condition.get("$gte"))
+    end = to_date(condition.get("$lte", condition.get("$lt")))
+    if start is None or end is None:
+        return REPORT_HISTORY_DAYS
+    return max(1, min((end - start).days + 1, REPORT_HISTORY_DAYS))
+
+
+def get_selectivity(match_query):
+    selectivity = 1.0
+    for name, condition in match_query.items():
+        cardinality = CARDINALITIES.get(name)
+        if cardinality is None or not isinstance(condition, dict):
+            continue
+        if "$in" in condition:
+            values = len(condition["$in"])
+        elif "$eq" in condition:
+            values = 1
+        else:
+            continue
+        selectivity *= min(1.0, values / cardinality)
+    return selectivity
+
+
+def estimate_cost(match_query, group_ids, rollups_per_day=None):
+    """
+    Estimated documents read plus groups built by a report, from the
+    average REPORT_EVENTS_PER_DAY, or the rollup documents per day when the
+    report is answered from the rollups
+    """
+    days = get_span_days(match_query)
+    per_day = REPORT_EVENTS_PER_DAY if rollups_per_day is None \
+        else rollups_per_day
+    documents = days * per_day * get_selectivity(match_query)
+
+    groups = 1
+    for name in group_ids:
+        if name == "timestamp":
+            groups = documents  # Every event has its own timestamp
+            break
+        if name in BUCKETS_PER_DAY:
+            groups *= max(1, days * BUCKETS_PER_DAY[name])
+        else:
+            groups *= CARDINALITIES.get(name, 1)
+    return int(documents + min(groups, documents))
+
+
+def is_expensive(cost):
+    return cost > REPORT_EXPENSIVE_COST
+
+
+def get_aggregate_options(cost):
+    expensive = is_expensive(cost)
+    if REPORT_ALLOW_DISK_USE == ALWAYS:
+        allow_disk_use = True
+    elif REPORT_ALLOW_DISK_USE == NEVER:
+        allow_disk_use = False
+    else:
+        allow_disk_use = expensive
+    return {
+        "maxTimeMS": REPORT_EXPENSIVE_MAX_TIME_MS if expensive
+        else REPORT_MAX_TIME_MS,
+        "allowDiskUse": allow_disk_use,
+    }
+
+
+class Ticket:
+    """
+    The slots taken by one report, released once, when leaving the with
+    block or by release()
+    """
+
+    def __init__(self, semaphores):
+        self.semaphores = semaphores
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            semaphores, self.semaphores = self.semaphores, []
+        for semaphore in semaphores:
+            semaphore.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionControl:
+
+    def __init__(self, max_concurrent=REPORT_MAX_CONCURRENT,
+                 max_expensive=REPORT_MAX_EXPENSIVE_CONCURRENT,
+                 queue_timeout=REPORT_QUEUE_TIMEOUT):
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.expensive_slots = threading.BoundedSemaphore(max_expensive)
+        self.queue_timeout = queue_timeout
+
+    def get_semaphores(self, cost):
+        semaphores = [(self.slots, ReportRejected(
+            "Too many reports running, retry later", 503))]
+        if is_expensive(cost):
+            # The expensive slot first, it is the scarcer one
+            semaphores.insert(0, (self.expensive_slots, ReportRejected(
+                "Too many expensive reports running, narrow the filters or "
+                "retry later", 429)))
+        return semaphores
+
+    def reject(self, taken, rejection):
+        Ticket(taken).release()
+        REPORT_REJECTIONS.inc(str(rejection.status))
+        raise rejection
+
+    def acquire(self, cost):
+        """
+        Returns the ticket of the report, raises ReportRejected once the
+        queue timeout is over
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        taken = []
+        for semaphore, rejection in self.get_semaphores(cost):
+            timeout = max(0.0, deadline - time.monotonic())
+            if not semaphore.acquire(timeout=timeout):
+                self.reject(taken, rejection)
+            taken.append(semaphore)
+        return Ticket(taken)
+
+    async def acquire_async(self, cost):
+        """
+        Same as acquire, polling so the event loop is never blocked
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        taken = []
+        for semaphore, rejection in self.get_semaphores(cost):
+            while not semaphore.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    self.reject(taken, rejection)
+                await asyncio.sleep(POLL_INTERVAL)
+            taken.append(semaphore)
+        return Ticket(taken)
+
+
+@contextlib.contextmanager
+def translate_errors():
+    """
+    Turns the reports going over their time or memory budget into
+    rejections
+    """
+    try:
+        yield
+    except ExecutionTimeout:
+        raise ReportRejected("Report exceeded its time budget, narrow the "
+                             "filters or the grouping", 503)
+    except OperationFailure as exc:
+        if exc.code not in MEMORY_LIMIT_CODES:
+            raise
+        raise ReportRejected("Report exceeded its memory budget, narrow the "
+                             "filters or the grouping", 503)
+
+
+class GuardedRows:
+    """
+    Iterator over the rows of a streamed report which holds its ticket
+    until it is closed, whether it was read or not
+    """
+
+    def __init__(self, rows, ticket):
+        self.rows = rows
+        self.ticket = ticket
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with translate_errors():
+            return next(self.rows)
+
+    def close(self):
+        self.ticket.release()
+        close = getattr(self.rows, "close", None)
+        if close is not None:
+            close()
+
+
+admission = AdmissionControl()
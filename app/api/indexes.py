@@ -0,0 +1,147 @@
+"""
+Indexes backing the report filters and an advisor which replays sample
+report options through the pipeline builder and explains them:
+
+    python -m app.api.indexes [SAMPLES]
+"""
+import collections
+import random
+import sys
+
+from pymongo import ASCENDING
+
+from . import query2
+from ..data import buckets, rollups
+from ..data.partitions import PartitionedCollection
+
+TIMESTAMP_KEY = ("timestamp", ASCENDING)
+
+# Equality fields first, then the timestamp range (equality, sort, range).
+# The time buckets are grouped on, the timestamp range narrows them
+INDEXES = [[TIMESTAMP_KEY]] + [
+    [(name, ASCENDING), TIMESTAMP_KEY]
+    for name in query2.ARRAYS + query2.EQUALS + buckets.FIELDS
+]
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def ensure_indexes():
+    """
+    Creates the declared indexes, it is a no-op for the existing ones
+    """
+    for keys in INDEXES:
+        query2.collection.create_index(keys)
+    rollups.ensure_index()
+
+
+def get_sample_options(target, count, seed=0):
+    """
+    Generates report options using the values stored in the collection
+    """
+    rand = random.Random(seed)
+    values = {
+        name: [value for value in target.distinct(field) if value is not None]
+        for name, field in query2.MONGO_MATCH_NAMES.items()
+    }
+    timestamps = [document["timestamp"] for document in target.aggregate([
+        {"$match": {"timestamp": {"$ne": None}}},
+        {"$sample": {"size": count * 2}},
+        {"$project": {"timestamp": 1}},
+    ])]
+    groups = query2.DIMENSIONS
+
+    for _ in range(count):
+        options = {"group_by": rand.sample(groups, rand.randint(1, 3))}
+        if len(timestamps) > 1 and rand.random() < 0.5:
+            start_date, end_date = sorted(rand.sample(timestamps, 2))
+            options.update(start_date=start_date, end_date=end_date)
+        for name in rand.sample(list(values), rand.randint(0, 2)):
+            if not values[name]:
+                continue
+            if name in query2.EQUALS:
+                options[name] = rand.choice(values[name])
+            else:
+                size = min(len(values[name]), rand.randint(1, 3))
+                options[name] = rand.sample(values[name], size)
+        yield options
+
+
+def explain(target, pipeline):
+    if isinstance(target, PartitionedCollection):
+        target, pipeline = target.resolve(pipeline)
+    return target.database.command(
+        "explain",
+        {"aggregate": target.name, "pipeline": pipeline, "cursor": {}},
+        verbosity="executionStats",
+    )
+
+
+def find_values(document, key):
+    """
+    Yields every value stored under the given key in a nested document
+    """
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from find_values(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from find_values(value, key)
+
+
+def get_plan_summary(explain_output):
+    stages = []
+    for plan in find_values(explain_output, "winningPlan"):
+        stages.extend(find_values(plan, "stage"))
+
+    stats = next(find_values(explain_output, "executionStats"), {})
+    return {
+        "stages": stages,
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "docs_examined": stats.get("totalDocsExamined", 0),
+        "returned": stats.get("nReturned", 0),
+    }
+
+
+def get_index_suggestion(pipeline):
+    """
+    Suggests an index for the first $match of a pipeline: equality
+    fields first, range fields last
+    """
+    match = next((stage["$match"] for stage in pipeline
+                  if "$match" in stage), {})
+    equalities = []
+    ranges = []
+    for field, condition in match.items():
+        is_range = (isinstance(condition, dict)
+                    and set(condition) & RANGE_OPERATORS)
+        (ranges if is_range else equalities).append((field, ASCENDING))
+    return equalities + ranges
+
+
+def advise(count=20):
+    suggestions = collections.Counter()
+
+    for options in get_sample_options(query2.collection, count):
+        target, pipeline = query2.select_pipeline(options)
+        summary = get_plan_summary(explain(target, pipeline))
+        print(f"{target.name} {options}")
+        print(f"    stages: {' > '.join(summary['stages'])}, "
+              f"keys examined: {summary['keys_examined']}, "
+              f"docs examined: {summary['docs_examined']}, "
+              f"returned: {summary['returned']}")
+
+        if "COLLSCAN" in summary["stages"]:
+            suggestion = get_index_suggestion(pipeline)
+            if suggestion:
+                suggestions[(target.name, tuple(suggestion))] += 1
+
+    print("Suggested indexes:")
+    for (name, keys), hits in suggestions.most_common():
+        print(f"    {name}: {list(keys)} ({hits} scans)")
+
+
+if __name__ == "__main__":
+    advise(*map(int, sys.argv[1:2]))
@@ -0,0 +1,163 @@
+"""
+Rewrite pass over the report pipelines, run before they are sent:
+
+- empty stages are dropped ({"$match": {}}, {"$skip": 0}, None)
+- $match stages go ahead of the $sort stages before them
+- a $sort before the $group is moved after it, on the grouped fields, as
+  the grouping discards the order when its accumulators don't depend on it
+- a $sort directly followed by another $sort is dropped, the last one wins
+- the documents are projected to the fields the $group reads before it
+- range conditions (the timestamp range) come first in the $match
+"""
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+ORDER_INSENSITIVE_ACCUMULATORS = {"$sum", "$avg", "$min", "$max",
+                                  "$addToSet", "$stdDevPop", "$stdDevSamp"}
+# Stages a $sort can be moved across, they don't depend on the order
+UNORDERED_STAGES = {"$match", "$project", "$addFields", "$sort"}
+
+
+def get_stage_name(stage):
+    return next(iter(stage))
+
+
+def is_empty_stage(stage):
+    if not stage:
+        return True
+    name = get_stage_name(stage)
+    if name == "$skip":
+        return stage[name] == 0
+    return name in ("$match", "$project", "$addFields") and not stage[name]
+
+
+def get_group_position(pipeline):
+    return next((index for index, stage in enumerate(pipeline)
+                 if "$group" in stage), None)
+
+
+def get_field_paths(expression):
+    """
+    Yields the fields an expression reads, None for a variable ("$$ROOT")
+    """
+    if isinstance(expression, str) and expression.startswith("$$"):
+        yield None
+    elif isinstance(expression, str) and expression.startswith("$"):
+        yield expression[1:]
+    elif isinstance(expression, dict):
+        for value in expression.values():
+            yield from get_field_paths(value)
+    elif isinstance(expression, list):
+        for value in expression:
+            yield from get_field_paths(value)
+
+
+def is_order_insensitive(group):
+    return all(isinstance(accumulator, dict) and
+               set(accumulator) <= ORDER_INSENSITIVE_ACCUMULATORS
+               for name, accumulator in group.items() if name != "_id")
+
+
+def get_group_sort(sort, group_id):
+    """
+    Translates a sort of the documents to the grouped rows, the fields
+    which are not grouped are left out
+    """
+    if not isinstance(group_id, dict):
+        return {}
+    names = {expression[1:]: name for name, expression in group_id.items()
+             if isinstance(expression, str) and expression.startswith("$")
+             and not expression.startswith("$$")}
+    return {f"_id.{names[field]}": sign for field, sign in sort.items()
+            if field in names}
+
+
+def drop_empty_stages(pipeline):
+    return [stage for stage in pipeline if not is_empty_stage(stage)]
+
+
+def move_matches_before_sorts(pipeline):
+    optimized = []
+    for stage in pipeline:
+        position = len(optimized)
+        if "$match" in stage:
+            while position and "$sort" in optimized[position - 1]:
+                position -= 1
+        optimized.insert(position, stage)
+    return optimized
+
+
+def move_sorts_after_group(pipeline):
+    position = get_group_position(pipeline)
+    if position is None:
+        return pipeline
+    group = pipeline[position]["$group"]
+    if not is_order_insensitive(group):
+        return pipeline
+
+    # Only the sorts followed by unordered stages up to the $group
+    before = pipeline[:position]
+    movable = len(before)
+    while movable and get_stage_name(before[movable - 1]) in UNORDERED_STAGES:
+        movable -= 1
+    sorts = [stage["$sort"] for stage in before[movable:] if "$sort" in stage]
+    if not sorts:
+        return pipeline
+
+    before = before[:movable] + [stage for stage in before[movable:]
+                                 if "$sort" not in stage]
+    group_sort = get_group_sort(sorts[-1], group["_id"])
+    moved = [{"$sort": group_sort}] if group_sort else []
+    return before + [pipeline[position]] + moved + pipeline[position + 1:]
+
+
+def drop_overridden_sorts(pipeline):
+    return [stage for stage, following in zip(pipeline, pipeline[1:] + [{}])
+            if not ("$sort" in stage and "$sort" in following)]
+
+
+def add_group_projection(pipeline):
+    position = get_group_position(pipeline)
+    if position is None or any("$project" in stage
+                               for stage in pipeline[:position]):
+        return pipeline
+    paths = list(get_field_paths(pipeline[position]["$group"]))
+    if not paths or None in paths:
+        return pipeline
+
+    projection = dict.fromkeys(sorted({path.split(".")[0]
+                                       for path in paths}), 1)
+    projection.setdefault("_id", 0)
+    return pipeline[:position] + [{"$project": projection}] + \
+        pipeline[position:]
+
+
+def put_ranges_first(pipeline):
+    optimized = []
+    for stage in pipeline:
+        if "$match" in stage:
+            match = stage["$match"]
+            ranges = {name: condition for name, condition in match.items()
+                      if isinstance(condition, dict) and
+                      set(condition) & RANGE_OPERATORS}
+            stage = {"$match": {**ranges, **match}}
+        optimized.append(stage)
+    return optimized
+
+
+PASSES = [
+    drop_empty_stages,
+    move_matches_before_sorts,
+    move_sorts_after_group,
+    drop_overridden_sorts,
+    add_group_projection,
+    put_ranges_first,
+]
+
+
+def optimize_pipeline(pipeline):
+    """
+    Returns an equivalent pipeline, the given one is left as it is
+    """
+    pipeline = list(pipeline)
+    for optimization in PASSES:
+        pipeline = optimization(pipeline)
+    return pipeline
@@ -1,9 +1,9 @@
 import pymongo
 
-from ..settings import (DEFAULT_PAGE_LIMIT,
-                        MONGO_CLIENT,
-                        MONGO_DB_NAME,
-                        MONGO_COLLECTION_NAME)
+from ..data.partitions import get_events_collection
+from ..settings import DEFAULT_PAGE_LIMIT
+from .optimizer import optimize_pipeline
+from .slow_reports import slow_reports
 from .utils import TimeRangeNameEnum
 
 
@@ -11,7 +11,7 @@ class EventMongoQuery: # TODO: Deprecate this class
     """
     This is a class based implementation of query manipulation
     """
-    collection = MONGO_CLIENT[MONGO_DB_NAME][MONGO_COLLECTION_NAME]
+    collection = get_events_collection()
 
     SUPPORTED_FILTERS = [
         "offset", "limit", "group_by", "order_by"
@@ -146,7 +146,7 @@ class EventMongoQuery: # TODO: Deprecate this class
         order_by_dict = {"_id": 1}
         for value in values:
             if value.startswith('-'):
-                value = value[1]
+                value = value[1:]
                 order = pymongo.DESCENDING
             else:
                 order = pymongo.ASCENDING
@@ -157,7 +157,8 @@ class EventMongoQuery: # TODO: Deprecate this class
         pipeline = []
         match_dict = self.get_match_query_dict()
         match_dict and pipeline.append(match_dict)
-        pipeline.append(self.get_order_by_dict())
+        order_by_dict = self.get_order_by_dict()
+        order_by_dict and pipeline.append(order_by_dict)
         group_dict = self.get_group_by_dict()
         group_dict and pipeline.append(group_dict)
         pipeline.append(self.get_skip_dict())
@@ -165,9 +166,10 @@ class EventMongoQuery: # TODO: Deprecate this class
         return pipeline
 
     def query(self):
-        aggregate_pipeline = self.build_pipeline()
-        print(aggregate_pipeline)
-        query = self.collection.aggregate(
-            aggregate_pipeline
-        )
-        return list(query)
+        aggregate_pipeline = optimize_pipeline(self.build_pipeline())
+        with slow_reports.measure(self.options, self.collection,
+                                  aggregate_pipeline):
+            query = list(self.collection.aggregate(
+                aggregate_pipeline
+            ))
+        return query
@@ -1,19 +1,38 @@
+import base64
+import datetime as _dt
+
 import pymongo
+from bson import json_util
 
+from . import guardrails, sampling
+from .cache import report_cache
+from .guardrails import GuardedRows, admission
+from .optimizer import optimize_pipeline
+from .slow_reports import slow_reports
 from .utils import TimeRangeNameEnum
+from ..data import buckets, rollups
+from ..data.models import EventDocument
+from ..data.partitions import get_events_collection
 from ..settings import (DEFAULT_PAGE_LIMIT,
-                        MONGO_CLIENT,
-                        MONGO_DB_NAME,
-                        MONGO_COLLECTION_NAME)
+                        REPORT_CACHE_ENABLED,
+                        REPORT_STREAM_BATCH_SIZE,
+                        USE_ROLLUPS)
 
 # TODO: Move to settings
-collection = MONGO_CLIENT[MONGO_DB_NAME][MONGO_COLLECTION_NAME]
+collection = get_events_collection()
+
+FILTERS = ["offset", "limit", "group_by", "order_by", "count_mode", "cursor",
+           "sample_rate"]
 
-FILTERS = ["offset", "limit", "group_by", "order_by"]
+# Decoded datetimes are naive like the ones returned by pymongo
+CURSOR_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+EXACT_COUNT = "exact"
+ESTIMATED_COUNT = "estimated"
 
 ARRAYS = ["client", "client_group", "device_type", "category"]
 EQUALS = ["valid"]
-DIMENSIONS = ARRAYS + EQUALS + ["date"]
+DIMENSIONS = ARRAYS + EQUALS + list(buckets.GROUP_FIELDS)
 
 MONGO_NAMES = {
     "clients": "client",
@@ -30,8 +49,9 @@ MONGO_MATCH_NAMES.pop("date")
 DEFAULTS = {
     "offset": 0,
     "limit": DEFAULT_PAGE_LIMIT,
+    "count_mode": EXACT_COUNT,
     "group_by": ["client", "client_group", "device_type", "category", "valid",
-                 "timestamp"]
+                 "date"]
 }
 
 
@@ -40,28 +60,156 @@ def get_value_or_default(options, key, default=None):
 
 
 def get_sort_query(options):
-    values = set(get_value_or_default(options, "order_by", []))
-    descendings = set(filter(lambda x: x.startswith('-'), values))
     sort_dict = {}
+    for value in get_value_or_default(options, "order_by", []):
+        sign = pymongo.DESCENDING if value.startswith('-') else pymongo.ASCENDING
+        sort_dict[value.lstrip('-')] = sign
+    return sort_dict
 
-    def add_values(values, sign):
-        sort_dict.update({value.lstrip('-'): sign for value in values})
 
-    add_values(descendings, pymongo.DESCENDING)
-    add_values((values - descendings), pymongo.ASCENDING)
-    return sort_dict
+def get_group_sort_query(options):
+    """
+    Sorts the grouped rows by order_by and then by the rest of the grouped
+    fields, so every row has a unique position a cursor can point at
+    """
+    group_ids = get_group_ids(options)
+    sort_query = {}
+    for name, sign in get_sort_query(options).items():
+        name = buckets.GROUP_FIELDS.get(name, name)
+        if name in group_ids:
+            sort_query[f"_id.{name}"] = sign
+    for name in group_ids:
+        sort_query.setdefault(f"_id.{name}", pymongo.ASCENDING)
+    return sort_query
+
+
+def encode_cursor(group_id):
+    return base64.urlsafe_b64encode(json_util.dumps(group_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        group_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()),
+                                   json_options=CURSOR_JSON_OPTIONS)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(group_id, dict):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return group_id
+
+
+def get_after_condition(value, sign):
+    # Null sorts before every other value
+    if sign == pymongo.ASCENDING:
+        return {"$ne": None} if value is None else {"$gt": value}
+    return None if value is None else {"$not": {"$gte": value}}
+
+
+def get_keyset_query(sort_query, group_id, grouped=False):
+    """
+    Matches the groups after group_id under sort_query, that is
+    (a > x) or (a == x and b > y) or (a == x and b == y and c > z) ...
+    The groups are keyed by the raw fields, so it can also match their events
+    before $group, where the indexes serve it, unless grouped is set
+    """
+    conditions = []
+    equals = {}
+    for field, sign in sort_query.items():
+        value = group_id.get(field[len("_id."):])
+        name = field if grouped else field[len("_id."):]
+        after = get_after_condition(value, sign)
+        if after is not None:
+            conditions.append({**equals, name: after})
+        equals[name] = value
+
+    if not conditions:
+        return {"_id": {"$exists": False}}
+    return {"$or": conditions}
+
+
+def get_cursor_query(options, grouped=False):
+    cursor = options.get("cursor")
+    if not cursor:
+        return {}
+    return get_keyset_query(get_group_sort_query(options),
+                            decode_cursor(cursor), grouped)
+
+
+def is_cursor_before_group(options):
+    """
+    An exact total_count counts every grouped row, the cursor is then matched
+    after $group. Otherwise the rows before it aren't grouped at all
+    """
+    return get_value_or_default(options, "count_mode") == ESTIMATED_COUNT
+
+
+def get_pre_group_cursor_query(options):
+    if not is_cursor_before_group(options):
+        return {}
+    return get_cursor_query(options)
+
+
+# Report row fields taken from the group ids and their defaults
+ROW_DEFAULTS = {
+    "category": 0,
+    "client": 0,
+    "client_group": 0,
+    "valid": None,
+    "device_type": None,
+    "day": None,
+    "hour": None,
+    "week": None,
+}
 
 
-def replace_object(values, obj, replace="timestamp"):
-    if obj in values:
-        values.remove("date")
-        values.append(replace)
+def get_row_projection(sampled=False):
+    """
+    Shapes the grouped documents into report rows. The group id is kept for
+    the pagination cursor and dropped before the rows are returned, so are
+    the accumulators of a sample once the rows are scaled
+    """
+    projection = {
+        name: {'$ifNull': [f'$_id.{name}', default]}
+        for name, default in ROW_DEFAULTS.items()
+    }
+    projection.update({
+        'mean': {'$ifNull': ['$mean', 0.0]},
+        'sum': {'$ifNull': ['$sum', 0.0]},
+        'count': {'$ifNull': ['$count', 0]},
+    })
+    if sampled:
+        projection.update({name: f'${name}'
+                           for name in sampling.SAMPLE_ACCUMULATORS})
+    return projection
+
+
+def get_page_stages(options):
+    """
+    A cursor replaces the offset, it is matched here or before $group, see
+    is_cursor_before_group
+    """
+    offset = 0 if options.get("cursor") else \
+        get_value_or_default(options, "offset")
+    sampled = get_sample_rate(options) is not None
+
+    stages = []
+    if options.get("cursor") and not is_cursor_before_group(options):
+        stages.append({'$match': get_cursor_query(options, grouped=True)})
+    return stages + [
+        {'$sort': get_group_sort_query(options)},
+        {'$skip': offset},
+        {'$limit': get_value_or_default(options, "limit")},
+        {'$project': get_row_projection(sampled)},
+    ]
 
 
 def get_group_ids(options):
+    """
+    The time dimensions group on the buckets stored with the events
+    """
     values = get_value_or_default(options, "group_by", DIMENSIONS)
-    replace_object(values, "date")
-    return {name: f"${name}" for name in values}
+    fields = [buckets.GROUP_FIELDS.get(name, name) for name in values]
+    return {name: f"${name}" for name in fields}
 
 
 def get_timestamp_query(options):
@@ -92,22 +240,152 @@ def get_match_query(options):
     return match_query
 
 
+def get_sample_rate(options):
+    """
+    The rate of the sample a report is computed from, None when it reads
+    every event. Rollups are cheaper than any sample and always exact
+    """
+    sample_rate = options.get("sample_rate")
+    if sample_rate is None or sample_rate >= 1 or can_use_rollups(options):
+        return None
+    return sample_rate
+
+
 def build_pipeline(**kwargs):
     options = kwargs.copy()
-    sort_query = {'_id': 1}
-    sort_query.update(get_sort_query(options))
+    match_query = get_match_query(options)
+    group = {
+        '_id': get_group_ids(options),
+        'mean': {'$avg': '$value'},
+        'sum': {'$sum': '$value'},
+        'count': {'$sum': 1},
+    }
+    sample_rate = get_sample_rate(options)
+    if sample_rate:
+        match_query.update(sampling.get_sample_query(sample_rate))
+        group.update(sampling.SAMPLE_ACCUMULATORS)
+    match_query.update(get_pre_group_cursor_query(options))
+
+    pipeline = [{'$match': match_query}, {'$group': group}]
+    return pipeline + get_page_stages(options)
+
+
+def is_day_aligned(date):
+    if isinstance(date, _dt.datetime):
+        return date.time() == _dt.time(0, 0)
+    if isinstance(date, str):
+        return len(date) == len("YYYY-MM-DD")
+    return True
+
+
+def can_use_rollups(options):
+    """
+    Rollups can answer a report if it doesn't group by anything finer than
+    their key (dimensions and day) and its date range starts and ends on
+    day boundaries
+    """
+    if not USE_ROLLUPS:
+        return False
+    group_by = get_value_or_default(options, "group_by", DIMENSIONS)
+    if not set(group_by) <= set(rollups.DIMENSIONS) | {"date"}:
+        return False
+    return all(is_day_aligned(options.get(name))
+               for name in TimeRangeNameEnum.values())
+
+
+def get_rollup_match_query(options):
+    match_query = get_match_query(options)
+    timestamp = match_query.pop("timestamp", {})
+
+    # Events before end_date are the ones in the days before it
+    day = {}
+    if "$gte" in timestamp:
+        day["$gte"] = rollups.get_day(timestamp["$gte"])
+    if "$lte" in timestamp:
+        day["$lt"] = rollups.get_day(timestamp["$lte"])
+    if day:
+        match_query["day"] = day
+
+    match_query["count"] = {"$gt": 0}
+    match_query.update(get_pre_group_cursor_query(options))
+    return match_query
+
+
+def build_rollup_pipeline(**kwargs):
+    options = kwargs.copy()
     pipeline = [
-        {'$match': get_match_query(options)},
-        {'$sort': sort_query},
+        {'$match': get_rollup_match_query(options)},
         {'$group': {
             '_id': get_group_ids(options),
-            'mean': {'$avg': '$value'},
-            'sum': {'$sum': '$value'},
-            'count': {'$sum': 1}}},
-        {'$skip': get_value_or_default(options, "offset")},
-        {'$limit': get_value_or_default(options, "limit")},
+            'sum': {'$sum': '$sum'},
+            'count': {'$sum': '$count'},
+            # Rollups built before value_count existed counted every value
+            'value_count': {'$sum': {'$ifNull': ['$value_count', '$count']}}}},
+        {'$addFields': {'mean': {'$cond': [
+            {'$gt': ['$value_count', 0]},
+            {'$divide': ['$sum', '$value_count']},
+            None]}}},
     ]
-    return pipeline
+    return pipeline + get_page_stages(options)
+
+
+def get_group_position(pipeline):
+    return max(index for index, stage in enumerate(pipeline)
+               if "$group" in stage) + 1
+
+
+def count_pipeline(pipeline):
+    """
+    Moves the stages after $group into a $facet, so the page and the number
+    of grouped rows come back from a single aggregation
+    """
+    position = get_group_position(pipeline)
+    return pipeline[:position] + [{'$facet': {
+        'rows': pipeline[position:],
+        'total_count': [{'$count': 'count'}],
+    }}]
+
+
+def count_only_pipeline(pipeline):
+    position = get_group_position(pipeline)
+    return pipeline[:position] + [{'$count': 'count'}]
+
+
+def select_pipeline(options):
+    """
+    Returns the collection to aggregate and the optimized pipeline to run on
+    it
+    """
+    if can_use_rollups(options):
+        return rollups.collection, optimize_pipeline(
+            build_rollup_pipeline(**options))
+    return collection, optimize_pipeline(build_pipeline(**options))
+
+
+def get_cost(options, rollups_per_day=None):
+    """
+    The cost estimate of a report, rollups_per_day is read from the rollups
+    when they answer it and it isn't given
+    """
+    if rollups_per_day is None and can_use_rollups(options):
+        rollups_per_day = rollups.stats.get_per_day()
+    cost = guardrails.estimate_cost(get_match_query(options),
+                                    get_group_ids(options),
+                                    rollups_per_day)
+    return int(cost * (get_sample_rate(options) or 1))
+
+
+def verify_order_by(options):
+    """
+    The rows are sorted, and the cursors keyed, by the grouped fields only
+    """
+    group_ids = get_group_ids(options)
+    invalid = [value for value in get_value_or_default(options, "order_by", [])
+               if buckets.GROUP_FIELDS.get(value.lstrip('-'),
+                                           value.lstrip('-')) not in group_ids]
+    if invalid:
+        raise ValueError(f"Invalid order_by: {' '.join(invalid)}, only the "
+                         f"group_by fields can be sorted")
 
 
 def verify_options(options):
@@ -116,21 +394,123 @@ def verify_options(options):
         extra = set(options) - set(all_names)
         if extra:
             raise AttributeError(f"Invalid Extra Parameter(s): {extra}")
+        sampling.verify_sample_rate(options.get("sample_rate"))
+        verify_order_by(options)
     return True
 
 
+def normalize_options(options):
+    """
+    Fills in the defaults and sorts the filter values, so equivalent option
+    sets compare equal
+    """
+    names = FILTERS + list(MONGO_NAMES) + TimeRangeNameEnum.values()
+    normalized = {}
+    for name in names:
+        value = get_value_or_default(options, name)
+        if value is None or value == []:
+            continue
+        if name in MONGO_MATCH_NAMES and isinstance(value, list):
+            value = sorted(value, key=repr)
+        normalized[name] = value
+    return normalized
+
+
 def run_event_query(**kwargs):
     options = kwargs.copy()
     verify_options(options)
-    query = collection.aggregate(
-        build_pipeline(**options)
+    if not REPORT_CACHE_ENABLED:
+        return query_events(options)
+
+    return report_cache.get_or_compute(
+        normalize_options(options),
+        EventDocument.get_write_generation(),
+        lambda: query_events(options),
     )
 
+
+def get_pagination(options, rows_count, last_id, total_count):
+    limit = get_value_or_default(options, "limit")
+    is_last_page = not rows_count or rows_count < limit
     pagination = {
         "offset": get_value_or_default(options, "offset"),
-        "page_size": get_value_or_default(options, "limit"),
-        "total_count": collection.count_documents({}),
+        "page_size": limit,
+        "total_count": total_count,
+        "cursor": None if is_last_page else encode_cursor(last_id),
     }
-
-    # TODO: Maybe this should be lazy. Assuming pagination is low
-    return list(query), pagination
+    sample_rate = get_sample_rate(options)
+    if sample_rate:
+        # The groups found in the sample, some may be missing from it
+        pagination["sample_rate"] = sample_rate
+    return pagination
+
+
+def query_events(options):
+    target, pipeline = select_pipeline(options)
+    normalized = normalize_options(options)
+    cost = get_cost(options)
+    aggregate_options = guardrails.get_aggregate_options(cost)
+
+    with admission.acquire(cost), guardrails.translate_errors():
+        # The estimated count is a cheap upper bound of the grouped rows
+        if get_value_or_default(options, "count_mode") == ESTIMATED_COUNT:
+            with slow_reports.measure(normalized, target, pipeline):
+                rows = list(target.aggregate(pipeline, **aggregate_options))
+            total_count = target.estimated_document_count()
+        else:
+            pipeline = count_pipeline(pipeline)
+            with slow_reports.measure(normalized, target, pipeline):
+                result, = target.aggregate(pipeline, **aggregate_options)
+            rows = result["rows"]
+            total_count = sum(count["count"]
+                              for count in result["total_count"])
+
+    return get_page(options, rows, total_count)
+
+
+def get_page(options, rows, total_count):
+    last_id = rows[-1]["_id"] if rows else None
+    sample_rate = get_sample_rate(options)
+    for row in rows:
+        del row["_id"]
+        if sample_rate:
+            sampling.scale_row(row, sample_rate)
+
+    pagination = get_pagination(options, len(rows), last_id, total_count)
+    return rows, pagination
+
+
+def stream_event_query(batch_size=REPORT_STREAM_BATCH_SIZE, **kwargs):
+    """
+    Returns an iterator over the report rows, read from the aggregation
+    cursor batch by batch, and a function returning the pagination once the
+    rows are consumed. Streamed reports are not cached, the report slot is
+    held until the rows are closed
+    """
+    options = kwargs.copy()
+    verify_options(options)
+    target, pipeline = select_pipeline(options)
+    cost = get_cost(options)
+    aggregate_options = guardrails.get_aggregate_options(cost)
+    sample_rate = get_sample_rate(options)
+    state = {"rows_count": 0, "last_id": None}
+
+    def iterate_rows():
+        for row in target.aggregate(pipeline, batchSize=batch_size,
+                                    **aggregate_options):
+            state["last_id"] = row.pop("_id")
+            state["rows_count"] += 1
+            yield sampling.scale_row(row, sample_rate) if sample_rate else row
+
+    def get_stream_pagination():
+        if get_value_or_default(options, "count_mode") == ESTIMATED_COUNT:
+            total_count = target.estimated_document_count()
+        else:
+            with guardrails.translate_errors():
+                counts = target.aggregate(count_only_pipeline(pipeline),
+                                          **aggregate_options)
+                total_count = sum(count["count"] for count in counts)
+        return get_pagination(options, total_count=total_count, **state)
+
+    return GuardedRows(iterate_rows(), admission.acquire(cost)), \
+        get_stream_pagination
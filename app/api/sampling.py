@@ -0,0 +1,68 @@
+"""
+Approximate reports over a deterministic sample of the events. Event ids
+are random (version 4, lowercase) uuids, so the events whose id sorts below
+a bound are a uniform sample of sample_rate of them, the same one on every
+run, read through the _id index.
+
+Sums and counts of the sampled groups are scaled back up by 1 / sample_rate
+and every row gets the 95% confidence interval of its mean, sum and count,
+from the variance of a Bernoulli sample.
+"""
+import math
+
+Z = 1.96  # 95% confidence
+ID_PREFIX_DIGITS = 8
+
+# Accumulators the intervals are computed from, added to the $group
+SAMPLE_ACCUMULATORS = {
+    "sum_squares": {"$sum": {"$multiply": ["$value", "$value"]}},
+    "values": {"$sum": {"$cond": [{"$gt": ["$value", None]}, 1, 0]}},
+}
+
+
+def verify_sample_rate(sample_rate):
+    if sample_rate is not None and not 0 < sample_rate <= 1:
+        raise ValueError(f"Invalid sample_rate: {sample_rate}, it must be "
+                         f"above 0 and at most 1")
+
+
+def get_id_bound(sample_rate):
+    return format(int(sample_rate * 16 ** ID_PREFIX_DIGITS),
+                  f"0{ID_PREFIX_DIGITS}x")
+
+
+def get_sample_query(sample_rate):
+    return {"_id": {"$lt": get_id_bound(sample_rate)}}
+
+
+def get_interval(estimate, margin):
+    if margin is None:
+        return [None, None]
+    return [estimate - margin, estimate + margin]
+
+
+def scale_row(row, sample_rate):
+    """
+    Turns a row of the sample into estimates of the whole events, with
+    their confidence intervals
+    """
+    count, total, mean = row["count"], row["sum"], row["mean"]
+    squares = row.pop("sum_squares") or 0.0
+    values = row.pop("values") or 0
+    correction = 1 - sample_rate  # Nothing is left out of a full sample
+
+    mean_margin = None
+    if values > 1:
+        variance = max(0.0, (squares - values * mean ** 2) / (values - 1))
+        mean_margin = Z * math.sqrt(variance * correction / values)
+
+    row["count"] = round(count / sample_rate)
+    row["sum"] = total / sample_rate
+    row["confidence"] = {
+        "mean": get_interval(mean, mean_margin),
+        "sum": get_interval(row["sum"], Z * math.sqrt(
+            squares * correction) / sample_rate),
+        "count": get_interval(row["count"], Z * math.sqrt(
+            count * correction) / sample_rate),
+    }
+    return row
@@ -0,0 +1,219 @@
+"""
+Log of the slow reports. A report aggregation taking more than
+SLOW_REPORT_THRESHOLD_MS is written as one JSON record (normalized options,
+the exact pipeline, its duration and the error it raised, like a maxTimeMS
+timeout) to a rotating log. A sample of them is
+explained with executionStats first, which adds the documents examined and
+the explain output to the record. Both are done in a background thread, so
+neither the request threads nor the event loop of the asyncio mode wait on
+the log file.
+
+Slow reports are also counted by pipeline fingerprint, the pipeline with
+its values left out, for GET /report/slow. Every worker process keeps its
+own counts.
+"""
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import logging
+import logging.handlers
+import random
+import threading
+import time
+
+from bson import json_util
+
+from ..data.partitions import PartitionedCollection
+from ..settings import (SLOW_REPORT_THRESHOLD_MS,
+                        SLOW_REPORT_EXPLAIN_RATE,
+                        SLOW_REPORT_LOG_FILE,
+                        SLOW_REPORT_LOG_MAX_BYTES,
+                        SLOW_REPORT_LOG_BACKUPS,
+                        SLOW_REPORT_MAX_SHAPES)
+
+LOGGER_NAME = "app.slow_reports"
+PLACEHOLDER = "?"
+
+
+def get_shape(value):
+    """
+    The pipeline without its values: stages, operators and field paths are
+    kept, literals become "?"
+    """
+    if isinstance(value, dict):
+        return {key: get_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and any(get_shape(item) != PLACEHOLDER
+                                       for item in value):
+        return [get_shape(item) for item in value]
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return PLACEHOLDER
+
+
+def get_fingerprint(pipeline):
+    shape = json.dumps(get_shape(pipeline))
+    return hashlib.sha1(shape.encode()).hexdigest()[:16]
+
+
+def get_docs_examined(explain):
+    """
+    Sums the totalDocsExamined of the execution stats found in an explain
+    output, one per shard or $cursor stage
+    """
+    if isinstance(explain, dict):
+        return sum(value if key == "totalDocsExamined" and
+                   isinstance(value, int) else get_docs_examined(value)
+                   for key, value in explain.items())
+    if isinstance(explain, list):
+        return sum(get_docs_examined(item) for item in explain)
+    return 0
+
+
+def explain_pipeline(collection, pipeline):
+    if isinstance(collection, PartitionedCollection):
+        collection, pipeline = collection.resolve(pipeline)
+    return collection.database.command({
+        "explain": {"aggregate": collection.name, "pipeline": pipeline,
+                    "cursor": {}},
+        "verbosity": "executionStats",
+    })
+
+
+class SlowReportLog:
+
+    def __init__(self, threshold_ms=SLOW_REPORT_THRESHOLD_MS,
+                 explain_rate=SLOW_REPORT_EXPLAIN_RATE,
+                 path=SLOW_REPORT_LOG_FILE, max_shapes=SLOW_REPORT_MAX_SHAPES):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.path = path
+        self.max_shapes = max_shapes
+        self.lock = threading.Lock()
+        self.shapes = {}
+        self.logger = None
+        # Threads are started on the first submit, after a fork
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def get_logger(self):
+        """
+        The log file is opened on the first slow report, without a path the
+        records go to the "app.slow_reports" logger
+        """
+        with self.lock:
+            if self.logger is None and self.path is None:
+                self.logger = logging.getLogger(LOGGER_NAME)
+            elif self.logger is None:
+                # Outside of the logging hierarchy, one handler per log
+                self.logger = logging.Logger(LOGGER_NAME)
+                self.logger.addHandler(logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=SLOW_REPORT_LOG_MAX_BYTES,
+                    backupCount=SLOW_REPORT_LOG_BACKUPS))
+            return self.logger
+
+    def write(self, record):
+        self.get_logger().warning(json_util.dumps(record))
+
+    def count(self, fingerprint, record):
+        with self.lock:
+            shape = self.shapes.pop(fingerprint, None)
+            if shape is None:
+                if len(self.shapes) >= self.max_shapes:
+                    # The least recently seen shape is the first one
+                    self.shapes.pop(next(iter(self.shapes)))
+                shape = {
+                    "fingerprint": fingerprint,
+                    "collection": record["collection"],
+                    "pipeline": get_shape(record["pipeline"]),
+                    "count": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "docs_examined": None,
+                }
+            shape["count"] += 1
+            shape["errors"] += record["error"] is not None
+            shape["total_ms"] += record["duration_ms"]
+            shape["max_ms"] = max(shape["max_ms"], record["duration_ms"])
+            shape["options"] = record["options"]
+            shape["last_seen"] = record["time"]
+            self.shapes[fingerprint] = shape
+
+    def set_docs_examined(self, fingerprint, docs_examined):
+        with self.lock:
+            shape = self.shapes.get(fingerprint)
+            if shape is not None:
+                shape["docs_examined"] = docs_examined
+
+    def explain_and_write(self, collection, record):
+        try:
+            explain = explain_pipeline(collection, record["pipeline"])
+        except Exception as exc:  # The record is written anyway
+            record["explain_error"] = str(exc)
+        else:
+            record["explain"] = explain
+            record["docs_examined"] = get_docs_examined(explain)
+            self.set_docs_examined(record["fingerprint"],
+                                   record["docs_examined"])
+        self.write(record)
+
+    def record(self, options, collection, pipeline, duration, error=None):
+        """
+        Logs and counts the aggregation when it is slow, returns whether it
+        was. error is the exception it raised, if any
+        """
+        duration_ms = duration * 1000
+        if duration_ms < self.threshold_ms:
+            return False
+
+        record = {
+            "time": time.time(),
+            "fingerprint": get_fingerprint(pipeline),
+            "collection": collection.name,
+            "options": options,
+            "pipeline": pipeline,
+            "duration_ms": round(duration_ms, 3),
+            "docs_examined": None,
+            "error": None if error is None
+            else f"{type(error).__name__}: {error}",
+        }
+        self.count(record["fingerprint"], record)
+        if random.random() < self.explain_rate:
+            self.executor.submit(self.explain_and_write, collection, record)
+        else:
+            self.executor.submit(self.write, record)
+        return True
+
+    @contextlib.contextmanager
+    def measure(self, options, collection, pipeline):
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self.record(options, collection, pipeline,
+                        time.perf_counter() - started, error)
+
+    def top(self, limit=10):
+        """
+        The slowest report shapes first, by their maximum duration
+        """
+        with self.lock:
+            shapes = [dict(shape) for shape in self.shapes.values()]
+        shapes.sort(key=lambda shape: shape["max_ms"], reverse=True)
+        for shape in shapes:
+            shape["mean_ms"] = round(shape.pop("total_ms") / shape["count"], 3)
+        return shapes[:limit]
+
+    def stats(self, limit=10):
+        return {"threshold_ms": self.threshold_ms, "shapes": self.top(limit)}
+
+    def reset(self):
+        with self.lock:
+            self.shapes = {}
+
+
+slow_reports = SlowReportLog()
@@ -0,0 +1,137 @@
+"""
+asyncio variants of the model operations, backed by the motor driver.
+They share the document handling of MongoModel and only await the I/O
+"""
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from . import buckets, rollups
+from .connections import ConnectionRegistry, get_client_options
+from .generations import write_generation
+from .models import DUPLICATE_KEY_ERROR, MongoModel, columnar_store
+from .partitions import AsyncPartitionedCollection, get_events_collection
+from ..settings import (MONGO_COUNTERS_COLLECTION_NAME,
+                        MONGO_ROLLUP_COLLECTION_NAME)
+
+
+def create_motor_client():
+    return AsyncIOMotorClient(**get_client_options())
+
+
+# Created on first use, from within the running event loop
+motor_connections = ConnectionRegistry(create_motor_client)
+
+
+class AsyncMongoModel(MongoModel):
+
+    async def get_object(self):
+        return await self.collection.find_one({self.MONGO_ID_KEY: self.id})
+
+    async def reload(self, obj=None):
+        target_obj = obj or await self.get_object()
+        if target_obj:
+            super().reload(obj=target_obj)
+        return self
+
+    @classmethod
+    async def on_write(cls, changes):
+        """
+        Awaited after every write, see MongoModel.on_write
+        """
+
+    async def update_with(self, upsert=False):
+        document = self.versioned()
+        previous_obj = await self.collection.find_one_and_update(
+            {self.MONGO_ID_KEY: self.id},
+            {"$set": document},
+            upsert=upsert,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_obj is None and not upsert:
+            return self
+
+        current_obj = {**(previous_obj or {}), **document}
+        super().reload(obj=current_obj)
+        await self.on_write([(previous_obj, current_obj)])
+        return self
+
+    async def save_with(self, obj=None):
+        if obj:
+            await self.update_with()
+        else:
+            document = self.versioned()
+            inserted_obj = await self.collection.insert_one(document)
+            self._id = inserted_obj.inserted_id
+            await self.on_write([(None, document)])
+        return self
+
+    async def create(self):
+        self._verify_id()
+        await self.save_with()
+        return self.serialize()
+
+    async def save(self):
+        self._verify_id()
+
+        if self._id:
+            await self.reload()
+        else:
+            await self.update_with(upsert=True)
+        return self.serialize()
+
+    @classmethod
+    async def insert_many(cls, documents, ordered=False):
+        if not documents:
+            return set()
+
+        mongo_docs = [document.versioned() for document in documents]
+        duplicates = set()
+        try:
+            await cls.collection.insert_many(mongo_docs, ordered=ordered)
+        except BulkWriteError as exc:
+            errors = exc.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+
+        await cls.on_write([(None, mongo_doc)
+                            for index, mongo_doc in enumerate(mongo_docs)
+                            if index not in duplicates])
+        return duplicates
+
+    async def remove(self):
+        previous_obj = await self.collection.find_one_and_delete(
+            {self.MONGO_ID_KEY: self.id})
+        if previous_obj:
+            await self.on_write([(previous_obj, None)])
+        self.clear()
+        return self
+
+
+class AsyncEventDocument(AsyncMongoModel):
+    collection = get_events_collection(motor_connections,
+                                       AsyncPartitionedCollection)
+    rollup_collection = motor_connections.collection(
+        MONGO_ROLLUP_COLLECTION_NAME)
+    counters_collection = motor_connections.collection(
+        MONGO_COUNTERS_COLLECTION_NAME)
+    DERIVED_KEYS = buckets.FIELDS
+    derive = staticmethod(buckets.add_buckets)
+
+    @classmethod
+    async def on_write(cls, changes):
+        updates = rollups.get_all_updates(changes)
+        if updates:
+            await cls.rollup_collection.bulk_write(updates, ordered=False)
+        if columnar_store is not None:
+            columnar_store.apply(changes)
+        await cls.bump_write_generation()
+
+    @classmethod
+    async def get_write_generation(cls):
+        return await write_generation.get_async(cls.counters_collection)
+
+    @classmethod
+    async def bump_write_generation(cls):
+        return await write_generation.bump_async(cls.counters_collection)
@@ -0,0 +1,98 @@
+"""
+Time buckets of the events, stored with them when they are written, so the
+reports group by day, hour or week on a small indexed field instead of
+truncating every timestamp at query time:
+
+- day: "2019-01-07", like the day of the rollups
+- hour: "2019-01-07T10:00:00"
+- week: "2019-01-07", the Monday the week starts on
+
+The strings sort in time order. Events written before the buckets existed
+get them with:
+
+    python -m app.data.buckets
+"""
+import datetime as _dt
+
+from pymongo import UpdateOne
+
+from .connections import connections
+from ..settings import BULK_INSERT_CHUNK_SIZE, MONGO_COLLECTION_NAME
+
+DAY_FORMAT = "%Y-%m-%d"
+HOUR_FORMAT = "%Y-%m-%dT%H:00:00"
+
+# Report group_by name -> stored bucket field
+GROUP_FIELDS = {"date": "day", "hour": "hour", "week": "week"}
+FIELDS = list(GROUP_FIELDS.values())
+
+
+def to_datetime(timestamp):
+    """
+    Timestamps are stored as datetimes or ISO 8601 strings, None when it
+    can't be read
+    """
+    if isinstance(timestamp, _dt.datetime):
+        return timestamp
+    if isinstance(timestamp, _dt.date):
+        return _dt.datetime.combine(timestamp, _dt.time())
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        moment = _dt.datetime.strptime(timestamp[:10], DAY_FORMAT)
+        hour = timestamp[11:13]
+        return moment.replace(hour=int(hour)) if hour.isdigit() else moment
+    except ValueError:
+        return None
+
+
+def format_bucket(field, moment):
+    if field == "hour":
+        return moment.strftime(HOUR_FORMAT)
+    if field == "week":
+        moment -= _dt.timedelta(days=moment.weekday())
+    return moment.strftime(DAY_FORMAT)
+
+
+def get_buckets(timestamp):
+    moment = to_datetime(timestamp)
+    return {field: None if moment is None else format_bucket(field, moment)
+            for field in FIELDS}
+
+
+def add_buckets(document):
+    """
+    Sets the buckets of a mongo document, left as they are when the
+    document doesn't carry its timestamp (partial updates)
+    """
+    if "timestamp" in document:
+        document.update(get_buckets(document["timestamp"]))
+    return document
+
+
+def backfill(collection=None, batch_size=BULK_INSERT_CHUNK_SIZE):
+    """
+    Adds the buckets to the events which don't have them, returns how many
+    were updated
+    """
+    collection = collection or connections.collection(MONGO_COLLECTION_NAME)
+    updated = 0
+    updates = []
+    cursor = collection.find({FIELDS[0]: {"$exists": False},
+                              "timestamp": {"$exists": True}},
+                             {"timestamp": 1}, batch_size=batch_size)
+    for document in cursor:
+        updates.append(UpdateOne({"_id": document["_id"]},
+                                 {"$set": get_buckets(
+                                     document.get("timestamp"))}))
+        if len(updates) == batch_size:
+            updated += collection.bulk_write(updates,
+                                             ordered=False).modified_count
+            updates = []
+    if updates:
+        updated += collection.bulk_write(updates, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    print(f"Added the buckets of {backfill()} events")
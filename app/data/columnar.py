@@ -0,0 +1,378 @@
+"""
+In-memory columnar copy of the events collection, to answer reports without
+a round trip to MongoDB. Every field is a NumPy column: int64 client,
+client_group and category, dictionary encoded device_type, bool valid,
+datetime64 timestamp and float64 value, with null and missing masks per
+dimension (MongoDB groups a missing field apart from a null one). The day,
+hour and week buckets are truncated from the timestamps when grouping.
+
+It understands the match queries and group ids query2 builds, groups with a
+sort based np.unique and sums with np.bincount. EventDocument.on_write
+keeps it up to date and it is reloaded from the collection every
+COLUMNAR_RELOAD_INTERVAL seconds, for the writes of the other processes.
+The reloads read the collection into a fresh store in a background thread,
+the reports keep reading the current one until it is swapped in.
+"""
+import datetime as _dt
+import logging
+import threading
+import time
+
+import numpy as np
+
+from . import buckets
+from ..settings import COLUMNAR_RELOAD_INTERVAL
+
+INT_COLUMNS = ["client", "client_group", "category"]
+DIMENSIONS = INT_COLUMNS + ["device_type", "valid", "timestamp"]
+LOAD_BATCH_SIZE = 10000
+INITIAL_CAPACITY = 1024
+# datetime64 unit each bucket is truncated to
+BUCKET_UNITS = {"day": "D", "hour": "h", "week": "D"}
+
+
+def to_datetime64(value):
+    """
+    Timestamps are stored as datetimes or ISO strings, both become
+    datetime64 in UTC, unreadable ones are null
+    """
+    if isinstance(value, _dt.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(_dt.timezone.utc).replace(tzinfo=None)
+        return np.datetime64(value, "us")
+    if isinstance(value, str):
+        try:
+            return np.datetime64(value.rstrip("Z")[:26], "us")
+        except ValueError:
+            pass
+    return np.datetime64("NaT")
+
+
+def truncate(timestamps, field):
+    values = timestamps.astype(f"datetime64[{BUCKET_UNITS[field]}]")
+    if field == "week":
+        # 1970-01-01, day 0, is a Thursday
+        weekdays = (values.astype(np.int64) + 3) % 7
+        values = values - weekdays.astype("timedelta64[D]")
+    return values
+
+
+def to_python(value):
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[us]").tolist()
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ColumnarStore:
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.lock = threading.RLock()
+        self.load_lock = threading.Lock()  # Held while a load runs
+        self.loaded_at = None
+        self.pending = None  # Writes applied while a load runs
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        self.size = 0
+        self.rows = {}  # event id -> row position
+        self.devices = [None]  # device_type code -> value, None is 0
+        self.device_codes = {None: 0}
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ints = {name: np.zeros(capacity, dtype=np.int64)
+                     for name in INT_COLUMNS}
+        self.device_type = np.zeros(capacity, dtype=np.int32)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.timestamp = np.full(capacity, np.datetime64("NaT"),
+                                 dtype="datetime64[us]")
+        self.value = np.full(capacity, np.nan)
+        self.nulls = {name: np.zeros(capacity, dtype=bool)
+                      for name in INT_COLUMNS + ["valid"]}
+        self.missing = {name: np.zeros(capacity, dtype=bool)
+                        for name in DIMENSIONS}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def grow(self, capacity):
+        def resize(array):
+            grown = np.zeros(capacity, dtype=array.dtype)
+            if array.dtype.kind == "M":
+                grown[:] = np.datetime64("NaT")
+            elif array.dtype.kind == "f":
+                grown[:] = np.nan
+            grown[:len(array)] = array
+            return grown
+
+        self.alive = resize(self.alive)
+        self.device_type = resize(self.device_type)
+        self.valid = resize(self.valid)
+        self.timestamp = resize(self.timestamp)
+        self.value = resize(self.value)
+        self.ints = {name: resize(array) for name, array in self.ints.items()}
+        self.nulls = {name: resize(array)
+                      for name, array in self.nulls.items()}
+        self.missing = {name: resize(array)
+                        for name, array in self.missing.items()}
+
+    def get_device_code(self, device_type):
+        code = self.device_codes.get(device_type)
+        if code is None:
+            code = self.device_codes[device_type] = len(self.devices)
+            self.devices.append(device_type)
+        return code
+
+    def extend(self, documents):
+        """
+        Appends the documents, replacing the rows of the ids already stored
+        """
+        documents = list(documents)
+        if not documents:
+            return
+        with self.lock:
+            start, end = self.size, self.size + len(documents)
+            if end > len(self.alive):
+                self.grow(max(end, 2 * len(self.alive)))
+            rows = slice(start, end)
+
+            for name in INT_COLUMNS:
+                values = [document.get(name) for document in documents]
+                self.nulls[name][rows] = [value is None for value in values]
+                self.ints[name][rows] = [value or 0 for value in values]
+            valid = [document.get("valid") for document in documents]
+            self.nulls["valid"][rows] = [value is None for value in valid]
+            self.valid[rows] = [bool(value) for value in valid]
+            self.device_type[rows] = [
+                self.get_device_code(document.get("device_type"))
+                for document in documents]
+            self.timestamp[rows] = [to_datetime64(document.get("timestamp"))
+                                    for document in documents]
+            self.value[rows] = [
+                document["value"]
+                if isinstance(document.get("value"), (int, float))
+                and not isinstance(document.get("value"), bool)
+                else np.nan
+                for document in documents]
+            for name in DIMENSIONS:
+                self.missing[name][rows] = [name not in document
+                                            for document in documents]
+            self.alive[rows] = True
+
+            for position, document in enumerate(documents, start):
+                self.discard(document.get("_id"))
+                self.rows[document.get("_id")] = position
+            self.size = end
+
+    def discard(self, event_id):
+        position = self.rows.pop(event_id, None)
+        if position is not None:
+            self.alive[position] = False
+
+    def apply(self, changes):
+        """
+        Applies the (previous, current) document pairs of a write, like
+        rollups.apply. Idempotent, the rows are replaced by id
+        """
+        with self.lock:
+            if self.pending is not None:
+                # The load may have read the documents before the writes
+                self.pending.append(changes)
+            if self.loaded_at is None:
+                return  # The load will read the writes
+            current = []
+            for previous, document in changes:
+                if document is None:
+                    self.discard(previous.get("_id"))
+                else:
+                    current.append(document)
+            self.extend(current)
+
+    def clear(self):
+        with self.lock:
+            self.allocate(INITIAL_CAPACITY)
+
+    def load(self, collection, batch_size=LOAD_BATCH_SIZE):
+        """
+        Reads the collection into a fresh store, without holding the lock,
+        and swaps it in with the writes applied meanwhile
+        """
+        fresh = ColumnarStore(max(INITIAL_CAPACITY,
+                                  collection.estimated_document_count()))
+        with self.lock:
+            self.pending = []
+        try:
+            batch = []
+            for document in collection.find(batch_size=batch_size):
+                batch.append(document)
+                if len(batch) == batch_size:
+                    fresh.extend(batch)
+                    batch = []
+            fresh.extend(batch)
+            fresh.loaded_at = time.monotonic()
+        except BaseException:
+            with self.lock:
+                self.pending = None
+            raise
+
+        with self.lock:
+            for changes in self.pending:
+                fresh.apply(changes)
+            self.swap(fresh)
+
+    def swap(self, fresh):
+        with self.lock:
+            for name, value in vars(fresh).items():
+                if name not in ("lock", "load_lock"):
+                    setattr(self, name, value)
+
+    def reload(self, collection):
+        try:
+            self.load(collection)
+        except Exception:
+            logging.exception("Columnar store reload failed")
+        finally:
+            self.load_lock.release()
+
+    def ensure_loaded(self, collection, interval=COLUMNAR_RELOAD_INTERVAL):
+        """
+        The first report waits for the store to be loaded, the later ones
+        start a reload in the background once it is older than interval
+        """
+        if self.loaded_at is None:
+            with self.load_lock:
+                if self.loaded_at is None:
+                    self.load(collection)
+        elif time.monotonic() - self.loaded_at > interval and \
+                self.load_lock.acquire(blocking=False):
+            threading.Thread(target=self.reload, args=(collection,),
+                             name="columnar-reload", daemon=True).start()
+
+    def get_column(self, name):
+        """
+        Returns the values and the null mask of a dimension, over all rows
+        """
+        size = self.size
+        if name in self.ints:
+            return self.ints[name][:size], self.nulls[name][:size]
+        if name == "valid":
+            return self.valid[:size], self.nulls["valid"][:size]
+        if name == "device_type":
+            codes = self.device_type[:size]
+            return codes, codes == 0
+        if name == "timestamp":
+            values = self.timestamp[:size]
+            return values, np.isnat(values)
+        if name in BUCKET_UNITS:
+            values = truncate(self.timestamp[:size], name)
+            return values, np.isnat(values)
+        return None, np.ones(size, dtype=bool)  # Unknown fields are null
+
+    def decode(self, name, value):
+        if name == "device_type":
+            return self.devices[value]
+        if name in BUCKET_UNITS:
+            return buckets.format_bucket(name, to_python(value))
+        return to_python(value)
+
+    def encode_values(self, name, values):
+        if name == "device_type":
+            return [self.device_codes[value] for value in values
+                    if value in self.device_codes]
+        if name == "timestamp":
+            return [to_datetime64(value) for value in values]
+        return [value for value in values if value is not None]
+
+    def get_condition_mask(self, name, condition):
+        values, nulls = self.get_column(name)
+        mask = np.ones(self.size, dtype=bool)
+        for operator, argument in condition.items():
+            if operator == "$in":
+                operand = list(argument)
+            elif operator == "$eq":
+                operand = [argument]
+            else:
+                operand = None
+
+            if operand is not None:
+                matches = nulls & (None in operand)
+                if values is not None:
+                    encoded = self.encode_values(name, operand)
+                    matches = matches | (~nulls & np.isin(values, encoded))
+                mask &= matches
+            elif operator in ("$gte", "$lte"):
+                if values is None or name == "device_type":
+                    mask[:] = False
+                    continue
+                bound = self.encode_values(name, [argument])[0]
+                compare = np.greater_equal if operator == "$gte" \
+                    else np.less_equal
+                mask &= ~nulls & compare(values, bound)
+            else:
+                raise ValueError(f"Unsupported operator: {operator}")
+        return mask
+
+    def get_mask(self, match_query):
+        mask = self.alive[:self.size].copy()
+        for name, condition in match_query.items():
+            mask &= self.get_condition_mask(name, condition)
+        return mask
+
+    def get_group_codes(self, name, mask):
+        """
+        Returns the code of every matched row for one group field, 0 when
+        missing, 1 for null and the position in the sorted values plus two
+        otherwise, and a function decoding the codes
+        """
+        values, nulls = self.get_column(name)
+        if values is None:
+            return np.zeros(int(mask.sum()), dtype=np.int64), lambda code: None
+        values, nulls = values[mask], nulls[mask]
+        uniques, inverse = np.unique(values[~nulls], return_inverse=True)
+        codes = np.ones(len(values), dtype=np.int64)
+        codes[~nulls] = inverse.ravel() + 2
+        # The buckets are written with the timestamp
+        missing = self.missing["timestamp" if name in BUCKET_UNITS else name]
+        codes[missing[:self.size][mask]] = 0
+
+        def decode(code):
+            return self.decode(name, uniques[code - 2]) if code > 1 else None
+        return codes, decode
+
+    def group(self, match_query, group_ids):
+        """
+        Runs the equivalent of [{"$match": match_query}, {"$group": {"_id":
+        group_ids, "mean", "sum", "count"}}] and returns the grouped rows
+        """
+        with self.lock:
+            mask = self.get_mask(match_query)
+            fields = [self.get_group_codes(expression.lstrip("$"), mask)
+                      for expression in group_ids.values()]
+            codes = np.stack([field_codes for field_codes, _ in fields] or
+                             [np.zeros(int(mask.sum()), dtype=np.int64)],
+                             axis=1)
+            values = self.value[:self.size][mask]
+
+        group_codes, groups = np.unique(codes, axis=0, return_inverse=True)
+        groups = groups.ravel()
+        has_value = ~np.isnan(values)
+        sums = np.bincount(groups, weights=np.where(has_value, values, 0.0),
+                           minlength=len(group_codes))
+        counts = np.bincount(groups, minlength=len(group_codes))
+        value_counts = np.bincount(groups, weights=has_value,
+                                   minlength=len(group_codes))
+
+        decoders = [decode for _, decode in fields]
+        rows = []
+        for index, row_codes in enumerate(group_codes.tolist()):
+            rows.append({
+                # Missing fields are left out of the group id, like MongoDB
+                "_id": {name: decode(code) for name, decode, code
+                        in zip(group_ids, decoders, row_codes) if code},
+                "mean": float(sums[index] / value_counts[index])
+                if value_counts[index] else None,
+                "sum": float(sums[index]),
+                "count": int(counts[index]),
+            })
+        return rows
+
+
+store = ColumnarStore()
@@ -0,0 +1,44 @@
+"""
+MongoDB command metrics of this process, collected from the pymongo command
+events: latency, documents returned or written and errors per command
+"""
+from pymongo.monitoring import CommandListener
+
+from ..metrics import COMMAND_DURATION, COMMAND_DOCUMENTS, COMMAND_ERRORS
+
+# getMore carries the batches after the first of find and aggregate cursors
+TRACKED_COMMANDS = {"aggregate", "find", "getMore", "insert", "delete",
+                    "update", "findAndModify"}
+
+
+def get_documents_count(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        return len(batch) if batch is not None else 0
+    count = reply.get("n", 0)
+    return count if isinstance(count, int) else 0
+
+
+class CommandMetricsListener(CommandListener):
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name not in TRACKED_COMMANDS:
+            return
+        COMMAND_DURATION.observe(event.duration_micros / 10 ** 6,
+                                 event.command_name)
+        COMMAND_DOCUMENTS.inc(event.command_name,
+                              amount=get_documents_count(event.reply))
+
+    def failed(self, event):
+        if event.command_name not in TRACKED_COMMANDS:
+            return
+        COMMAND_DURATION.observe(event.duration_micros / 10 ** 6,
+                                 event.command_name)
+        COMMAND_ERRORS.inc(event.command_name)
+
+
+command_metrics = CommandMetricsListener()
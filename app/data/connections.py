@@ -0,0 +1,118 @@
+"""
+Lazy registry of the MongoDB client of this process. Importing the models or
+the queries doesn't build a client, it's created on the first use of a
+collection, after a fork in a pre-fork server. Tests and scripts point the
+whole process to another client or database with configure():
+
+    connections.configure(database_name="test")
+"""
+import os
+import threading
+
+from pymongo import MongoClient
+
+from .commands import command_metrics
+from .pool import pool_stats
+from ..settings import (MONGO_HOST,
+                        MONGO_PORT,
+                        MONGO_DB_NAME,
+                        MONGO_MAX_POOL_SIZE,
+                        MONGO_MIN_POOL_SIZE,
+                        MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                        MONGO_SERVER_SELECTION_TIMEOUT_MS)
+
+
+def get_client_options():
+    return {
+        "host": MONGO_HOST,
+        "port": MONGO_PORT,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [pool_stats, command_metrics],
+    }
+
+
+def create_client():
+    return MongoClient(**get_client_options())
+
+
+class LazyCollection:
+    """
+    Stands for a collection of a registry and resolves it on every use, so
+    it follows the registry when it is configured again
+    """
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def resolve(self):
+        return self.registry.get_collection(self.name)
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class ConnectionRegistry:
+
+    def __init__(self, factory=create_client, database_name=MONGO_DB_NAME):
+        self.lock = threading.Lock()
+        self.factory = factory
+        self.database_name = database_name
+        self._client = None
+        self._owns_client = False
+        if hasattr(os, "register_at_fork"):
+            # The child must not reuse the sockets of the parent
+            os.register_at_fork(after_in_child=self.forget)
+
+    @property
+    def is_connected(self):
+        return self._client is not None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self.lock:
+                if self._client is None:
+                    self._client = self.factory()
+                    self._owns_client = True
+        return self._client
+
+    @property
+    def database(self):
+        return self.client[self.database_name]
+
+    def get_collection(self, name):
+        return self.database[name]
+
+    def collection(self, name):
+        return LazyCollection(self, name)
+
+    def configure(self, client=None, database_name=None):
+        """
+        Replaces the client (a new one is created on next use if None) and
+        optionally the database the collections resolve to
+        """
+        with self.lock:
+            self.close_client()
+            self._client = client
+            if database_name is not None:
+                self.database_name = database_name
+
+    def close_client(self):
+        if self._client is not None and self._owns_client:
+            self._client.close()
+        self._client = None
+        self._owns_client = False
+
+    def forget(self):
+        self._client = None
+        self._owns_client = False
+
+
+connections = ConnectionRegistry()
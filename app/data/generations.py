@@ -0,0 +1,72 @@
+"""
+Write generation of the events: a number every write changes, the report
+cache and the report ETags are keyed by it, so nothing computed before a
+write is served after it.
+
+With WRITE_GENERATION_SHARED it is a counter document of the counters
+collection, bumped by the writes of every worker process and read once per
+report. Otherwise every process counts its own writes and only sees the
+others' once the cache entries expire.
+"""
+import threading
+
+from pymongo import ReturnDocument
+
+from .connections import connections
+from ..settings import MONGO_COUNTERS_COLLECTION_NAME, WRITE_GENERATION_SHARED
+
+COUNTER_FILTER = {"_id": "events"}
+COUNTER_UPDATE = {"$inc": {"generation": 1}}
+
+
+def get_value(document):
+    return document["generation"] if document else 0
+
+
+class WriteGeneration:
+
+    def __init__(self, collection, shared=WRITE_GENERATION_SHARED):
+        self.collection = collection
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.value = 0  # The last one seen by this process
+
+    def seen(self, value):
+        self.value = value
+        return value
+
+    def bump_local(self):
+        with self.lock:
+            self.value += 1
+            return self.value
+
+    def bump(self):
+        if not self.shared:
+            return self.bump_local()
+        return self.seen(get_value(self.collection.find_one_and_update(
+            COUNTER_FILTER, COUNTER_UPDATE, upsert=True,
+            return_document=ReturnDocument.AFTER)))
+
+    def get(self):
+        if not self.shared:
+            return self.value
+        return self.seen(get_value(self.collection.find_one(COUNTER_FILTER)))
+
+    async def bump_async(self, collection):
+        """
+        bump() through collection, a collection of motor
+        """
+        if not self.shared:
+            return self.bump_local()
+        return self.seen(get_value(await collection.find_one_and_update(
+            COUNTER_FILTER, COUNTER_UPDATE, upsert=True,
+            return_document=ReturnDocument.AFTER)))
+
+    async def get_async(self, collection):
+        if not self.shared:
+            return self.value
+        return self.seen(get_value(await collection.find_one(COUNTER_FILTER)))
+
+
+write_generation = WriteGeneration(
+    connections.collection(MONGO_COUNTERS_COLLECTION_NAME))
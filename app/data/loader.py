@@ -0,0 +1,95 @@
+"""
+Loads generated events into the events collection, batch after batch, and
+rebuilds the rollups at the end:
+
+    python -m app.data.loader DAYS EVENTS_PER_DAY [--seed 1] [--batch-size N]
+    python -m app.data.loader 365 140000 --dry-run   # only generate
+
+Prints the generation and loading speed in rows per second.
+"""
+import argparse
+import time
+
+from pymongo.errors import BulkWriteError
+
+from . import buckets, rollups
+from .generator import EventGenerator, batch_length, to_documents
+from .partitions import get_events_collection
+from ..settings import BULK_INSERT_CHUNK_SIZE
+
+
+class Timer:
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.rows = 0
+
+    def add(self, started, rows):
+        self.seconds += time.perf_counter() - started
+        self.rows += rows
+
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def insert_documents(collection, documents):
+    """
+    Returns the number of inserted documents, duplicates are skipped
+    """
+    try:
+        return len(collection.insert_many(documents,
+                                          ordered=False).inserted_ids)
+    except BulkWriteError as exc:
+        return exc.details["nInserted"]
+
+
+def load(days, events_per_day, seed=None, batch_size=BULK_INSERT_CHUNK_SIZE,
+         dry_run=False, rebuild_rollups=True):
+    collection = get_events_collection()
+    generator = EventGenerator(seed)
+    generation, loading = Timer(), Timer()
+
+    batches = generator.get_batches(days, events_per_day, batch_size)
+    while True:
+        started = time.perf_counter()
+        batch = next(batches, None)
+        if batch is None:
+            break
+        documents = [buckets.add_buckets(document)
+                     for document in to_documents(batch, id_key="_id")]
+        generation.add(started, batch_length(batch))
+
+        if not dry_run:
+            started = time.perf_counter()
+            loading.add(started, insert_documents(collection, documents))
+
+    if not dry_run and rebuild_rollups:
+        rollups.rebuild()
+    return generation, loading
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.data.loader")
+    parser.add_argument("days", type=int)
+    parser.add_argument("events_per_day", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-size", type=int,
+                        default=BULK_INSERT_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="generate the events without inserting them")
+    parser.add_argument("--skip-rollups", action="store_true",
+                        help="don't rebuild the rollups after loading")
+    args = parser.parse_args(argv)
+
+    generation, loading = load(args.days, args.events_per_day, args.seed,
+                               args.batch_size, args.dry_run,
+                               not args.skip_rollups)
+    print(f"generated {generation.rows} events "
+          f"({generation.rate():,.0f} rows/sec)")
+    if not args.dry_run:
+        print(f"inserted {loading.rows} events "
+              f"({loading.rate():,.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
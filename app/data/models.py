@@ -1,4 +1,18 @@
-from ..settings import MONGO_CLIENT, MONGO_DB_NAME, MONGO_COLLECTION_NAME
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from . import buckets, rollups
+from .generations import write_generation
+from .partitions import get_events_collection
+from ..settings import REPORT_BACKEND
+
+if REPORT_BACKEND == "columnar":
+    from .columnar import store as columnar_store
+else:
+    columnar_store = None
+
+DUPLICATE_KEY_ERROR = 11000
 
 
 class MongoModel(dict):
@@ -8,6 +22,10 @@ class MongoModel(dict):
     """
     ID_KEY = "id"
     MONGO_ID_KEY = "_id"
+    # Fields computed from the document on every write, never serialized
+    DERIVED_KEYS = []
+    # Set to a new ObjectId by every write, names the stored version
+    VERSION_KEY = "_version"
 
     __getattr__ = dict.get
     __setattr__ = dict.__setitem__
@@ -26,21 +44,37 @@ class MongoModel(dict):
     def pop_keys(self, keys):
         target_dict = self.copy()
         for key in keys:
-            if key in target_dict:
-                target_dict.pop(key)
+            target_dict.pop(key, None)
         return target_dict
 
+    @staticmethod
+    def derive(document):
+        """
+        Adds the DERIVED_KEYS to a mongo document before it is written
+        """
+        return document
+
     def mongo(self):
         new_dict = self.pop_keys([self.ID_KEY])
         new_dict[self.MONGO_ID_KEY] = self.id
-        return new_dict
+        return self.derive(new_dict)
+
+    def versioned(self):
+        """
+        The mongo document to write, with a new version
+        """
+        document = self.mongo()
+        document[self.VERSION_KEY] = ObjectId()
+        return document
 
     def pure(self):
-        new_dict = self.pop_keys([self.ID_KEY, self.MONGO_ID_KEY])
+        new_dict = self.pop_keys([self.ID_KEY, self.MONGO_ID_KEY,
+                                  self.VERSION_KEY] + self.DERIVED_KEYS)
         return new_dict
 
     def serialize(self):
-        new_dict = self.pop_keys([self.MONGO_ID_KEY])
+        new_dict = self.pop_keys([self.MONGO_ID_KEY, self.VERSION_KEY] +
+                                 self.DERIVED_KEYS)
         return new_dict
 
     def get_object(self):
@@ -54,39 +88,128 @@ class MongoModel(dict):
                 self._id = target_obj[self.MONGO_ID_KEY]
         return self
 
+    @classmethod
+    def on_write(cls, changes):
+        """
+        Called after every write with (previous, current) pairs of mongo
+        documents. Either of them is None for inserts and deletes
+        """
+
+    def update_with(self, upsert=False):
+        """
+        Merges into the stored document with a single command. The previous
+        version is returned by the server, so the merged document is rebuilt
+        here instead of being read again
+        """
+        document = self.versioned()
+        previous_obj = self.collection.find_one_and_update(
+            {self.MONGO_ID_KEY: self.id},
+            {"$set": document},
+            upsert=upsert,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_obj is None and not upsert:
+            return self
+
+        current_obj = {**(previous_obj or {}), **document}
+        self.reload(obj=current_obj)
+        self.on_write([(previous_obj, current_obj)])
+        return self
+
     def save_with(self, obj=None):
         if obj:
-            self.collection.update_one({self.MONGO_ID_KEY: self.id},
-                                       {"$set": self.mongo()})
-            self.reload()
+            self.update_with()
         else:
-            inserted_obj = self.collection.insert_one(self.mongo())
+            document = self.versioned()
+            inserted_obj = self.collection.insert_one(document)
             self._id = inserted_obj.inserted_id
+            self.on_write([(None, document)])
         return self
 
+    def create(self):
+        """
+        Inserts the document with a single command.
+        Raises DuplicateKeyError if the id already exists
+        """
+        self._verify_id()
+        self.save_with()
+        return self.serialize()
+
     def save(self):
+        """
+        Creates or updates the stored document with a single upsert
+        """
         self._verify_id()
-        obj = self.get_object()
 
         if self._id:
-            self.reload(obj=obj)
+            self.reload()
         else:
-            self.save_with(obj)
+            self.update_with(upsert=True)
         return self.serialize()
 
+    @classmethod
+    def insert_many(cls, documents, ordered=False):
+        """
+        Inserts the given models with a single command and returns
+        the positions of the ones rejected because their id exists
+        """
+        if not documents:
+            return set()
+
+        mongo_docs = [document.versioned() for document in documents]
+        duplicates = set()
+        try:
+            cls.collection.insert_many(mongo_docs, ordered=ordered)
+        except BulkWriteError as exc:
+            errors = exc.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+
+        cls.on_write([(None, mongo_doc)
+                      for index, mongo_doc in enumerate(mongo_docs)
+                      if index not in duplicates])
+        return duplicates
+
     def remove(self):
-        self.save()  # TODO: This is an overload. Refactor this.
-        self.collection.delete_one({"_id": self._id})
+        previous_obj = self.collection.find_one_and_delete(
+            {self.MONGO_ID_KEY: self.id})
+        if previous_obj:
+            self.on_write([(previous_obj, None)])
         self.clear()
         return self
 
 
 class EventDocument(MongoModel):
-    collection = MONGO_CLIENT[MONGO_DB_NAME][MONGO_COLLECTION_NAME]
+    collection = get_events_collection()
+    DERIVED_KEYS = buckets.FIELDS
+    derive = staticmethod(buckets.add_buckets)
+
+    # Changes on every write, results computed from the collection are
+    # valid as long as it stays the same, see app/data/generations.py
+    @staticmethod
+    def get_write_generation():
+        return write_generation.get()
+
+    @staticmethod
+    def bump_write_generation():
+        return write_generation.bump()
+
+    @classmethod
+    def on_write(cls, changes):
+        rollups.apply(changes)
+        if columnar_store is not None:
+            columnar_store.apply(changes)
+        cls.bump_write_generation()
 
     @staticmethod
     def remove_all():
-        return EventDocument.collection.delete_many({})
+        rollups.collection.delete_many({})
+        result = EventDocument.collection.delete_many({})
+        if columnar_store is not None:
+            columnar_store.clear()
+        EventDocument.bump_write_generation()
+        return result
 
     @staticmethod
     def count_all():
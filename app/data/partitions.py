@@ -0,0 +1,887 @@
+"""
+Optional time partitioning of the events. With EVENT_PARTITIONS set to
+"month" or "week" every event is stored in the collection of the period its
+timestamp falls in, named after the first day of the period:
+
+    events_20190101, events_20190201, ...  # month
+    events_20181231, events_20190107, ...  # week, starting on Monday
+
+The events collection itself keeps the events without a readable timestamp
+and the ones written before the partitioning was enabled, "--split" moves
+the latter to their partitions. PartitionedCollection stands for all of
+them with the collection methods the models and the reports use:
+
+- writes are routed by timestamp, and a new partition gets the indexes of
+  the events collection on its first write
+- the id index, the events_ids collection, holds the partition of every
+  event id, so an id is unique across the partitions: an insert takes its id
+  in the id index first and gets a DuplicateKeyError when it is there
+- an event whose timestamp changes moves to its new partition: the id index
+  is pointed at it, the event is copied there, then deleted from the old
+  one. A failure before the copy is completed by the next save of the event,
+  one after it leaves a stale copy in the old partition but never loses it
+- reads by id look into the partition the filter's timestamp falls in, or
+  the one the id was last seen in by this process, then into the others,
+  newest first
+- aggregations only read the partitions overlapping the timestamp range of
+  their leading $match, merged with $unionWith (MongoDB 4.4+)
+
+The collection names are cached for EVENT_PARTITION_NAMES_TTL seconds, the
+partitions this process creates are added to them and a read by id which
+finds nothing lists them again, for the partitions of the other processes.
+Old partitions are dropped whole, see app/data/retention.py. To list the
+partitions, "--index-ids" adds the events written before the id index to it:
+
+    python -m app.data.partitions [--split] [--index-ids]
+"""
+import argparse
+import datetime as _dt
+import itertools
+import re
+import time
+
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from pymongo.results import DeleteResult, InsertManyResult
+
+from . import buckets
+from .connections import connections
+from ..settings import (BULK_INSERT_CHUNK_SIZE,
+                        EVENT_PARTITION_NAMES_TTL,
+                        EVENT_PARTITIONS,
+                        MONGO_COLLECTION_NAME)
+
+MONTH = "month"
+WEEK = "week"
+NAME_DATE_FORMAT = "%Y%m%d"
+# Stages run on every partition before their documents are merged
+BRANCH_STAGES = {"$match", "$project", "$addFields"}
+# Ids whose partition is remembered, the least recently seen are forgotten
+LOCATION_CACHE_SIZE = 10000
+IDS_SUFFIX = "_ids"
+DUPLICATE_KEY_ERROR = 11000
+
+
+def get_period_start(moment, scheme):
+    day = _dt.datetime(moment.year, moment.month, moment.day)
+    if scheme == MONTH:
+        return day.replace(day=1)
+    return day - _dt.timedelta(days=day.weekday())
+
+
+def get_period_end(start, scheme):
+    if scheme == MONTH:
+        return (start + _dt.timedelta(days=32)).replace(day=1)
+    return start + _dt.timedelta(days=7)
+
+
+def get_bound(condition, operators):
+    for operator in operators:
+        if operator in condition:
+            return buckets.to_datetime(condition[operator])
+    return None
+
+
+def get_time_range(match_query):
+    """
+    Start and end of the timestamp range of a match query, None when it is
+    open on that side
+    """
+    condition = match_query.get("timestamp")
+    if not isinstance(condition, dict):
+        return None, None
+    return (get_bound(condition, ("$gte", "$gt")),
+            get_bound(condition, ("$lte", "$lt")))
+
+
+def iterate_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_event_id(document):
+    """
+    The id of a document or an equality filter, None for an operator
+    """
+    event_id = document.get("_id")
+    if isinstance(event_id, (dict, list)):
+        return None
+    return event_id
+
+
+def get_written(positions, errors, ordered):
+    """
+    The positions an insert_many of the documents at positions wrote, from
+    its write errors
+    """
+    failed = {error["index"] for error in errors}
+    if ordered and failed:
+        return positions[:min(failed)]
+    return [position for index, position in enumerate(positions)
+            if index not in failed]
+
+
+def get_unwritten(claimed, written, errors):
+    """
+    The positions whose id was taken in the id index but whose event wasn't
+    written, except the duplicates already in their partition
+    """
+    duplicates = {error["index"] for error in errors
+                  if error.get("code") == DUPLICATE_KEY_ERROR}
+    return [position for position in claimed
+            if position not in written and position not in duplicates]
+
+
+def get_leading_match(pipeline):
+    if pipeline and "$match" in pipeline[0]:
+        return pipeline[0]["$match"]
+    return {}
+
+
+class BasePartitionedCollection:
+    """
+    Naming, routing and pipeline merging of the partitions, shared by the
+    collections of pymongo and of motor
+    """
+
+    def __init__(self, registry, name, scheme):
+        if scheme not in (MONTH, WEEK):
+            raise ValueError(f"Unsupported partitioning: {scheme}")
+        self.registry = registry
+        self.name = name
+        self.scheme = scheme
+        self.pattern = re.compile(rf"^{re.escape(name)}_(\d{{8}})$")
+        self.ids_name = f"{name}{IDS_SUFFIX}"
+        self.indexed = set()  # Partitions given their indexes by this process
+        self.names = None  # Cached collection names
+        self.names_at = None
+        self.locations = {}  # Event id -> partition name
+
+    def get_cached_names(self):
+        if self.names is None or \
+                time.monotonic() - self.names_at > EVENT_PARTITION_NAMES_TTL:
+            return None
+        return self.names
+
+    def set_names(self, names):
+        self.names = set(names)
+        self.names_at = time.monotonic()
+        return self.names
+
+    def add_name(self, name):
+        if self.names is not None:
+            self.names.add(name)
+
+    def forget(self, name):
+        """
+        Forgets a partition once it was dropped
+        """
+        if self.names is not None:
+            self.names.discard(name)
+        self.indexed.discard(name)
+        self.locations = {event_id: location for event_id, location
+                          in self.locations.items() if location != name}
+
+    def clear_names(self):
+        self.names = None
+        self.locations.clear()
+        self.indexed.clear()
+
+    def remember(self, document, name):
+        event_id = get_event_id(document)
+        if event_id is None:
+            return
+        self.locations.pop(event_id, None)
+        self.locations[event_id] = name
+        if len(self.locations) > LOCATION_CACHE_SIZE:
+            del self.locations[next(iter(self.locations))]
+
+    def get_hint(self, filter):
+        """
+        The partition a filter points at: the one of its timestamp, else the
+        one its id was last seen in
+        """
+        filter = filter or {}
+        timestamp = filter.get("timestamp")
+        if timestamp is not None and not isinstance(timestamp, dict):
+            return self.get_partition_name(timestamp)
+        return self.locations.get(get_event_id(filter))
+
+    def order_names(self, names, filter):
+        hint = self.get_hint(filter)
+        if hint not in names:
+            return names
+        return [hint] + [name for name in names if name != hint]
+
+    @property
+    def database(self):
+        return self.registry.database
+
+    def get_collection(self, name):
+        return self.registry.get_collection(name)
+
+    def get_partition_name(self, timestamp):
+        moment = buckets.to_datetime(timestamp)
+        if moment is None:
+            return self.name
+        start = get_period_start(moment, self.scheme)
+        return f"{self.name}_{start.strftime(NAME_DATE_FORMAT)}"
+
+    def get_period(self, name):
+        """
+        Start and end of the period of a partition, None for the events
+        collection
+        """
+        match = self.pattern.match(name)
+        if match is None:
+            return None
+        start = _dt.datetime.strptime(match.group(1), NAME_DATE_FORMAT)
+        return start, get_period_end(start, self.scheme)
+
+    def select_names(self, collection_names, query=None):
+        """
+        The partitions among the collection names overlapping the timestamp
+        range of query, newest first, and the events collection last
+        """
+        start, end = get_time_range(query or {})
+        names = []
+        for name in sorted(collection_names, reverse=True):
+            period = self.get_period(name)
+            if period is None:
+                continue
+            if (start is None or period[1] > start) and \
+                    (end is None or period[0] <= end):
+                names.append(name)
+        return names + [self.name]
+
+    def get_union_pipeline(self, names, pipeline):
+        """
+        Returns the partition to run pipeline on and the pipeline merging the
+        others into it. The leading $match and $project stages run on every
+        partition, so each of them uses its own indexes
+        """
+        branch = list(itertools.takewhile(
+            lambda stage: next(iter(stage)) in BRANCH_STAGES, pipeline))
+        unions = [{"$unionWith": {"coll": name, "pipeline": branch}}
+                  for name in names[1:]]
+        return names[0], branch + unions + pipeline[len(branch):]
+
+    def get_positions(self, documents, selected=None):
+        """
+        Positions of the documents per partition name, only the selected
+        ones when given
+        """
+        positions = {}
+        for position, document in enumerate(documents):
+            if selected is not None and position not in selected:
+                continue
+            name = self.get_partition_name(document.get("timestamp"))
+            positions.setdefault(name, []).append(position)
+        return positions
+
+    def needs_indexes(self, name):
+        return name != self.name and name not in self.indexed
+
+    def get_id_entries(self, documents):
+        """
+        The id index entries of the documents, the ones without an id are
+        given one like pymongo would
+        """
+        entries = []
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            entries.append({"_id": document["_id"],
+                            "partition": self.get_partition_name(
+                                document.get("timestamp"))})
+        return entries
+
+    def get_source_name(self, entry, target):
+        """
+        The partition an id index entry points at, None when it is target
+        """
+        if entry is None or entry["partition"] == target:
+            return None
+        return entry["partition"]
+
+
+def get_index_options(index):
+    return [(key, direction) for key, direction in index["key"].items()], {
+        "name": index["name"]}
+
+
+def merge_write_errors(errors, positions, exc):
+    """
+    Adds the write errors of a partition, with their positions in the
+    documents of the whole insert
+    """
+    errors.extend({**error, "index": positions[error["index"]]}
+                  for error in exc.details["writeErrors"])
+
+
+def raise_write_errors(errors, inserted):
+    if errors:
+        raise BulkWriteError({
+            "writeErrors": sorted(errors, key=lambda error: error["index"]),
+            "writeConcernErrors": [],
+            "nInserted": inserted,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        })
+
+
+class PartitionedCollection(BasePartitionedCollection):
+
+    def get_names(self, query=None, refresh=False):
+        names = None if refresh else self.get_cached_names()
+        if names is None:
+            names = self.set_names(self.database.list_collection_names())
+        return self.select_names(names, query)
+
+    def partitions(self, query=None):
+        return [self.get_collection(name) for name in self.get_names(query)]
+
+    def search(self, filter, operation, skip=()):
+        """
+        Runs operation on the partitions filter may match, the one it points
+        at first, until one returns a document. When none does, the names are
+        listed again and the new partitions searched
+        """
+        listed = self.get_cached_names() is None
+        searched = set(skip)
+        for refresh in (False, True):
+            if refresh and listed:
+                break
+            for name in self.order_names(self.get_names(filter, refresh),
+                                         filter):
+                if name in searched:
+                    continue
+                searched.add(name)
+                document = operation(self.get_collection(name))
+                if document is not None:
+                    self.remember(document, name)
+                    return document
+        return None
+
+    def get_partition(self, name):
+        partition = self.get_collection(name)
+        if self.needs_indexes(name):
+            for index in self.get_collection(self.name).list_indexes():
+                if index["name"] != "_id_":
+                    keys, options = get_index_options(index)
+                    partition.create_index(keys, **options)
+            self.indexed.add(name)
+        self.add_name(name)
+        return partition
+
+    def route(self, document):
+        return self.get_partition(
+            self.get_partition_name(document.get("timestamp")))
+
+    def get_ids(self):
+        """
+        The id index, the partition of every event id
+        """
+        ids = self.get_collection(self.ids_name)
+        if self.ids_name not in self.indexed:
+            ids.create_index("partition")
+            self.indexed.add(self.ids_name)
+        return ids
+
+    def claim_ids(self, documents, errors, ordered=False):
+        """
+        Takes the ids of the documents in the id index, returns the positions
+        of the ones taken and adds the write errors of the others to errors
+        """
+        positions = list(range(len(documents)))
+        try:
+            self.get_ids().insert_many(self.get_id_entries(documents),
+                                       ordered=ordered)
+        except BulkWriteError as exc:
+            errors.extend(exc.details["writeErrors"])
+            return get_written(positions, exc.details["writeErrors"], ordered)
+        return positions
+
+    def release_ids(self, event_ids):
+        if event_ids:
+            self.get_ids().delete_many({"_id": {"$in": list(event_ids)}})
+
+    def resolve(self, pipeline):
+        """
+        Returns the partition and the pipeline to run for pipeline
+        """
+        name, pipeline = self.get_union_pipeline(
+            self.get_names(get_leading_match(pipeline)), pipeline)
+        return self.get_collection(name), pipeline
+
+    def aggregate(self, pipeline, **kwargs):
+        partition, pipeline = self.resolve(pipeline)
+        return partition.aggregate(pipeline, **kwargs)
+
+    def create_index(self, keys, **kwargs):
+        for partition in self.partitions():
+            name = partition.create_index(keys, **kwargs)
+        return name
+
+    def insert_one(self, document, **kwargs):
+        """
+        Raises DuplicateKeyError when the id is in any partition
+        """
+        partition = self.route(document)
+        entry, = self.get_id_entries([document])
+        self.get_ids().insert_one(entry)
+        try:
+            result = partition.insert_one(document, **kwargs)
+        except PyMongoError as exc:
+            # A duplicate was written before the id index, its entry is right
+            if not isinstance(exc, DuplicateKeyError):
+                self.release_ids([entry["_id"]])
+            raise
+        self.remember(document, partition.name)
+        return result
+
+    def insert_many(self, documents, ordered=False):
+        """
+        Inserts the documents whose id the id index takes, the others get a
+        duplicate key write error
+        """
+        documents = list(documents)
+        if not documents:
+            return InsertManyResult([], True)
+        errors = []
+        claimed = self.claim_ids(documents, errors, ordered)
+        written = set()
+        try:
+            for name, positions in self.get_positions(
+                    documents, set(claimed)).items():
+                try:
+                    self.get_partition(name).insert_many(
+                        [documents[position] for position in positions],
+                        ordered=ordered)
+                    written.update(positions)
+                except BulkWriteError as exc:
+                    merge_write_errors(errors, positions, exc)
+                    written.update(get_written(
+                        positions, exc.details["writeErrors"], ordered))
+                    if ordered:
+                        break
+                finally:
+                    for position in positions:
+                        self.remember(documents[position], name)
+        finally:
+            self.release_ids(documents[position]["_id"] for position in
+                             get_unwritten(claimed, written, errors))
+        raise_write_errors(errors, len(written))
+        return InsertManyResult([document["_id"] for document in documents],
+                                True)
+
+    def find(self, filter=None, *args, **kwargs):
+        return itertools.chain.from_iterable(
+            partition.find(filter, *args, **kwargs)
+            for partition in self.partitions(filter))
+
+    def find_one(self, filter=None, *args, **kwargs):
+        return self.search(filter, lambda partition: partition.find_one(
+            filter, *args, **kwargs))
+
+    def upsert(self, filter, update, target, **kwargs):
+        self.get_ids().update_one({"_id": get_event_id(filter)},
+                                  {"$set": {"partition": target.name}},
+                                  upsert=True)
+        previous = target.find_one_and_update(filter, update, upsert=True,
+                                              **kwargs)
+        self.add_name(target.name)
+        self.remember(filter, target.name)
+        return previous
+
+    def find_one_and_update(self, filter, update, upsert=False, **kwargs):
+        """
+        Updates the event in the partition of its new timestamp, moving it
+        there from the one of its previous timestamp. Returns the document
+        before the update and supports only $set updates by id, like the
+        models
+        """
+        fields = update.get("$set", {})
+        if "timestamp" not in fields:
+            previous = self.search(
+                filter, lambda partition: partition.find_one_and_update(
+                    filter, update, **kwargs))
+            if previous is not None or not upsert:
+                return previous
+            return self.upsert(filter, update, self.route(fields), **kwargs)
+
+        target = self.route(fields)
+        previous = target.find_one_and_update(filter, update, **kwargs)
+        if previous is not None:
+            self.remember(filter, target.name)
+            return previous
+
+        ids = self.get_ids()
+        event_id = get_event_id(filter)
+        source_name = self.get_source_name(ids.find_one({"_id": event_id}),
+                                           target.name)
+        previous = None
+        if source_name is not None:
+            previous = self.get_collection(source_name).find_one(filter)
+        if previous is None:
+            # Not in the id index yet, or a move which failed half way
+            previous = self.search(
+                filter, lambda partition: partition.find_one(filter),
+                skip=[target.name])
+            source_name = self.locations.get(event_id)
+        if previous is None:
+            return self.upsert(filter, update, target, **kwargs) \
+                if upsert else None
+
+        ids.update_one({"_id": event_id}, {"$set": {"partition": target.name}},
+                       upsert=True)
+        target.replace_one(filter, {**previous, **fields}, upsert=True)
+        self.add_name(target.name)  # Listed before the copy created it
+        self.get_collection(source_name).delete_one(filter)
+        self.remember(filter, target.name)
+        return previous
+
+    def find_one_and_delete(self, filter, **kwargs):
+        document = self.search(
+            filter, lambda partition: partition.find_one_and_delete(
+                filter, **kwargs))
+        if document is not None:
+            self.locations.pop(get_event_id(document), None)
+            self.release_ids([get_event_id(document)])
+        return document
+
+    def delete_many(self, filter, **kwargs):
+        deleted = 0
+        for partition in self.partitions(filter):
+            if filter:
+                self.release_ids(partition.distinct("_id", filter))
+            deleted += partition.delete_many(filter, **kwargs).deleted_count
+        if not filter:
+            self.get_ids().delete_many({})
+        return DeleteResult({"n": deleted, "ok": 1.0}, True)
+
+    def count_documents(self, filter, **kwargs):
+        return sum(partition.count_documents(filter, **kwargs)
+                   for partition in self.partitions(filter))
+
+    def estimated_document_count(self, **kwargs):
+        return sum(partition.estimated_document_count(**kwargs)
+                   for partition in self.partitions())
+
+    def distinct(self, key, filter=None, **kwargs):
+        values = []
+        for partition in self.partitions(filter):
+            for value in partition.distinct(key, filter, **kwargs):
+                if value not in values:
+                    values.append(value)
+        return values
+
+    def drop(self):
+        for partition in self.partitions():
+            partition.drop()
+        self.get_collection(self.ids_name).drop()
+        self.clear_names()
+
+    def split(self, batch_size=BULK_INSERT_CHUNK_SIZE):
+        """
+        Moves the events of the events collection with a readable timestamp
+        to their partitions, returns how many were moved. Safe to run again
+        after an interruption
+        """
+        source = self.get_collection(self.name)
+        moved = 0
+        for batch in iterate_batches(source.find({"timestamp": {"$ne": None}},
+                                                 batch_size=batch_size),
+                                     batch_size):
+            documents = [buckets.add_buckets(document) for document in batch]
+            positions = self.get_positions(documents)
+            positions.pop(self.name, None)
+            for name, partition_positions in positions.items():
+                self.get_partition(name).bulk_write([
+                    ReplaceOne({"_id": documents[position]["_id"]},
+                               documents[position], upsert=True)
+                    for position in partition_positions], ordered=False)
+                ids = [documents[position]["_id"]
+                       for position in partition_positions]
+                self.get_ids().bulk_write([
+                    UpdateOne({"_id": event_id},
+                              {"$set": {"partition": name}}, upsert=True)
+                    for event_id in ids], ordered=False)
+                moved += source.delete_many(
+                    {"_id": {"$in": ids}}).deleted_count
+        return moved
+
+    def index_ids(self, batch_size=BULK_INSERT_CHUNK_SIZE):
+        """
+        Adds the events missing from the id index to it, returns how many
+        were added. An id already in the index keeps its partition
+        """
+        added = 0
+        for partition in self.partitions():
+            for batch in iterate_batches(
+                    partition.find({}, {"_id": 1}, batch_size=batch_size),
+                    batch_size):
+                result = self.get_ids().bulk_write([
+                    UpdateOne({"_id": document["_id"]},
+                              {"$setOnInsert": {"partition": partition.name}},
+                              upsert=True)
+                    for document in batch], ordered=False)
+                added += result.upserted_count
+        return added
+
+
+class AsyncPartitionedCollection(BasePartitionedCollection):
+    """
+    PartitionedCollection over the collections of motor, for the models of
+    app.data.async_models and the asyncio reports
+    """
+
+    async def get_names(self, query=None, refresh=False):
+        names = None if refresh else self.get_cached_names()
+        if names is None:
+            names = self.set_names(
+                await self.database.list_collection_names())
+        return self.select_names(names, query)
+
+    async def partitions(self, query=None):
+        return [self.get_collection(name)
+                for name in await self.get_names(query)]
+
+    async def search(self, filter, operation, skip=()):
+        """
+        See PartitionedCollection.search
+        """
+        listed = self.get_cached_names() is None
+        searched = set(skip)
+        for refresh in (False, True):
+            if refresh and listed:
+                break
+            names = await self.get_names(filter, refresh)
+            for name in self.order_names(names, filter):
+                if name in searched:
+                    continue
+                searched.add(name)
+                document = await operation(self.get_collection(name))
+                if document is not None:
+                    self.remember(document, name)
+                    return document
+        return None
+
+    async def get_partition(self, name):
+        partition = self.get_collection(name)
+        if self.needs_indexes(name):
+            base = self.get_collection(self.name)
+            for index in await base.list_indexes().to_list(None):
+                if index["name"] != "_id_":
+                    keys, options = get_index_options(index)
+                    await partition.create_index(keys, **options)
+            self.indexed.add(name)
+        self.add_name(name)
+        return partition
+
+    async def route(self, document):
+        return await self.get_partition(
+            self.get_partition_name(document.get("timestamp")))
+
+    async def get_ids(self):
+        ids = self.get_collection(self.ids_name)
+        if self.ids_name not in self.indexed:
+            await ids.create_index("partition")
+            self.indexed.add(self.ids_name)
+        return ids
+
+    async def claim_ids(self, documents, errors, ordered=False):
+        """
+        See PartitionedCollection.claim_ids
+        """
+        positions = list(range(len(documents)))
+        ids = await self.get_ids()
+        try:
+            await ids.insert_many(self.get_id_entries(documents),
+                                  ordered=ordered)
+        except BulkWriteError as exc:
+            errors.extend(exc.details["writeErrors"])
+            return get_written(positions, exc.details["writeErrors"], ordered)
+        return positions
+
+    async def release_ids(self, event_ids):
+        event_ids = list(event_ids)
+        if event_ids:
+            ids = await self.get_ids()
+            await ids.delete_many({"_id": {"$in": event_ids}})
+
+    async def resolve(self, pipeline):
+        name, pipeline = self.get_union_pipeline(
+            await self.get_names(get_leading_match(pipeline)), pipeline)
+        return self.get_collection(name), pipeline
+
+    async def insert_one(self, document, **kwargs):
+        """
+        See PartitionedCollection.insert_one
+        """
+        partition = await self.route(document)
+        entry, = self.get_id_entries([document])
+        await (await self.get_ids()).insert_one(entry)
+        try:
+            result = await partition.insert_one(document, **kwargs)
+        except PyMongoError as exc:
+            if not isinstance(exc, DuplicateKeyError):
+                await self.release_ids([entry["_id"]])
+            raise
+        self.remember(document, partition.name)
+        return result
+
+    async def insert_many(self, documents, ordered=False):
+        """
+        See PartitionedCollection.insert_many
+        """
+        documents = list(documents)
+        if not documents:
+            return InsertManyResult([], True)
+        errors = []
+        claimed = await self.claim_ids(documents, errors, ordered)
+        written = set()
+        try:
+            for name, positions in self.get_positions(
+                    documents, set(claimed)).items():
+                partition = await self.get_partition(name)
+                try:
+                    await partition.insert_many(
+                        [documents[position] for position in positions],
+                        ordered=ordered)
+                    written.update(positions)
+                except BulkWriteError as exc:
+                    merge_write_errors(errors, positions, exc)
+                    written.update(get_written(
+                        positions, exc.details["writeErrors"], ordered))
+                    if ordered:
+                        break
+                finally:
+                    for position in positions:
+                        self.remember(documents[position], name)
+        finally:
+            await self.release_ids(documents[position]["_id"] for position in
+                                   get_unwritten(claimed, written, errors))
+        raise_write_errors(errors, len(written))
+        return InsertManyResult([document["_id"] for document in documents],
+                                True)
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        return await self.search(filter, lambda partition: partition.find_one(
+            filter, *args, **kwargs))
+
+    async def upsert(self, filter, update, target, **kwargs):
+        ids = await self.get_ids()
+        await ids.update_one({"_id": get_event_id(filter)},
+                             {"$set": {"partition": target.name}}, upsert=True)
+        previous = await target.find_one_and_update(filter, update,
+                                                    upsert=True, **kwargs)
+        self.add_name(target.name)
+        self.remember(filter, target.name)
+        return previous
+
+    async def find_one_and_update(self, filter, update, upsert=False,
+                                  **kwargs):
+        """
+        See PartitionedCollection.find_one_and_update
+        """
+        fields = update.get("$set", {})
+        if "timestamp" not in fields:
+            previous = await self.search(
+                filter, lambda partition: partition.find_one_and_update(
+                    filter, update, **kwargs))
+            if previous is not None or not upsert:
+                return previous
+            return await self.upsert(filter, update,
+                                     await self.route(fields), **kwargs)
+
+        target = await self.route(fields)
+        previous = await target.find_one_and_update(filter, update, **kwargs)
+        if previous is not None:
+            self.remember(filter, target.name)
+            return previous
+
+        ids = await self.get_ids()
+        event_id = get_event_id(filter)
+        source_name = self.get_source_name(
+            await ids.find_one({"_id": event_id}), target.name)
+        previous = None
+        if source_name is not None:
+            previous = await self.get_collection(source_name).find_one(filter)
+        if previous is None:
+            previous = await self.search(
+                filter, lambda partition: partition.find_one(filter),
+                skip=[target.name])
+            source_name = self.locations.get(event_id)
+        if previous is None:
+            return await self.upsert(filter, update, target, **kwargs) \
+                if upsert else None
+
+        await ids.update_one({"_id": event_id},
+                             {"$set": {"partition": target.name}}, upsert=True)
+        await target.replace_one(filter, {**previous, **fields}, upsert=True)
+        self.add_name(target.name)  # Listed before the copy created it
+        await self.get_collection(source_name).delete_one(filter)
+        self.remember(filter, target.name)
+        return previous
+
+    async def find_one_and_delete(self, filter, **kwargs):
+        document = await self.search(
+            filter, lambda partition: partition.find_one_and_delete(
+                filter, **kwargs))
+        if document is not None:
+            self.locations.pop(get_event_id(document), None)
+            await self.release_ids([get_event_id(document)])
+        return document
+
+    async def estimated_document_count(self, **kwargs):
+        count = 0
+        for partition in await self.partitions():
+            count += await partition.estimated_document_count(**kwargs)
+        return count
+
+
+def get_events_collection(registry=connections,
+                          partitioned=PartitionedCollection):
+    """
+    The collection of the events, partitioned by EVENT_PARTITIONS
+    """
+    if EVENT_PARTITIONS is None:
+        return registry.collection(MONGO_COLLECTION_NAME)
+    return partitioned(registry, MONGO_COLLECTION_NAME, EVENT_PARTITIONS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.data.partitions")
+    parser.add_argument("--split", action="store_true",
+                        help="move the events of the events collection to "
+                             "their partitions")
+    parser.add_argument("--index-ids", action="store_true",
+                        help="add the events missing from the id index to "
+                             "it")
+    args = parser.parse_args(argv)
+
+    collection = get_events_collection()
+    if not isinstance(collection, PartitionedCollection):
+        parser.error("EVENT_PARTITIONS is not set in app/settings.py")
+    if args.split:
+        print(f"Moved {collection.split()} events to their partitions")
+    if args.index_ids:
+        print(f"Added {collection.index_ids()} events to the id index")
+    for partition in collection.partitions():
+        period = collection.get_period(partition.name)
+        span = "undated" if period is None else \
+            f"{period[0]:%Y-%m-%d} - {period[1]:%Y-%m-%d}"
+        print(f"{partition.name:24} {span:25} "
+              f"{partition.estimated_document_count():>12,} events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Connection pool statistics of this process, collected from the pymongo
+pool events. Every worker has its own client, so its own numbers
+"""
+import os
+import threading
+import time
+
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class PoolStatsListener(ConnectionPoolListener):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.open = 0
+            self.checked_out = 0
+            self.checkouts = 0
+            self.failed_checkouts = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+            self.clears = 0
+
+    def get_wait_time(self):
+        started = getattr(self.local, "started", None)
+        self.local.started = None
+        return time.monotonic() - started if started else 0.0
+
+    def connection_check_out_started(self, event):
+        # The checkout is done by the thread that needs the connection
+        self.local.started = time.monotonic()
+
+    def connection_checked_out(self, event):
+        wait_time = self.get_wait_time()
+        with self.lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_check_out_failed(self, event):
+        wait_time = self.get_wait_time()
+        with self.lock:
+            self.failed_checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self.clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self.lock:
+            checkouts = self.checkouts + self.failed_checkouts
+            mean_wait_time = self.wait_time / checkouts if checkouts else 0.0
+            return {
+                "pid": os.getpid(),
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "mean_wait_ms": round(mean_wait_time * 1000, 3),
+                "max_wait_ms": round(self.max_wait_time * 1000, 3),
+                "clears": self.clears,
+            }
+
+
+pool_stats = PoolStatsListener()
@@ -0,0 +1,76 @@
+"""
+Retention of the partitioned events: the partitions whose period ended more
+than EVENT_RETENTION_DAYS ago are dropped whole, instead of deleting their
+events one by one, and so are the rollups of their days and their ids in
+the id index. Run it daily:
+
+    python -m app.data.retention [--days N] [--dry-run]
+
+The write generation is bumped, so the reports and ETags computed before are
+not served again. Without WRITE_GENERATION_SHARED the other processes only
+see it once their cached reports expire with REPORT_CACHE_TTL.
+"""
+import argparse
+import datetime as _dt
+
+from . import rollups
+from .generations import write_generation
+from .partitions import PartitionedCollection, get_events_collection
+from ..settings import EVENT_RETENTION_DAYS
+
+
+def get_expired(collection, retention_days, now=None):
+    """
+    Names and periods of the partitions which ended before the retention
+    """
+    cutoff = (now or _dt.datetime.utcnow()) - \
+        _dt.timedelta(days=retention_days)
+    expired = []
+    for name in collection.get_names():
+        period = collection.get_period(name)
+        if period is not None and period[1] <= cutoff:
+            expired.append((name, period))
+    return expired
+
+
+def expire(collection, retention_days=EVENT_RETENTION_DAYS, now=None):
+    """
+    Drops the expired partitions and their rollups, returns their names
+    """
+    expired = get_expired(collection, retention_days, now)
+    for name, (start, end) in expired:
+        collection.get_collection(name).drop()
+        collection.get_ids().delete_many({"partition": name})
+        collection.forget(name)
+        rollups.collection.delete_many({"day": {
+            "$gte": rollups.get_day(start), "$lt": rollups.get_day(end)}})
+    if expired:
+        write_generation.bump()
+    return [name for name, _ in expired]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.data.retention")
+    parser.add_argument("--days", type=int, default=EVENT_RETENTION_DAYS)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="list the expired partitions without dropping "
+                             "them")
+    args = parser.parse_args(argv)
+
+    collection = get_events_collection()
+    if not isinstance(collection, PartitionedCollection):
+        parser.error("EVENT_PARTITIONS is not set in app/settings.py")
+    if args.days is None:
+        parser.error("Set EVENT_RETENTION_DAYS in app/settings.py or --days")
+
+    if args.dry_run:
+        names = [name for name, _ in get_expired(collection, args.days)]
+    else:
+        names = expire(collection, args.days)
+    for name in names:
+        print(name)
+    print(f"{len(names)} expired partitions")
+
+
+if __name__ == "__main__":
+    main()
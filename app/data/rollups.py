@@ -0,0 +1,197 @@
+"""
+Daily rollups of the events collection. Each rollup document holds the count
+of the events and the sum, value_count, min and max of their "value" for one
+(day, client, client_group, device_type, category, valid) key and is kept up
+to date with $inc upserts on every write, so reports don't have to group the
+raw events. Events without a value are counted but left out of the others,
+like $avg, $min and $max skip them on the raw events.
+
+Removing an event decrements sum and the counts but can't narrow min and max,
+they are exact again after a rebuild:
+
+    python -m app.data.rollups
+"""
+import datetime as _dt
+import time
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from .connections import connections
+from .partitions import get_events_collection
+from ..settings import MONGO_ROLLUP_COLLECTION_NAME, REPORT_ROLLUP_STATS_TTL
+
+collection = connections.collection(MONGO_ROLLUP_COLLECTION_NAME)
+
+DIMENSIONS = ["client", "client_group", "device_type", "category", "valid"]
+KEYS = ["day"] + DIMENSIONS
+
+DAY_FORMAT = "%Y-%m-%d"
+DAY_EXPRESSION = {"$switch": {
+    "branches": [
+        {"case": {"$eq": [{"$type": "$timestamp"}, "date"]},
+         "then": {"$dateToString": {"format": DAY_FORMAT,
+                                    "date": "$timestamp"}}},
+        {"case": {"$eq": [{"$type": "$timestamp"}, "string"]},
+         "then": {"$substrBytes": ["$timestamp", 0, 10]}},
+    ],
+    "default": None,
+}}
+NUMBER_TYPES = ["double", "int", "long", "decimal"]
+
+
+def get_day(timestamp):
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, _dt.date):
+        return timestamp.strftime(DAY_FORMAT)
+    return str(timestamp)[:10]  # ISO 8601 strings start with the date
+
+
+def get_key(event):
+    key = {name: event.get(name) for name in DIMENSIONS}
+    key["day"] = get_day(event.get("timestamp"))
+    return key
+
+
+def get_update(event, sign):
+    value = event.get("value")
+    if value is None:
+        update = {"$inc": {"count": sign}}
+    else:
+        update = {"$inc": {"sum": sign * value, "count": sign,
+                           "value_count": sign}}
+        if sign > 0:
+            update["$min"] = {"min": value}
+            update["$max"] = {"max": value}
+    return UpdateOne(get_key(event), update, upsert=sign > 0)
+
+
+def get_updates(previous, current):
+    """
+    Returns the rollup updates for an event changing from previous to
+    current, either of them is None for inserts and deletes
+    """
+    if previous and current and get_key(previous) == get_key(current):
+        if previous.get("value") == current.get("value"):
+            return []
+
+    updates = []
+    if previous:
+        updates.append(get_update(previous, -1))
+    if current:
+        updates.append(get_update(current, 1))
+    return updates
+
+
+def get_all_updates(changes):
+    updates = []
+    for previous, current in changes:
+        updates.extend(get_updates(previous, current))
+    return updates
+
+
+def apply(changes):
+    """
+    Applies (previous, current) event pairs to the rollups in one command
+    """
+    updates = get_all_updates(changes)
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+
+
+def get_span(first, last):
+    """
+    Days from the first to the last rollup document, both {"day": ...}
+    """
+    if not first or not last:
+        return 1
+    start, end = (_dt.datetime.strptime(document["day"], DAY_FORMAT)
+                  for document in (first, last))
+    return (end - start).days + 1
+
+
+class RollupStats:
+    """
+    Average number of rollup documents per day, what a report answered from
+    the rollups reads per day of its range. Cached REPORT_ROLLUP_STATS_TTL
+    seconds per process
+    """
+    FILTER = {"day": {"$ne": None}}
+    PROJECTION = {"_id": 0, "day": 1}
+
+    def __init__(self, ttl=REPORT_ROLLUP_STATS_TTL):
+        self.ttl = ttl
+        self.per_day = None
+        self.at = 0.0
+
+    def is_fresh(self):
+        return self.per_day is not None and \
+            time.monotonic() - self.at <= self.ttl
+
+    def set(self, count, first, last):
+        self.per_day = count / get_span(first, last)
+        self.at = time.monotonic()
+        return self.per_day
+
+    def get_per_day(self, source=None):
+        if self.is_fresh():
+            return self.per_day
+        source = source or collection
+        return self.set(
+            source.estimated_document_count(),
+            source.find_one(self.FILTER, self.PROJECTION,
+                            sort=[("day", ASCENDING)]),
+            source.find_one(self.FILTER, self.PROJECTION,
+                            sort=[("day", DESCENDING)]))
+
+    async def get_per_day_async(self, source):
+        """
+        get_per_day() through source, a collection of motor
+        """
+        if self.is_fresh():
+            return self.per_day
+        return self.set(
+            await source.estimated_document_count(),
+            await source.find_one(self.FILTER, self.PROJECTION,
+                                  sort=[("day", ASCENDING)]),
+            await source.find_one(self.FILTER, self.PROJECTION,
+                                  sort=[("day", DESCENDING)]))
+
+
+stats = RollupStats()
+
+
+def ensure_index():
+    collection.create_index([(key, ASCENDING) for key in KEYS], unique=True)
+
+
+def rebuild(source=None):
+    """
+    Recomputes every rollup from the raw events and replaces the collection
+    """
+    source = source or get_events_collection()
+    group_ids = {name: f"${name}" for name in DIMENSIONS}
+    group_ids["day"] = DAY_EXPRESSION
+
+    projection = {key: f"$_id.{key}" for key in KEYS}
+    projection.update({"_id": 0, "sum": 1, "count": 1, "value_count": 1,
+                       "min": 1, "max": 1})
+
+    source.aggregate([
+        {"$group": {
+            "_id": group_ids,
+            "sum": {"$sum": "$value"},
+            "count": {"$sum": 1},
+            "value_count": {"$sum": {"$cond": [
+                {"$in": [{"$type": "$value"}, NUMBER_TYPES]}, 1, 0]}},
+            "min": {"$min": "$value"},
+            "max": {"$max": "$value"}}},
+        {"$project": projection},
+        {"$out": collection.name},
+    ], allowDiskUse=True)
+    ensure_index()
+    return collection.count_documents({})
+
+
+if __name__ == "__main__":
+    print(f"Rebuilt {rebuild()} rollups")
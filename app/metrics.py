@@ -0,0 +1,231 @@
+"""
+Prometheus metrics of this process, rendered in the text exposition format
+by GET /metrics. A metric is split into SHARD_COUNT shards, each with its
+own lock, and a thread records into the shard its id hashes to, so threads
+seldom wait on each other. The shards are summed when the metrics are
+rendered.
+"""
+import bisect
+import copy
+import functools
+import inspect
+import threading
+import time
+
+# Prometheus default buckets, in seconds
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0]
+CONTENT_TYPE = "text/plain; version=0.0.4"
+SHARD_BITS = 4
+SHARD_COUNT = 2 ** SHARD_BITS
+FIBONACCI_MULTIPLIER = 11400714819323198485  # 2 ** 64 / golden ratio
+
+
+def get_shard_index(ident):
+    """
+    Thread ids are aligned stack addresses, their low bits are all zero, a
+    Fibonacci hash spreads them over the shards
+    """
+    return ((ident * FIBONACCI_MULTIPLIER) & (2 ** 64 - 1)) >> \
+        (64 - SHARD_BITS)
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        # (lock, {labels: value}) pairs
+        self.shards = [(threading.Lock(), {}) for _ in range(SHARD_COUNT)]
+
+    def get_shard(self):
+        return self.shards[get_shard_index(threading.get_ident())]
+
+    def get_shards(self):
+        copies = []
+        for lock, shard in self.shards:
+            with lock:
+                copies.append({labels: copy.copy(value)
+                               for labels, value in shard.items()})
+        return copies
+
+    def format_labels(self, values, **extra):
+        pairs = list(zip(self.labels, values)) + list(extra.items())
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"')
+                   for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value
+                              in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} {self.TYPE}"]
+        return lines + list(self.render_samples())
+
+    def render_samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, *labels, amount=1):
+        lock, shard = self.get_shard()
+        with lock:
+            shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for shard in self.get_shards():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render_samples(self):
+        for labels, value in sorted(self.collect().items()):
+            yield f"{self.name}{self.format_labels(labels)} {value}"
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = list(buckets)
+
+    def observe(self, value, *labels):
+        bucket = bisect.bisect_left(self.buckets, value)
+        lock, shard = self.get_shard()
+        with lock:
+            state = shard.get(labels)
+            if state is None:
+                # One count per bucket and +Inf, then the sum
+                state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bucket] += 1
+            state[-1] += value
+
+    def collect(self):
+        totals = {}
+        for shard in self.get_shards():
+            for labels, state in shard.items():
+                total = totals.setdefault(labels, [0] * len(state))
+                for index, value in enumerate(state):
+                    total[index] += value
+        return totals
+
+    def render_samples(self):
+        for labels, state in sorted(self.collect().items()):
+            cumulative = 0
+            bounds = [str(bucket) for bucket in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, state):
+                cumulative += count
+                label_text = self.format_labels(labels, le=bound)
+                yield f"{self.name}_bucket{label_text} {cumulative}"
+            yield f"{self.name}_sum{self.format_labels(labels)} {state[-1]}"
+            yield f"{self.name}_count{self.format_labels(labels)} {cumulative}"
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "Requests served by operation and status",
+    ["operation", "status"]))
+REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "Time spent in the handler by operation",
+    ["operation"]))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Requests being handled by operation",
+    ["operation"]))
+REPORT_REJECTIONS = registry.register(Counter(
+    "report_rejections_total",
+    "Reports rejected by the admission control by status", ["status"]))
+COMMAND_DURATION = registry.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by command",
+    ["command"]))
+COMMAND_DOCUMENTS = registry.register(Counter(
+    "mongodb_command_documents_total",
+    "Documents returned by reads and written by writes, by command",
+    ["command"]))
+COMMAND_ERRORS = registry.register(Counter(
+    "mongodb_command_errors_total", "Failed MongoDB commands by command",
+    ["command"]))
+
+
+def get_status(result):
+    """
+    Status code of what a handler returns: a (body, status) tuple or a
+    response object
+    """
+    if isinstance(result, tuple) and len(result) > 1:
+        return result[1]
+    for name in ["status_code", "status"]:
+        status = getattr(result, name, None)
+        if isinstance(status, int):
+            return status
+    return 200
+
+
+def timed(operation):
+    """
+    Records the count, the latency and the in-flight requests of a handler,
+    plain or async
+    """
+    def start():
+        REQUESTS_IN_FLIGHT.inc(operation)
+        return time.perf_counter()
+
+    def finish(started, status):
+        REQUEST_DURATION.observe(time.perf_counter() - started, operation)
+        REQUESTS.inc(operation, str(status))
+        REQUESTS_IN_FLIGHT.dec(operation)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started, status = start(), 500
+                try:
+                    result = await func(*args, **kwargs)
+                    status = get_status(result)
+                    return result
+                finally:
+                    finish(started, status)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started, status = start(), 500
+            try:
+                result = func(*args, **kwargs)
+                status = get_status(result)
+                return result
+            finally:
+                finish(started, status)
+        return wrapper
+    return decorator
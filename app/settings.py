@@ -1,10 +1,47 @@
-from pymongo import MongoClient
-
 PORT = 5000
 DEBUG = True
 DEFAULT_PAGE_LIMIT = 5
+BULK_INSERT_CHUNK_SIZE = 1000
 MONGO_HOST = "mongo" # localhost for local dev
 MONGO_PORT = 27017
 MONGO_DB_NAME = "ebs"
 MONGO_COLLECTION_NAME = "events"
-MONGO_CLIENT = MongoClient(host=MONGO_HOST, port=MONGO_PORT)
+MONGO_ROLLUP_COLLECTION_NAME = "events_daily"
+MONGO_COUNTERS_COLLECTION_NAME = "counters"
+WRITE_GENERATION_SHARED = False  # True counts it in MongoDB for every worker, one more command per write
+EVENT_PARTITIONS = None  # or "month" or "week", see app/data/partitions.py
+EVENT_PARTITION_NAMES_TTL = 60  # seconds the partition names are cached
+EVENT_RETENTION_DAYS = None  # partitions older than this are dropped
+USE_ROLLUPS = True
+REPORT_CACHE_ENABLED = True
+REPORT_CACHE_BACKEND = "app.api.cache.MemoryBackend"
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+REPORT_CACHE_TTL = 60  # seconds
+REPORT_STREAM_BATCH_SIZE = 1000
+REPORT_BACKEND = "mongo"  # or "columnar", reports from app/data/columnar.py
+COLUMNAR_RELOAD_INTERVAL = 60  # seconds
+EXPORT_BATCH_SIZE = 10000  # events per cursor batch and encoded chunk
+MONGO_MAX_POOL_SIZE = 50  # connections per worker process
+MONGO_MIN_POOL_SIZE = 0
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 2000  # fail a checkout instead of queueing forever
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+SLOW_REPORT_THRESHOLD_MS = 500  # reports slower than this are logged
+SLOW_REPORT_EXPLAIN_RATE = 0.1  # share of slow reports explained with executionStats
+SLOW_REPORT_LOG_FILE = "slow_reports.log"  # None for the "app.slow_reports" logger
+SLOW_REPORT_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_REPORT_LOG_BACKUPS = 5
+SLOW_REPORT_MAX_SHAPES = 1000  # fingerprints counted for GET /report/slow
+REPORT_MAX_CONCURRENT = 8  # reports aggregating at once per worker process
+REPORT_MAX_EXPENSIVE_CONCURRENT = 2  # of which expensive ones
+REPORT_QUEUE_TIMEOUT = 1.0  # seconds a report waits for a slot, then 429/503
+REPORT_MAX_TIME_MS = 5000  # maxTimeMS of the report aggregations
+REPORT_EXPENSIVE_MAX_TIME_MS = 30000
+REPORT_ALLOW_DISK_USE = "expensive"  # "always", "never" or "expensive"
+REPORT_EXPENSIVE_COST = 1000000  # estimated documents read and groups built
+REPORT_EVENTS_PER_DAY = 10000  # average, for the cost estimate
+REPORT_HISTORY_DAYS = 365  # span of a report without a date range
+REPORT_ROLLUP_STATS_TTL = 60  # seconds the rollup count per day is cached
+RESPONSE_JSON_ENCODER = "app.view.encoding.OrjsonEncoder"  # or "app.view.encoding.JsonEncoder"
+RESPONSE_COMPRESSION = ["br", "gzip"]  # preferred first, [] to send bodies as they are
+RESPONSE_COMPRESSION_MIN_BYTES = 1024  # smaller bodies aren't worth compressing
+RESPONSE_COMPRESSION_LEVELS = {"br": 4, "gzip": 6}
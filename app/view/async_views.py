@@ -0,0 +1,145 @@
+"""
+asyncio variants of the event and report views, see main_async.py
+"""
+import asyncio
+
+from aiohttp import web
+from connexion import NoContent
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .events import (EVENT_ALREADY_EXISTS,
+                     EVENT_INVALID_ID,
+                     EVENT_INVALID_PAYLOAD,
+                     EVENT_NOT_FOUND,
+                     get_bulk_response,
+                     read_events,
+                     set_inserted,
+                     split_chunk)
+from .etags import get_event_etag, get_report_etag, matches, not_modified
+from .health import get_readiness
+from .reports import JSON_MIMETYPE, normalize_report_query
+from .utils import chunked, error, is_valid_uuid
+from ..api.async_query import run_event_query
+from ..api.export import EXTENSIONS, MIMETYPES, export_events
+from ..api.guardrails import ReportRejected
+from ..data.async_models import AsyncEventDocument, motor_connections
+from ..settings import BULK_INSERT_CHUNK_SIZE, REPORT_BACKEND
+
+if REPORT_BACKEND == "columnar":
+    from ..api.columnar_query import run_event_query as run_columnar_query
+
+
+async def export(request, **kwargs):
+    """
+    The pymongo cursor blocks, every chunk is read and encoded in a thread
+    and written to the response as it comes, like the WSGI mode streams it
+    """
+    export_format = kwargs.pop("format", "csv")
+    try:
+        chunks = export_events(export_format, **kwargs)
+    except ValueError as exc:
+        return error(str(exc), 400)
+
+    filename = f"events.{EXTENSIONS[export_format]}"
+    response = web.StreamResponse(headers={
+        "Content-Type": MIMETYPES[export_format],
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+    loop = asyncio.get_event_loop()
+    pending = None
+    try:
+        await response.prepare(request)
+        while True:
+            # Shielded, the thread keeps reading when the request is cancelled
+            pending = loop.run_in_executor(None, next, chunks, None)
+            chunk = await asyncio.shield(pending)
+            if chunk is None:
+                break
+            await response.write(chunk)
+        await response.write_eof()
+    finally:
+        # Closes the cursor when the client went away, once the chunk being
+        # read is done
+        if pending is not None:
+            await asyncio.wait([pending])
+        await loop.run_in_executor(None, chunks.close)
+    return response
+
+
+async def get_report(if_none_match=None, **kwargs):
+    etag = get_report_etag(kwargs, JSON_MIMETYPE,
+                           await AsyncEventDocument.get_write_generation())
+    if matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        if REPORT_BACKEND == "columnar":
+            # In memory, there is no I/O to wait on
+            result, pagination = run_columnar_query(**kwargs)
+        else:
+            result, pagination = await run_event_query(**kwargs)
+    except ValueError as exc:
+        return error(str(exc), 400)
+    except ReportRejected as exc:
+        return error(str(exc), exc.status)
+
+    response = {
+        "rows": normalize_report_query(result),
+        "pagination": pagination,
+    }
+    return response, 200, {"ETag": etag}
+
+
+async def create(body):
+    try:
+        await AsyncEventDocument(body).create()
+    except DuplicateKeyError:
+        return error(EVENT_ALREADY_EXISTS, 409)
+    return NoContent, 201
+
+
+async def create_many(body, mimetype):
+    try:
+        events = read_events(body, mimetype)
+    except ValueError:
+        return error(EVENT_INVALID_PAYLOAD, 400)
+
+    items = []
+    for chunk in chunked(events, BULK_INSERT_CHUNK_SIZE):
+        statuses, documents, positions = split_chunk(chunk)
+        duplicates = await AsyncEventDocument.insert_many(documents)
+        items.extend(set_inserted(statuses, positions, duplicates))
+    return get_bulk_response(items), 200
+
+
+async def get(event_id, if_none_match=None):
+    if not is_valid_uuid(event_id):
+        return error(EVENT_INVALID_ID, 400)
+
+    doc = AsyncEventDocument(id=event_id)
+    obj = await doc.get_object()
+    if not obj:
+        return error(EVENT_NOT_FOUND, 400)
+
+    etag = get_event_etag(obj)
+    if matches(if_none_match, etag):
+        return not_modified(etag)
+    await doc.reload(obj=obj)
+    return doc.serialize(), 200, {"ETag": etag}
+
+
+async def delete(event_id):
+    doc = AsyncEventDocument(id=event_id)
+
+    if not is_valid_uuid(event_id) or not await doc.get_object():
+        return error(EVENT_INVALID_ID, 400)
+
+    await doc.remove()
+    return NoContent, 204
+
+
+async def ready():
+    try:
+        await motor_connections.client.admin.command("ping")
+    except PyMongoError:
+        return get_readiness(False)
+    return get_readiness(True)
@@ -0,0 +1,118 @@
+"""
+Compression of the response bodies, negotiated with Accept-Encoding: brotli
+when the brotli package is installed and the client accepts it, else gzip.
+Bodies smaller than RESPONSE_COMPRESSION_MIN_BYTES, streamed bodies (NDJSON
+reports, exports) and the already compressed formats are sent as they are.
+"""
+import gzip
+
+from ..settings import (RESPONSE_COMPRESSION,
+                        RESPONSE_COMPRESSION_LEVELS,
+                        RESPONSE_COMPRESSION_MIN_BYTES)
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered
+    brotli = None
+
+BROTLI = "br"
+GZIP = "gzip"
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/problem+json",
+                          "application/x-ndjson", "text/csv", "text/plain"}
+
+
+def get_encodings():
+    """
+    Supported encodings, preferred first
+    """
+    return [encoding for encoding in RESPONSE_COMPRESSION
+            if encoding != BROTLI or brotli is not None]
+
+
+def parse_accept_encoding(header):
+    """
+    {encoding: quality} of an Accept-Encoding header
+    """
+    qualities = {}
+    for item in (header or "").split(","):
+        encoding, _, params = item.strip().partition(";")
+        if not encoding:
+            continue
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[encoding.strip().lower()] = quality
+    return qualities
+
+
+def negotiate(header, encodings=None):
+    """
+    The accepted encoding of highest quality, the first supported one on a
+    tie, None for the identity
+    """
+    qualities = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in get_encodings() if encodings is None else encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def should_compress(status, mimetype, size, headers):
+    return (200 <= status < 300 and status != 204
+            and size >= RESPONSE_COMPRESSION_MIN_BYTES
+            and mimetype in COMPRESSIBLE_MIMETYPES
+            and "Content-Encoding" not in headers)
+
+
+def compress(data, encoding):
+    level = RESPONSE_COMPRESSION_LEVELS[encoding]
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def add_vary(headers):
+    vary = headers.get("Vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+def compress_body(data, status, mimetype, headers, accept_encoding):
+    """
+    The body to send for data, compressed when it is worth it and the client
+    accepts it, the headers are updated accordingly
+    """
+    if not should_compress(status, mimetype, len(data), headers):
+        return data
+    add_vary(headers)
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return data
+    headers["Content-Encoding"] = encoding
+    if "ETag" in headers:
+        # A strong ETag names one representation, see app/view/etags.py
+        headers["ETag"] = f'{headers["ETag"][:-1]}-{encoding}"'
+    return compress(data, encoding)
+
+
+def compress_response(response, accept_encoding):
+    """
+    Compresses the body of a Flask response, streamed ones are left as
+    they are
+    """
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    data = response.get_data()
+    body = compress_body(data, response.status_code, response.mimetype,
+                         response.headers, accept_encoding)
+    if body is not data:
+        response.set_data(body)
+    return response
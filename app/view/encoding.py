@@ -0,0 +1,97 @@
+"""
+JSON encoding of the response bodies. Connexion writes them with the json
+module, indented, RESPONSE_JSON_ENCODER replaces it with a compact encoder,
+orjson when it is installed:
+
+- naive datetimes, which MongoDB returns in UTC, as "2019-01-07T10:00:00Z"
+  like Connexion did, dates as "2019-01-07"
+- ObjectId as its hex string, Decimal and Decimal128 as floats
+
+Request bodies are decoded by the same encoder.
+"""
+import datetime as _dt
+import decimal
+import importlib
+import json
+
+from bson import Decimal128, ObjectId
+from connexion.utils import Jsonifier
+
+from ..settings import RESPONSE_JSON_ENCODER
+
+try:
+    import orjson
+except ImportError:  # JsonEncoder is used instead
+    orjson = None
+
+
+def default(value):
+    """
+    Encodes the values both encoders can't
+    """
+    if isinstance(value, _dt.datetime):
+        if value.tzinfo:
+            return value.isoformat("T")
+        return value.isoformat("T") + "Z"
+    if isinstance(value, _dt.date):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class JsonEncoder(Jsonifier):
+    """
+    The json module, without indentation
+    """
+
+    def __init__(self):
+        super().__init__(json)
+
+    def encode(self, data):
+        return json.dumps(data, default=default,
+                          separators=(",", ":")).encode()
+
+    def dumps(self, data):
+        return self.encode(data) + b"\n"
+
+
+class OrjsonEncoder(Jsonifier):
+    """
+    orjson, several times faster than the json module, see
+    benchmarks/encoding.py. Datetimes are passed to default(), so both
+    encoders write them alike
+    """
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE \
+        if orjson else 0
+
+    def __init__(self):
+        super().__init__(json)
+
+    def encode(self, data):
+        return orjson.dumps(data, default=default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=default, option=self.OPTIONS)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return super().loads(data)
+
+
+def load_encoder(path):
+    module_name, class_name = path.rsplit(".", 1)
+    encoder_class = getattr(importlib.import_module(module_name), class_name)
+    if encoder_class is OrjsonEncoder and orjson is None:
+        encoder_class = JsonEncoder
+    return encoder_class()
+
+
+encoder = load_encoder(RESPONSE_JSON_ENCODER)
@@ -0,0 +1,85 @@
+"""
+Strong ETags of the reports and events. A client sending back the ETag it got
+in If-None-Match gets a 304 Not Modified, without the report being computed
+again:
+
+- the ETag of a report hashes its normalized options, its media type and the
+  write generation of the events (app/data/generations.py), and it changes
+  every REPORT_CACHE_TTL seconds for the writes made outside of the API.
+  Without WRITE_GENERATION_SHARED the generation only counts the writes of
+  this process, the ETag then also carries a token of the process
+- the ETag of an event is the version every write stamps on it. Events
+  written before the versions existed get a hash of their content instead
+
+Compressed bodies get their encoding appended to the ETag (see
+app/view/compression.py), which If-None-Match ignores.
+"""
+import hashlib
+import time
+import uuid
+
+from bson import json_util
+from connexion import NoContent
+
+from ..api.query2 import normalize_options
+from ..data.models import EventDocument, MongoModel
+from ..settings import REPORT_CACHE_TTL, WRITE_GENERATION_SHARED
+
+PROCESS_TOKEN = "shared" if WRITE_GENERATION_SHARED else uuid.uuid4().hex
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def quote(tag):
+    return f'"{tag}"'
+
+
+def get_period(now=None):
+    return int((time.time() if now is None else now) // REPORT_CACHE_TTL)
+
+
+def get_report_etag(options, mimetype, generation=None, now=None):
+    if generation is None:
+        generation = EventDocument.get_write_generation()
+    normalized = json_util.dumps(normalize_options(options), sort_keys=True)
+    key = f"{PROCESS_TOKEN}:{generation}:{get_period(now)}:{mimetype}:" \
+          f"{normalized}"
+    return quote(hashlib.sha1(key.encode()).hexdigest())
+
+
+def get_event_etag(document):
+    """
+    ETag of a stored event document
+    """
+    version = document.get(MongoModel.VERSION_KEY)
+    if version is None:
+        content = json_util.dumps(document, sort_keys=True)
+        return quote(hashlib.sha1(content.encode()).hexdigest())
+    return quote(version)
+
+
+def strip_tag(tag):
+    """
+    The ETag as it was computed, without weakness and encoding
+    """
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(f'{suffix}"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header names the etag (weak comparison)
+    """
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(strip_tag(tag) == etag for tag in if_none_match.split(","))
+
+
+def not_modified(etag):
+    return NoContent, 304, {"ETag": etag}
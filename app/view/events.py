@@ -1,34 +1,143 @@
+import functools
+import json
+import os
+
+import yaml
 from connexion import NoContent
+from connexion.json_schema import Draft4RequestValidator
+from jsonschema import draft4_format_checker
+from pymongo.errors import DuplicateKeyError
 
-from .utils import error, is_valid_uuid
+from .etags import get_event_etag, matches, not_modified
+from .utils import chunked, error, is_valid_uuid, read_ndjson
 from ..data.models import EventDocument
+from ..settings import BULK_INSERT_CHUNK_SIZE
 
 EVENT_NOT_FOUND = "Event not found"
 EVENT_ALREADY_EXISTS = "Event already exists"
 EVENT_INVALID_ID = "Invalid ID supplied"
+EVENT_INVALID_PAYLOAD = "Invalid payload supplied"
 
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
 
-def create(body):
-    doc = EventDocument(body)
+EVENT_CREATED = "created"
+EVENT_DUPLICATE = "duplicate"
+EVENT_INVALID = "invalid"
+
+SPEC_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "swagger",
+                         "spec.yml")
 
-    if doc.get_object():
-        return error(EVENT_ALREADY_EXISTS, 409)
 
-    doc.save()
+def create(body):
+    try:
+        EventDocument(body).create()
+    except DuplicateKeyError:
+        return error(EVENT_ALREADY_EXISTS, 409)
     return NoContent, 201
 
 
+@functools.lru_cache(maxsize=None)
+def get_event_validator():
+    """
+    Validator of the Event schema of the spec, the one Connexion checks the
+    body of POST /event against
+    """
+    with open(SPEC_PATH) as spec_file:
+        schema = yaml.safe_load(spec_file)["components"]["schemas"]["Event"]
+    return Draft4RequestValidator(schema, format_checker=draft4_format_checker)
+
+
+def is_valid_event(event):
+    return (isinstance(event, dict)
+            and isinstance(event.get("id"), str)
+            and is_valid_uuid(event["id"])
+            and get_event_validator().is_valid(event))
+
+
+def split_chunk(events):
+    """
+    Returns the statuses of a chunk of events, invalid until they are
+    inserted, the documents to insert and their positions in the chunk
+    """
+    statuses = []
+    documents = []
+    positions = []
+
+    for position, event in enumerate(events):
+        event_id = event.get("id") if isinstance(event, dict) else None
+        statuses.append({"id": event_id, "status": EVENT_INVALID})
+        if is_valid_event(event):
+            documents.append(EventDocument(event))
+            positions.append(position)
+    return statuses, documents, positions
+
+
+def set_inserted(statuses, positions, duplicates):
+    for index, position in enumerate(positions):
+        status = EVENT_DUPLICATE if index in duplicates else EVENT_CREATED
+        statuses[position]["status"] = status
+    return statuses
+
+
+def create_chunk(events):
+    statuses, documents, positions = split_chunk(events)
+    duplicates = EventDocument.insert_many(documents)
+    return set_inserted(statuses, positions, duplicates)
+
+
+def get_bulk_response(items):
+    response = {"items": items}
+    for status in (EVENT_CREATED, EVENT_DUPLICATE, EVENT_INVALID):
+        response[status] = sum(item["status"] == status for item in items)
+    return response
+
+
+def read_events(body, mimetype):
+    """
+    The events of a body, bytes or a stream of lines for NDJSON
+    """
+    if mimetype == NDJSON_MIMETYPE:
+        return read_ndjson(body)
+
+    events = json.loads(body)
+    if not isinstance(events, list):
+        raise ValueError(EVENT_INVALID_PAYLOAD)
+    return events
+
+
+def create_many(body, mimetype=JSON_MIMETYPE):
+    """
+    Accepts either a JSON array or a newline delimited JSON body. The latter
+    is decoded line by line, so only one chunk of events is held as python
+    objects at a time
+    """
+    try:
+        events = read_events(body, mimetype)
+    except ValueError:
+        return error(EVENT_INVALID_PAYLOAD, 400)
+
+    items = []
+    for chunk in chunked(events, BULK_INSERT_CHUNK_SIZE):
+        items.extend(create_chunk(chunk))
+    return get_bulk_response(items), 200
+
+
 # TODO: Add some decorators for validations: less code, such as: @verify_uuid
-def get(event_id):
+def get(event_id, if_none_match=None):
     if not is_valid_uuid(event_id):
         return error(EVENT_INVALID_ID, 400)
 
     doc = EventDocument(id=event_id)
 
-    if not doc.get_object():
+    obj = doc.get_object()
+    if not obj:
         return error(EVENT_NOT_FOUND, 400)
 
-    return doc.reload().serialize(), 200
+    etag = get_event_etag(obj)
+    if matches(if_none_match, etag):
+        return not_modified(etag)
+    return doc.reload(obj=obj).serialize(), 200, {"ETag": etag}
 
 
 def delete(event_id):
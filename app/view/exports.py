@@ -0,0 +1,17 @@
+from flask import Response
+
+from .utils import error
+from ..api.export import EXTENSIONS, MIMETYPES, export_events
+
+
+def get(**kwargs):
+    export_format = kwargs.pop("format", "csv")
+    try:
+        chunks = export_events(export_format, **kwargs)
+    except ValueError as exc:
+        return error(str(exc), 400)
+
+    filename = f"events.{EXTENSIONS[export_format]}"
+    return Response(chunks, mimetype=MIMETYPES[export_format], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
@@ -0,0 +1,23 @@
+from pymongo.errors import PyMongoError
+
+from ..data.connections import connections
+from ..data.pool import pool_stats
+
+READY = "ready"
+UNAVAILABLE = "unavailable"
+
+
+def get_readiness(is_ready):
+    response = {
+        "status": READY if is_ready else UNAVAILABLE,
+        "pool": pool_stats.stats(),
+    }
+    return response, 200 if is_ready else 503
+
+
+def ready():
+    try:
+        connections.client.admin.command("ping")
+    except PyMongoError:
+        return get_readiness(False)
+    return get_readiness(True)
@@ -0,0 +1,5 @@
+from ..metrics import CONTENT_TYPE, registry
+
+
+def get():
+    return registry.render().encode(), 200, CONTENT_TYPE
@@ -1,37 +1,39 @@
-from benedict import benedict
+from flask import Response
 
-from ..api.query2 import run_event_query
+from .encoding import encoder
+from .etags import get_report_etag, matches, not_modified
+from .utils import error
+from ..api.cache import report_cache
+from ..api.guardrails import ReportRejected
+from ..api.slow_reports import slow_reports
+from ..settings import REPORT_BACKEND
 
+if REPORT_BACKEND == "columnar":
+    from ..api.columnar_query import run_event_query, stream_event_query
+else:
+    from ..api.query2 import run_event_query, stream_event_query
+
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
 
-def get_value_or_default(dictionary, path, default=None):
-    ben_dict = benedict(dictionary)
-    if path not in ben_dict:
-        return default
-    else:
-        return ben_dict[path] or default
 
 def normalize_report_query(results):
-    data = []
-
-    for result in results:
-        data.append(
-            {
-                "category": get_value_or_default(result, "_id.category", 0),
-                "client": get_value_or_default(result, "_id.client", 0),
-                "client_group": get_value_or_default(
-                    result, "_id.client_group", 0),
-                "valid": get_value_or_default(result, "_id.valid", None),
-                "device_type": get_value_or_default(result, "_id.device_type"),
-                "day": "2019-01-01", # TODO: Filter out on MongoDB
-                "mean": get_value_or_default(result, "mean", 0.0),
-                "sum": get_value_or_default(result, "sum", 0.0),
-            }
-        )
-    return data
-
-
-def get(**kwargs):
-    result, pagination = run_event_query(**kwargs)
+    """
+    The rows are shaped by the aggregation pipeline ($project stage)
+    """
+    return list(results)
+
+
+def get(if_none_match=None, **kwargs):
+    etag = get_report_etag(kwargs, JSON_MIMETYPE)
+    if matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        result, pagination = run_event_query(**kwargs)
+    except ValueError as exc:
+        return error(str(exc), 400)
+    except ReportRejected as exc:
+        return error(str(exc), exc.status)
     normalized_result = normalize_report_query(result)
 
     response = {
@@ -39,4 +41,40 @@ def get(**kwargs):
         "pagination": pagination,
     }
 
-    return response, 200
+    return response, 200, {"ETag": etag}
+
+
+def stream(if_none_match=None, **kwargs):
+    """
+    Writes one JSON row per line as they come from the database and the
+    pagination as the last line, so the whole report is never in memory
+    """
+    etag = get_report_etag(kwargs, NDJSON_MIMETYPE)
+    if matches(if_none_match, etag):
+        return not_modified(etag)
+    try:
+        rows, get_pagination = stream_event_query(**kwargs)
+    except ValueError as exc:
+        return error(str(exc), 400)
+    except ReportRejected as exc:
+        return error(str(exc), exc.status)
+
+    def generate():
+        for row in rows:
+            yield encoder.dumps(row)
+        yield encoder.dumps({"pagination": get_pagination()})
+
+    response = Response(generate(), mimetype=NDJSON_MIMETYPE,
+                        headers={"ETag": etag})
+    if hasattr(rows, "close"):
+        # Releases the report slot, even when the rows were never read
+        response.call_on_close(rows.close)
+    return response
+
+
+def get_cache_stats():
+    return report_cache.stats(), 200
+
+
+def get_slow_reports(limit=10):
+    return slow_reports.stats(limit), 200
@@ -1,5 +1,12 @@
+import io
+import itertools
+import json
 import uuid
 
+from werkzeug.wsgi import get_input_stream
+
+STREAMED_BODY_KEY = "app.streamed_body"
+
 
 def error(message, code):
     return {"message": message}, code
@@ -11,3 +18,65 @@ def is_valid_uuid(uuid_string):
         return True
     except ValueError:
         return False
+
+
+def iter_lines(data):
+    """
+    The lines of a body, without copying it: bytes and str are sliced, file
+    like streams are read one line at a time
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if not isinstance(data, bytes):
+        yield from data
+        return
+
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start)
+        if end < 0:
+            end = len(data)
+        yield data[start:end]
+        start = end + 1
+
+
+def read_ndjson(data):
+    """
+    Decodes newline delimited JSON lazily, one line at a time.
+    Lines which are not valid JSON are yielded as None
+    """
+    for line in iter_lines(data):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def stream_body(wsgi_app, path, mimetype):
+    """
+    WSGI middleware: Connexion reads the whole body of a request before
+    calling its handler, the bodies of mimetype posted to path are moved to
+    environ[STREAMED_BODY_KEY] instead, so the handler reads them line by
+    line as they arrive
+    """
+    def middleware(environ, start_response):
+        if (environ.get("REQUEST_METHOD") == "POST"
+                and environ.get("PATH_INFO") == path
+                and environ.get("CONTENT_TYPE", "").split(";")[0].strip()
+                == mimetype):
+            environ[STREAMED_BODY_KEY] = get_input_stream(environ)
+            environ["wsgi.input"] = io.BytesIO()
+            environ["CONTENT_LENGTH"] = "0"
+        return wsgi_app(environ, start_response)
+    return middleware
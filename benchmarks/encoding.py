@@ -0,0 +1,90 @@
+"""
+Encode time per 1k rows and bytes on the wire of the report and event
+payloads, for the indented json Connexion wrote before, the compact json
+module and orjson, sent as they are, gzipped and with brotli:
+
+    python -m benchmarks.encoding [ROWS]
+"""
+import datetime
+import json
+import random
+import sys
+import timeit
+
+from app.view import compression, encoding
+from app.view.encoding import JsonEncoder, OrjsonEncoder
+
+from .normalize import get_grouped_rows, project
+
+
+def get_events(count, seed=0):
+    rand = random.Random(seed)
+    start = datetime.datetime(2019, 1, 1)
+    for index in range(count):
+        yield {
+            "id": f"{index:08x}-0000-4000-8000-000000000000",
+            "client": rand.randint(100, 1000),
+            "client_group": rand.randint(10, 20),
+            "device_type": rand.choice(["desktop", "mobile"]),
+            "category": rand.randint(100, 1000),
+            "valid": rand.choice([True, False]),
+            "value": rand.random() * 100,
+            "timestamp": start + datetime.timedelta(
+                seconds=rand.randint(0, 86400 * 30)),
+        }
+
+
+def connexion_dumps(data):
+    """
+    What Connexion did: the json module, indented
+    """
+    return (json.dumps(data, indent=2, default=encoding.default) +
+            "\n").encode()
+
+
+def get_encoders():
+    encoders = {"connexion (indented json)": connexion_dumps,
+                "json (compact)": JsonEncoder().dumps}
+    if encoding.orjson is not None:
+        encoders["orjson"] = OrjsonEncoder().dumps
+    return encoders
+
+
+def measure(func, payload, rows, repeat=5):
+    """
+    Best time of encoding the payload, in milliseconds per 1k rows
+    """
+    best = min(timeit.repeat(lambda: func(payload), number=1, repeat=repeat))
+    return best * 1000 / rows * 1000
+
+
+def get_sizes(data):
+    sizes = {"identity": len(data),
+             "gzip": len(compression.compress(data, compression.GZIP))}
+    if compression.brotli is not None:
+        sizes["br"] = len(compression.compress(data, compression.BROTLI))
+    return sizes
+
+
+def main(count=1000):
+    payloads = {
+        "report": {"rows": [project(row) for row in get_grouped_rows(count)],
+                   "pagination": {"offset": 0, "page_size": count,
+                                  "total_count": count * 10}},
+        "events": list(get_events(count)),
+    }
+    for name, payload in payloads.items():
+        print(f"{name}, {count} rows")
+        for encoder_name, func in get_encoders().items():
+            encode_ms = measure(func, payload, count)
+            sizes = "  ".join(f"{encoding_name} {size:>9,} B"
+                              for encoding_name, size in
+                              get_sizes(func(payload)).items())
+            print(f"  {encoder_name:26} {encode_ms:8.3f} ms/1k rows  "
+                  f"{sizes}")
+    if compression.brotli is None:
+        print("brotli is not installed")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,48 @@
+"""
+Throughput of GET /export in every available format, against paging the
+same events one by one with GET /event/{id} as JSON. Runs through the Flask
+app on the configured database, load it first with app.data.loader:
+
+    python -m benchmarks.export [PAGED_EVENTS]
+"""
+import sys
+import time
+
+from app.api.export import get_formats
+from app.api.query2 import collection
+
+
+def measure_export(client, export_format, rows):
+    started = time.perf_counter()
+    response = client.get(f"/export?format={export_format}")
+    size = sum(len(chunk) for chunk in response.response)
+    seconds = time.perf_counter() - started
+    return rows / seconds, size
+
+
+def measure_paging(client, ids):
+    started = time.perf_counter()
+    for event_id in ids:
+        client.get(f"/event/{event_id}").get_json()
+    return len(ids) / (time.perf_counter() - started)
+
+
+def main(paged_events=1000):
+    from main import app
+
+    client = app.app.test_client()
+    rows = collection.count_documents({})
+    ids = [document["_id"]
+           for document in collection.find({}, {"_id": 1}).limit(paged_events)]
+
+    print(f"{rows} events")
+    for export_format in get_formats():
+        rate, size = measure_export(client, export_format, rows)
+        print(f"export {export_format:8} {rate:12,.0f} rows/sec "
+              f"{size / max(rows, 1):8.1f} bytes/row")
+    rate = measure_paging(client, ids)
+    print(f"paging json     {rate:12,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
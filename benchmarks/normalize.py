@@ -0,0 +1,114 @@
+"""
+Per row cost of turning grouped report rows into the rows of the response,
+before (a benedict keypath lookup per field in the view) and after (rows
+shaped by the $project stage of the pipeline, then the view). Both start
+from the same grouped rows; the $project stage runs in MongoDB, its python
+equivalent is timed instead, which overstates the "after" cost:
+
+    python -m benchmarks.normalize [ROWS]
+"""
+import random
+import sys
+import timeit
+
+from app.view.reports import normalize_report_query
+
+try:
+    from benedict import benedict
+except ImportError:  # Only needed for the "before" numbers
+    benedict = None
+
+
+def get_grouped_rows(count, seed=0):
+    rand = random.Random(seed)
+    for _ in range(count):
+        yield {
+            "_id": {
+                "client": rand.randint(100, 1000),
+                "client_group": rand.randint(10, 20),
+                "device_type": rand.choice(["desktop", "mobile", None]),
+                "category": rand.choice([rand.randint(100, 1000), None]),
+                "valid": rand.choice([True, False]),
+            },
+            "mean": rand.random() * 100,
+            "sum": rand.random() * 1000,
+            "count": rand.randint(1, 100),
+        }
+
+
+def project(row):
+    """
+    Python equivalent of the $project stage
+    """
+    group_id = row["_id"]
+    return {
+        "category": group_id.get("category") or 0,
+        "client": group_id.get("client") or 0,
+        "client_group": group_id.get("client_group") or 0,
+        "valid": group_id.get("valid"),
+        "device_type": group_id.get("device_type"),
+        "day": "2019-01-01",
+        "mean": row["mean"],
+        "sum": row["sum"],
+        "count": row["count"],
+    }
+
+
+def legacy_get_value_or_default(dictionary, path, default=None):
+    ben_dict = benedict(dictionary)
+    if path not in ben_dict:
+        return default
+    else:
+        return ben_dict[path] or default
+
+
+def legacy_normalize_report_query(results):
+    get = legacy_get_value_or_default
+    return [
+        {
+            "category": get(result, "_id.category", 0),
+            "client": get(result, "_id.client", 0),
+            "client_group": get(result, "_id.client_group", 0),
+            "valid": get(result, "_id.valid", None),
+            "device_type": get(result, "_id.device_type"),
+            "day": "2019-01-01",
+            "mean": get(result, "mean", 0.0),
+            "sum": get(result, "sum", 0.0),
+        }
+        for result in results
+    ]
+
+
+def project_and_normalize(rows):
+    """
+    The "after" path end to end
+    """
+    return normalize_report_query([project(row) for row in rows])
+
+
+def measure(func, rows, repeat=3):
+    """
+    Returns the best per row time of func over rows, in microseconds
+    """
+    best = min(timeit.repeat(lambda: func(rows), number=1, repeat=repeat))
+    return best / len(rows) * 1e6
+
+
+def main(count=10000):
+    rows = list(get_grouped_rows(count))
+    projected_rows = [project(row) for row in rows]
+
+    if benedict is not None:
+        before = measure(legacy_normalize_report_query, rows)
+        print(f"before (benedict per field):  {before:10.3f} us/row")
+    else:
+        print("before: python-benedict is not installed")
+
+    after = measure(project_and_normalize, rows)
+    print(f"after ($project, then view):  {after:10.3f} us/row")
+    view = measure(normalize_report_query, projected_rows)
+    print(f"  of which in the view:       {view:10.3f} us/row")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
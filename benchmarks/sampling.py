@@ -0,0 +1,89 @@
+"""
+Latency and error of the approximate /report mode (sample_rate) against the
+exact report, on generated datasets of growing size. Every size is loaded
+into a scratch collection of the configured database, dropped at the end,
+and the reports are grouped from the raw events (no rollups):
+
+    python -m benchmarks.sampling [SAMPLE_RATE] [--sizes 100000 1000000]
+"""
+import argparse
+import statistics
+import time
+
+from app.api import query2
+from app.data.connections import connections
+from app.data.generator import EventGenerator, to_documents
+from app.data.loader import insert_documents
+
+SCRATCH_COLLECTION_NAME = "events_sampling_benchmark"
+DAYS = 30
+OPTIONS = {"group_by": ["client_group", "device_type"], "limit": 100}
+
+
+def load(collection, size, seed=0):
+    collection.drop()
+    for batch in EventGenerator(seed).get_batches(DAYS, size // DAYS):
+        insert_documents(collection, to_documents(batch, id_key="_id"))
+    return collection.count_documents({})
+
+
+def measure(options, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows, _ = query2.query_events(dict(options))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, rows
+
+
+def get_key(row):
+    return tuple(row[name] for name in OPTIONS["group_by"])
+
+
+def get_errors(exact, approximate):
+    """
+    Median relative error of the sums and share of the exact sums inside
+    their confidence interval
+    """
+    estimates = {get_key(row): row for row in approximate}
+    errors, covered = [], 0
+    for row in exact:
+        estimate = estimates.get(get_key(row))
+        if estimate is None or not row["sum"]:
+            continue
+        errors.append(abs(estimate["sum"] - row["sum"]) / abs(row["sum"]))
+        low, high = estimate["confidence"]["sum"]
+        covered += low <= row["sum"] <= high
+    if not errors:
+        return float("nan"), float("nan")
+    return statistics.median(errors), covered / len(errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sampling")
+    parser.add_argument("sample_rate", type=float, nargs="?", default=0.1)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    collection = connections.collection(SCRATCH_COLLECTION_NAME)
+    query2.collection = collection
+    query2.USE_ROLLUPS = False
+    try:
+        for size in args.sizes:
+            events = load(collection, size)
+            exact_ms, exact = measure(OPTIONS, args.repeat)
+            sampled_ms, sampled = measure(
+                dict(OPTIONS, sample_rate=args.sample_rate), args.repeat)
+            error, coverage = get_errors(exact, sampled)
+            print(f"{events:>10,} events  exact {exact_ms:9.1f} ms  "
+                  f"sampled {sampled_ms:9.1f} ms  "
+                  f"x{exact_ms / sampled_ms:5.1f}  "
+                  f"sum error {error:6.2%}  in interval {coverage:6.1%}")
+    finally:
+        collection.drop()
+
+
+if __name__ == "__main__":
+    main()
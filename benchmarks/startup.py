@@ -0,0 +1,51 @@
+"""
+Time from a fresh interpreter to the first served request: importing the
+app, loading the spec and answering an endpoint that doesn't need MongoDB.
+Also tells whether a MongoDB client was created on the way:
+
+    python -m benchmarks.startup [RUNS]
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.app.app.test_client().get("/report/cache")
+served = time.perf_counter()
+from app.data.connections import connections
+print(json.dumps({
+    "import": imported - started,
+    "first_request": served - imported,
+    "total": served - started,
+    "status": response.status_code,
+    "connected": connections.is_connected,
+}))
+"""
+
+
+def measure_startup():
+    """
+    Runs one cold start in a subprocess and returns its timings in seconds
+    """
+    output = subprocess.check_output([sys.executable, "-c", SCRIPT],
+                                     cwd=ROOT, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main(runs=5):
+    results = [measure_startup() for _ in range(runs)]
+    for key in ["import", "first_request", "total"]:
+        best = min(result[key] for result in results)
+        print(f"{key + ':':15} {best * 1000:8.1f} ms")
+    print(f"connected:      {any(result['connected'] for result in results)}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
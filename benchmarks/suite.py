@@ -0,0 +1,212 @@
+"""
+Microbenchmarks of the hot paths: building the report pipelines, normalizing
+and encoding the report rows and the model conversions. Every case runs over
+a fixed set of generated inputs and is compared with the recorded baselines:
+
+    python -m benchmarks.suite                   # exits 1 on a regression
+    python -m benchmarks.suite --save            # records new baselines
+    python -m benchmarks.suite --threshold 0.5   # allowed slowdown, 0.5=50%
+
+Times are stored relative to a calibration loop, so baselines recorded on
+one machine still mean something on another one
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import timeit
+
+from app.api import query2
+from app.api.optimizer import optimize_pipeline
+from app.api.query import EventMongoQuery
+from app.data.models import EventDocument
+from app.view.encoding import encoder
+from app.view.reports import normalize_report_query
+
+from .normalize import get_grouped_rows, project
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_THRESHOLD = 0.3
+OPTION_SETS = 500
+ROWS = 2000
+DOCUMENTS = 2000
+
+GROUPS = ["client", "client_group", "device_type", "category", "valid", "date"]
+START_DATE = datetime.datetime(2019, 1, 1)
+
+
+def get_option_sets(count, seed=0):
+    """
+    Report options like the API receives them: a few groups, an order and
+    sometimes a time range and filters
+    """
+    rand = random.Random(seed)
+    for _ in range(count):
+        group_by = rand.sample(GROUPS, rand.randint(1, 4))
+        order_by = [
+            rand.choice(["", "-"]) + name
+            for name in rand.sample(group_by, rand.randint(0, len(group_by)))
+        ]
+        options = {"group_by": group_by, "order_by": order_by,
+                   "offset": rand.randint(0, 100),
+                   "limit": rand.choice([5, 20, 100])}
+        if rand.random() < 0.7:
+            start_date = START_DATE + datetime.timedelta(
+                hours=rand.randint(0, 24 * 60))
+            end_date = start_date + datetime.timedelta(
+                hours=rand.randint(1, 24 * 30))
+            options.update(start_date=start_date, end_date=end_date)
+        if rand.random() < 0.5:
+            options["clients"] = rand.sample(range(100, 1000),
+                                             rand.randint(1, 5))
+        if rand.random() < 0.3:
+            options["device_types"] = rand.sample(["desktop", "mobile"], 1)
+        if rand.random() < 0.3:
+            options["valid"] = rand.choice([True, False])
+        yield options
+
+
+def get_documents(count, seed=0):
+    rand = random.Random(seed)
+    for index in range(count):
+        yield EventDocument({
+            "id": f"{index:08x}-0000-4000-8000-000000000000",
+            "client": rand.randint(100, 1000),
+            "client_group": rand.randint(10, 20),
+            "device_type": rand.choice(["desktop", "mobile"]),
+            "category": rand.randint(100, 1000),
+            "valid": rand.choice([True, False]),
+            "value": rand.random() * 100,
+            "timestamp": START_DATE.isoformat(),
+        })
+
+
+def get_cases():
+    """
+    Returns {name: (function, inputs)}, the function is called once per
+    input and the case is timed per call
+    """
+    option_sets = list(get_option_sets(OPTION_SETS))
+    pipelines = [query2.build_pipeline(**options) for options in option_sets]
+    rows = [project(row) for row in get_grouped_rows(ROWS)]
+    documents = list(get_documents(DOCUMENTS))
+    return {
+        "query2.build_pipeline": (
+            lambda options: query2.build_pipeline(**options), option_sets),
+        "query2.get_match_query": (query2.get_match_query, option_sets),
+        "optimizer.optimize_pipeline": (optimize_pipeline, pipelines),
+        "query2.get_sort_query": (query2.get_sort_query, option_sets),
+        "query.EventMongoQuery.build_pipeline": (
+            lambda options: EventMongoQuery(**options).build_pipeline(),
+            option_sets),
+        # One call normalizes a whole report page of ROWS rows
+        "reports.normalize_report_query": (normalize_report_query, [rows]),
+        "encoding.encoder.dumps": (encoder.dumps, [{"rows": rows}]),
+        # The events are written with their buckets derived
+        "models.EventDocument.mongo": (EventDocument.mongo, documents),
+        "models.EventDocument.serialize": (EventDocument.serialize,
+                                           documents),
+        "models.EventDocument.pop_keys": (
+            lambda document: document.pop_keys(["id", "_id"]), documents),
+    }
+
+
+def calibrate(repeat=5):
+    """
+    Best time of a fixed pure python workload, in microseconds
+    """
+    def workload():
+        total = 0
+        for number in range(10000):
+            total += number % 7
+        return total
+    return min(timeit.repeat(workload, number=1, repeat=repeat)) * 1e6
+
+
+def measure(func, inputs, repeat=5):
+    """
+    Best time of one call of func over the inputs, in microseconds
+    """
+    def run():
+        for value in inputs:
+            func(value)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(inputs) * 1e6
+
+
+def run_cases(cases, repeat=5):
+    calibration = calibrate(repeat)
+    results = {}
+    for name, (func, inputs) in cases.items():
+        time = measure(func, inputs, repeat)
+        results[name] = {"us": round(time, 4),
+                         "relative": round(time / calibration, 9)}
+    return {"calibration_us": round(calibration, 4), "cases": results}
+
+
+def compare(results, baselines, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns {name: slowdown} for the cases slower than their baseline by
+    more than the threshold, a slowdown of 0.5 is 50% slower
+    """
+    regressions = {}
+    for name, result in results["cases"].items():
+        baseline = baselines["cases"].get(name)
+        if not baseline:
+            continue
+        slowdown = result["relative"] / baseline["relative"] - 1
+        if slowdown > threshold:
+            regressions[name] = slowdown
+    return regressions
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as baselines_file:
+        return json.load(baselines_file)
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    with open(path, "w") as baselines_file:
+        json.dump(results, baselines_file, indent=2, sort_keys=True)
+        baselines_file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--save", action="store_true",
+                        help="record the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    args = parser.parse_args(argv)
+
+    results = run_cases(get_cases(), args.repeat)
+    baselines = load_baselines(args.baselines)
+    regressions = compare(results, baselines, args.threshold) \
+        if baselines else {}
+
+    for name, result in results["cases"].items():
+        line = f"{name:40} {result['us']:12.3f} us"
+        if baselines and name in baselines["cases"]:
+            change = result["relative"] / \
+                baselines["cases"][name]["relative"] - 1
+            line += f" {change:+8.1%}"
+        if name in regressions:
+            line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        save_baselines(results, args.baselines)
+        print(f"Saved baselines to {args.baselines}")
+        return 0
+    if baselines is None:
+        print("No baselines yet, record them with --save")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""
+Production serving mode:
+
+    gunicorn main:application
+
+Worker and thread counts come from the environment. The master process
+never imports the application (no preload_app), so every worker imports it
+after the fork and creates its own MongoClient and connection pool. Each
+worker opens at most MONGO_MAX_POOL_SIZE connections, size it so that
+workers * MONGO_MAX_POOL_SIZE stays below what MongoDB accepts.
+"""
+import logging
+import multiprocessing
+import os
+
+bind = "0.0.0.0:{}".format(os.environ.get("PORT", 5000))
+workers = int(os.environ.get("WEB_CONCURRENCY",
+                             multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+preload_app = False
+
+
+def post_worker_init(worker):
+    from app.api.indexes import ensure_indexes
+    from pymongo.errors import PyMongoError
+
+    # Idempotent, a worker that can't reach MongoDB still boots and /ready
+    # reports it as unavailable
+    try:
+        ensure_indexes()
+    except PyMongoError:
+        logging.exception("Could not ensure the indexes")
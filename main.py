@@ -3,14 +3,27 @@ import connexion
 import json
 import logging
 
-from flask import Response
+from flask import Response, request
 from werkzeug.exceptions import HTTPException
 
+from app.api.indexes import ensure_indexes
+from app.metrics import timed
 from app.settings import PORT, DEBUG
-from app.view.reports import get as aggregated_report_view
+from app.view.compression import compress_response
+from app.view.encoding import encoder
+from app.view.reports import (NDJSON_MIMETYPE,
+                              get as aggregated_report_view,
+                              get_cache_stats as report_cache_view,
+                              get_slow_reports as slow_reports_view,
+                              stream as streamed_report_view)
+from app.view.exports import get as export_view
+from app.view.health import ready as ready_view
+from app.view.metrics import get as metrics_view
 from app.view.events import (get as get_view,
                              create as create_view,
+                             create_many as create_many_view,
                              delete as delete_view)
+from app.view.utils import STREAMED_BODY_KEY, stream_body
 
 
 def generic_error(exception):
@@ -21,21 +34,66 @@ def generic_error(exception):
     )
 
 
+def compress(response):
+    return compress_response(response, request.headers.get("Accept-Encoding"))
+
+
+@timed("get_report")
 def get_report(**kwargs):
     logging.info(f"kwargs: {kwargs}")
-    return aggregated_report_view(**kwargs)
+    mimetypes = ["application/json", NDJSON_MIMETYPE]
+    if_none_match = request.headers.get("If-None-Match")
+    if request.accept_mimetypes.best_match(mimetypes) == NDJSON_MIMETYPE:
+        return streamed_report_view(if_none_match, **kwargs)
+    return aggregated_report_view(if_none_match, **kwargs)
+
+
+@timed("export_events")
+def export_events(**kwargs):
+    logging.info(f"kwargs: {kwargs}")
+    return export_view(**kwargs)
+
+
+def get_ready():
+    return ready_view()
+
 
+def get_metrics():
+    data, status, mimetype = metrics_view()
+    return Response(data, status=status, content_type=mimetype)
 
+
+def get_report_cache():
+    return report_cache_view()
+
+
+def get_slow_reports(limit=10):
+    return slow_reports_view(limit)
+
+
+@timed("create_event")
 def create_event(body):
     logging.info(f"body: {body}")
     return create_view(body)
 
 
+@timed("create_events")
+def create_events(body=None):
+    stream = request.environ.get(STREAMED_BODY_KEY)
+    if stream is not None:
+        logging.info("body: streamed")
+        return create_many_view(stream, NDJSON_MIMETYPE)
+    logging.info(f"body: {request.content_length} bytes")
+    return create_many_view(body, request.mimetype)
+
+
+@timed("get_event")
 def get_event(event_id):
     logging.info(f"event_id: {event_id}")
-    return get_view(event_id)
+    return get_view(event_id, request.headers.get("If-None-Match"))
 
 
+@timed("delete_event")
 def delete_event(event_id):
     logging.info(f"event_id: {event_id}")
     return delete_view(event_id)
@@ -44,8 +102,13 @@ def delete_event(event_id):
 logging.basicConfig(level=logging.INFO)
 
 app = connexion.App(__name__, specification_dir="swagger/")
+app.api_cls.jsonifier = encoder
 app.add_api("spec.yml")
+app.app.after_request(compress)
 app.add_error_handler(HTTPException, generic_error)
+app.app.wsgi_app = stream_body(app.app.wsgi_app, "/events", NDJSON_MIMETYPE)
+application = app.app  # WSGI callable, see gunicorn.conf.py
 
 if __name__ == "__main__":
+    ensure_indexes()
     app.run(port=PORT, debug=DEBUG)  # TODO: Move to settings
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+asyncio serving mode: the same API served by aiohttp, with the motor driver,
+so one process keeps many requests in flight while they wait on MongoDB.
+
+    python3 main_async.py
+
+Reports are always returned as JSON documents in this mode.
+"""
+import connexion
+import logging
+
+from aiohttp import web
+from connexion import NoContent
+from connexion.lifecycle import ConnexionResponse
+from connexion.resolver import Resolver
+
+from app.api.indexes import ensure_indexes
+from app.metrics import timed
+from app.settings import PORT
+from app.view import async_views, compression, metrics
+from app.view.encoding import encoder
+from app.view.events import JSON_MIMETYPE, NDJSON_MIMETYPE
+from app.view.reports import (get_cache_stats,
+                              get_slow_reports as slow_reports_view)
+
+
+def to_response(result):
+    """
+    Views return (body, status), (body, status, headers),
+    (data, status, mimetype) for bytes or a response they streamed
+    """
+    if isinstance(result, web.StreamResponse):
+        return result
+    headers = None
+    if len(result) == 3 and not isinstance(result[2], dict):
+        data, status, mimetype = result
+    else:
+        body, status = result[:2]
+        headers = result[2] if len(result) == 3 else None
+        mimetype = JSON_MIMETYPE
+        data = b"" if body is NoContent else encoder.encode(body)
+    return ConnexionResponse(status_code=status, mimetype=mimetype, body=data,
+                             headers=headers)
+
+
+@web.middleware
+async def compress(request, handler):
+    response = await handler(request)
+    body = getattr(response, "body", None)
+    if isinstance(body, bytes):
+        response.body = compression.compress_body(
+            body, response.status, response.content_type, response.headers,
+            request.headers.get("Accept-Encoding"))
+    return response
+
+
+@timed("get_report")
+async def get_report(request, **kwargs):
+    logging.info(f"kwargs: {kwargs}")
+    return to_response(await async_views.get_report(
+        request.headers.get("If-None-Match"), **kwargs))
+
+
+@timed("export_events")
+async def export_events(request, **kwargs):
+    logging.info(f"kwargs: {kwargs}")
+    return to_response(await async_views.export(request, **kwargs))
+
+
+async def get_ready():
+    return to_response(await async_views.ready())
+
+
+async def get_metrics():
+    return to_response(metrics.get())
+
+
+async def get_report_cache():
+    return to_response(get_cache_stats())
+
+
+async def get_slow_reports(limit=10):
+    return to_response(slow_reports_view(limit))
+
+
+@timed("create_event")
+async def create_event(body):
+    logging.info(f"body: {body}")
+    return to_response(await async_views.create(body))
+
+
+@timed("create_events")
+async def create_events(body, request):
+    logging.info(f"body: {request.content_length} bytes")
+    mimetype = NDJSON_MIMETYPE if request.content_type == NDJSON_MIMETYPE \
+        else JSON_MIMETYPE
+    return to_response(await async_views.create_many(body, mimetype))
+
+
+@timed("get_event")
+async def get_event(event_id, request):
+    logging.info(f"event_id: {event_id}")
+    return to_response(await async_views.get(
+        event_id, request.headers.get("If-None-Match")))
+
+
+@timed("delete_event")
+async def delete_event(event_id):
+    logging.info(f"event_id: {event_id}")
+    return to_response(await async_views.delete(event_id))
+
+
+def resolve(operation_id):
+    """
+    The spec points to "main.<name>", serve the handlers of this module
+    """
+    return globals()[operation_id.rsplit(".", 1)[-1]]
+
+
+logging.basicConfig(level=logging.INFO)
+
+app = connexion.AioHttpApp(__name__, specification_dir="swagger/",
+                           only_one_api=True)
+app.api_cls.jsonifier = encoder
+# The handlers with a "request" argument get the aiohttp request, for its
+# headers. So do the ones with **kwargs, they take it as an argument
+app.add_api("spec.yml", resolver=Resolver(resolve),
+            pass_context_arg_name="request")
+app.app.middlewares.append(compress)
+
+if __name__ == "__main__":
+    ensure_indexes()
+    app.run(port=PORT)
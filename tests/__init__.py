@@ -1,4 +1,42 @@
 from app.data.models import *
 from app.api.query import *
 from app.settings import *
-from app.api.query2 import build_pipeline
+from app.api.query2 import (build_pipeline,
+                            get_match_query,
+                            build_rollup_pipeline,
+                            can_use_rollups,
+                            count_only_pipeline,
+                            count_pipeline,
+                            decode_cursor,
+                            encode_cursor,
+                            get_group_sort_query,
+                            get_keyset_query,
+                            get_row_projection,
+                            get_sample_rate,
+                            normalize_options,
+                            verify_options)
+from app.api.cache import MemoryBackend, ReportCache
+from app.data import buckets, rollups
+from app.view.utils import STREAMED_BODY_KEY, chunked, read_ndjson, stream_body
+from app.view import compression, encoding, etags, events
+from app.view.encoding import JsonEncoder, OrjsonEncoder
+from app.api import indexes
+from app.data.pool import PoolStatsListener
+from app.data.connections import ConnectionRegistry, LazyCollection, connections
+from app.api import export
+from app.data.commands import CommandMetricsListener
+from app.metrics import COMMAND_DOCUMENTS, COMMAND_ERRORS
+from app.api.slow_reports import (SlowReportLog,
+                                  get_docs_examined,
+                                  get_fingerprint)
+from app.api.optimizer import optimize_pipeline
+from app.api import guardrails
+from app.api.guardrails import (AdmissionControl,
+                                GuardedRows,
+                                ReportRejected,
+                                estimate_cost)
+from app.api import sampling
+from app.data import partitions
+from app.data.partitions import PartitionedCollection
+from app.data import retention
+from app.data.generations import WriteGeneration
@@ -0,0 +1,40 @@
+from .. import MemoryBackend, ReportCache
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=10, ttl=60)
+    backend.set("a", 1, 4)
+    backend.set("b", 2, 4)
+    assert backend.get("a") == 1
+    backend.set("c", 3, 4)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1
+    assert backend.get("c") == 3
+    assert backend.stats() == {"entries": 2, "bytes": 8, "evictions": 1}
+
+
+def test_memory_backend_skips_values_larger_than_the_bound():
+    backend = MemoryBackend(max_bytes=10, ttl=60)
+    backend.set("a", 1, 11)
+    assert backend.get("a") is None
+
+
+def test_memory_backend_expires_entries():
+    backend = MemoryBackend(max_bytes=10, ttl=0)
+    backend.set("a", 1, 4)
+    assert backend.get("a") is None
+    assert backend.stats() == {"entries": 0, "bytes": 0, "evictions": 1}
+
+
+def test_report_cache_is_invalidated_by_the_write_generation():
+    cache = ReportCache(MemoryBackend(max_bytes=1000, ttl=60))
+    results = iter([["first"], ["second"]])
+
+    def compute():
+        return next(results)
+
+    assert cache.get_or_compute({"limit": 5}, 1, compute) == ["first"]
+    assert cache.get_or_compute({"limit": 5}, 1, compute) == ["first"]
+    assert cache.get_or_compute({"limit": 5}, 2, compute) == ["second"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
@@ -0,0 +1,37 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.api import columnar_query  # noqa
+from app.api.query2 import encode_cursor  # noqa
+
+
+def get_rows(*clients):
+    return [{"_id": {"client": client}, "mean": None, "sum": 0.0, "count": 1}
+            for client in clients]
+
+
+def test_compare_values_follows_the_bson_order():
+    values = [datetime.datetime(2019, 1, 1), True, "a", 2.5, 1, None]
+    ordered = sorted(values, key=columnar_query.functools.cmp_to_key(
+        columnar_query.compare_values))
+    assert ordered == [None, 1, 2.5, "a", True, datetime.datetime(2019, 1, 1)]
+
+
+def test_get_page_rows_sorts_skips_and_limits():
+    options = {"group_by": ["client"], "order_by": ["-client"],
+               "offset": 1, "limit": 2}
+    rows = columnar_query.get_page_rows(options, get_rows(1, None, 3, 2))
+    assert [row["client"] for row in rows] == [2, 1]
+    assert rows[0]["mean"] == 0.0 and rows[0]["day"] is None
+
+
+def test_get_cursor_rows_start_after_the_cursor():
+    options = {"group_by": ["client"], "limit": 5,
+               "cursor": encode_cursor({"client": 1})}
+    rows = columnar_query.get_cursor_rows(options, get_rows(3, None, 1, 2))
+    assert [row["_id"]["client"] for row in rows] == [3, 2]
+    rows = columnar_query.get_page_rows(options, rows)
+    assert [row["client"] for row in rows] == [2, 3]
@@ -0,0 +1,66 @@
+import datetime
+
+import pytest
+
+from .. import MONGO_DB_NAME, buckets, connections, rollups
+
+pytest.importorskip("numpy")
+
+from app.api import columnar_query, query2  # noqa
+from app.data.columnar import store  # noqa
+from app.data.generator import EventGenerator, to_documents  # noqa
+from benchmarks.suite import get_option_sets  # noqa
+
+TEST_COLLECTION = connections.collection("events")
+TEST_ROLLUP_COLLECTION = connections.collection("events_daily")
+
+
+def setup_module(module):
+    connections.configure(database_name="test")
+    TEST_COLLECTION.delete_many({})
+    generator = EventGenerator(5, today=datetime.datetime(2019, 3, 1))
+    for batch in generator.get_batches(60, 40, batch_size=500):
+        TEST_COLLECTION.insert_many([
+            buckets.add_buckets(document)
+            for document in to_documents(batch, id_key="_id")])
+    rollups.rebuild(TEST_COLLECTION)
+    store.load(TEST_COLLECTION)
+
+
+def teardown_module(module):
+    TEST_COLLECTION.delete_many({})
+    TEST_ROLLUP_COLLECTION.delete_many({})
+    store.clear()
+    connections.configure(database_name=MONGO_DB_NAME)
+
+
+def query_both(options):
+    return (query2.query_events(dict(options, group_by=list(
+                options["group_by"]))),
+            columnar_query.query_events(dict(options, group_by=list(
+                options["group_by"]))))
+
+
+def assert_same_page(mongo_page, columnar_page):
+    (mongo_rows, mongo_pagination) = mongo_page
+    (columnar_rows, columnar_pagination) = columnar_page
+    assert columnar_pagination == mongo_pagination
+    assert len(columnar_rows) == len(mongo_rows)
+    for columnar_row, mongo_row in zip(columnar_rows, mongo_rows):
+        assert columnar_row == pytest.approx(mongo_row)
+
+
+@pytest.mark.parametrize("options", list(get_option_sets(100, seed=7)))
+def test_columnar_report_matches_the_mongo_pipeline(options):
+    assert_same_page(*query_both(options))
+
+
+@pytest.mark.parametrize("options", list(get_option_sets(20, seed=8)))
+def test_columnar_report_follows_the_mongo_cursor(options):
+    options.pop("offset")
+    mongo_page, columnar_page = query_both(options)
+    while mongo_page[1]["cursor"]:
+        assert_same_page(mongo_page, columnar_page)
+        options["cursor"] = mongo_page[1]["cursor"]
+        mongo_page, columnar_page = query_both(options)
+    assert_same_page(mongo_page, columnar_page)
@@ -0,0 +1,89 @@
+import csv
+import datetime
+import io
+
+import pytest
+
+from .. import export
+
+EVENTS = [
+    {"_id": "a", "client": 1, "client_group": 2, "device_type": "mobile",
+     "category": None, "valid": True,
+     "timestamp": datetime.datetime(2019, 1, 1, 10), "value": 1.5},
+    {"_id": "b", "client": 3, "timestamp": "2019-01-02T10:00:00Z"},
+    {"_id": "c", "client": 4, "timestamp": "not a date", "value": 2.0},
+    {"_id": "d", "client": 5, "timestamp": "2019-01-02T10:00:00+02:00"},
+]
+
+
+def encode(export_format, batch_size=2):
+    batches = export.get_batches(iter(EVENTS), batch_size)
+    return list(export.ENCODERS[export_format](batches))
+
+
+def test_export_parses_timestamps():
+    assert export.parse_timestamp("2019-01-02T10:00:00.5Z") == \
+        datetime.datetime(2019, 1, 2, 10, 0, 0, 500000)
+    assert export.parse_timestamp("2019-01-02") == datetime.datetime(2019, 1, 2)
+    assert export.parse_timestamp("2019-01-02T10:00:00.123456789Z") == \
+        datetime.datetime(2019, 1, 2, 10, 0, 0, 123456)
+    assert export.parse_timestamp("not a date") is None
+    assert export.parse_timestamp(None) is None
+
+
+def test_export_normalizes_offset_timestamps_to_utc():
+    assert export.parse_timestamp("2019-01-02T10:00:00+02:00") == \
+        datetime.datetime(2019, 1, 2, 8)
+    assert export.parse_timestamp("2019-01-02T01:30:00.5-03:00") == \
+        datetime.datetime(2019, 1, 2, 4, 30, 0, 500000)
+    offset = datetime.timezone(datetime.timedelta(hours=2))
+    assert export.parse_timestamp(
+        datetime.datetime(2019, 1, 2, 10, tzinfo=offset)) == \
+        datetime.datetime(2019, 1, 2, 8)
+
+
+def test_export_match_query_matches_both_timestamp_types():
+    match_query = export.get_match_query({"clients": [1],
+                                          "start_date": "2019-01-02"})
+    assert match_query == {
+        "client": {"$in": [1]},
+        "$or": [
+            {"timestamp": {"$gte": datetime.datetime(2019, 1, 2)}},
+            {"timestamp": {"$gte": "2019-01-02T00:00:00"}},
+        ],
+    }
+
+
+def test_export_rejects_unknown_filters_and_formats():
+    with pytest.raises(ValueError):
+        export.verify_options({"group_by": ["client"]}, export.CSV)
+    with pytest.raises(ValueError):
+        export.verify_options({}, "xml")
+
+
+def test_export_csv_is_written_batch_by_batch():
+    chunks = encode(export.CSV)
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert [row["id"] for row in rows] == ["a", "b", "c", "d"]
+    assert rows[0]["timestamp"] == "2019-01-01T10:00:00Z"
+    assert rows[1]["timestamp"] == "2019-01-02T10:00:00Z"
+    assert rows[2]["timestamp"] == ""
+    assert rows[3]["timestamp"] == "2019-01-02T08:00:00Z"
+
+
+@pytest.mark.parametrize("export_format", [export.ARROW, export.PARQUET])
+def test_export_arrow_formats_round_trip(export_format):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet  # noqa
+
+    data = b"".join(encode(export_format, batch_size=1))
+    if export_format == export.ARROW:
+        table = pyarrow.ipc.open_stream(data).read_all()
+    else:
+        table = pyarrow.parquet.read_table(io.BytesIO(data))
+        assert pyarrow.parquet.ParquetFile(
+            io.BytesIO(data)).num_row_groups == 4
+    assert table.column_names == export.FIELDS
+    assert table.column("client").to_pylist() == [1, 3, 4, 5]
+    assert table.column("value").to_pylist() == [1.5, None, 2.0, None]
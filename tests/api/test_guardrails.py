@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+
+import pytest
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from .. import (AdmissionControl,
+                GuardedRows,
+                ReportRejected,
+                REPORT_EXPENSIVE_COST,
+                estimate_cost,
+                get_match_query,
+                guardrails)
+
+ALL_GROUPS = {name: f"${name}" for name in [
+    "client", "client_group", "device_type", "category", "valid",
+    "timestamp"]}
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def test_estimate_cost_of_a_full_report_is_expensive():
+    assert estimate_cost({}, ALL_GROUPS) > REPORT_EXPENSIVE_COST
+
+
+def test_estimate_cost_shrinks_with_the_filters_and_the_span():
+    match_query = get_match_query({
+        "clients": [1], "start_date": "2019-01-01",
+        "end_date": datetime.datetime(2019, 1, 7)})
+    cost = estimate_cost(match_query, {"client": "$client"})
+    assert cost < REPORT_EXPENSIVE_COST
+    assert cost < estimate_cost(get_match_query({"clients": [1]}),
+                                {"client": "$client"})
+    assert cost < estimate_cost(match_query, ALL_GROUPS)
+
+
+def test_estimate_cost_on_rollups_follows_their_count_per_day():
+    match_query = get_match_query({"start_date": "2019-01-01",
+                                   "end_date": "2019-03-01"})
+    group_ids = {"client": "$client", "category": "$category"}
+    assert estimate_cost(match_query, group_ids, rollups_per_day=100) < \
+        estimate_cost(match_query, group_ids)
+    assert estimate_cost(match_query, group_ids, rollups_per_day=0) == 0
+    # Rollups as fine grained as the events are as expensive
+    assert estimate_cost({}, ALL_GROUPS, rollups_per_day=50000) > \
+        REPORT_EXPENSIVE_COST
+
+
+@pytest.mark.parametrize("policy, cheap, expensive", [
+    ("always", True, True), ("never", False, False),
+    ("expensive", False, True)])
+def test_aggregate_options_follow_the_disk_use_policy(monkeypatch, policy,
+                                                      cheap, expensive):
+    monkeypatch.setattr(guardrails, "REPORT_ALLOW_DISK_USE", policy)
+    assert guardrails.get_aggregate_options(0)["allowDiskUse"] is cheap
+    options = guardrails.get_aggregate_options(REPORT_EXPENSIVE_COST + 1)
+    assert options["allowDiskUse"] is expensive
+    assert options["maxTimeMS"] > guardrails.get_aggregate_options(0)[
+        "maxTimeMS"]
+
+
+def test_admission_rejects_when_every_slot_is_taken():
+    admission = AdmissionControl(max_concurrent=1, queue_timeout=0)
+    with admission.acquire(0):
+        with pytest.raises(ReportRejected) as rejection:
+            admission.acquire(0)
+        assert rejection.value.status == 503
+    admission.acquire(0).release()
+
+
+def test_admission_rejects_expensive_reports_first():
+    admission = AdmissionControl(max_concurrent=2, max_expensive=1,
+                                 queue_timeout=0)
+    expensive = REPORT_EXPENSIVE_COST + 1
+    ticket = admission.acquire(expensive)
+    with pytest.raises(ReportRejected) as rejection:
+        admission.acquire(expensive)
+    assert rejection.value.status == 429
+    # The rejected report gave its slots back, a cheap one still runs
+    admission.acquire(0).release()
+    ticket.release()
+    ticket.release()
+    admission.acquire(expensive).release()
+
+
+def test_admission_waits_asynchronously():
+    admission = AdmissionControl(max_concurrent=1, queue_timeout=1)
+
+    async def hold(ticket):
+        await asyncio.sleep(0.05)
+        ticket.release()
+
+    async def main():
+        ticket = await admission.acquire_async(0)
+        asyncio.ensure_future(hold(ticket))
+        with await admission.acquire_async(0):
+            pass
+
+    run(main())
+    admission = AdmissionControl(max_concurrent=1, queue_timeout=0)
+    admission.acquire(0)
+    with pytest.raises(ReportRejected):
+        run(admission.acquire_async(0))
+
+
+def test_budget_errors_become_rejections():
+    with pytest.raises(ReportRejected) as rejection:
+        with guardrails.translate_errors():
+            raise ExecutionTimeout("operation exceeded time limit", 50)
+    assert rejection.value.status == 503
+    with pytest.raises(ReportRejected):
+        with guardrails.translate_errors():
+            raise OperationFailure("exceeded memory limit", 292)
+    with pytest.raises(OperationFailure):
+        with guardrails.translate_errors():
+            raise OperationFailure("other", 2)
+
+
+def test_guarded_rows_release_their_ticket_once_closed():
+    admission = AdmissionControl(max_concurrent=1, queue_timeout=0)
+    rows = GuardedRows(iter([{"a": 1}]), admission.acquire(0))
+    with pytest.raises(ReportRejected):
+        admission.acquire(0)
+    rows.close()
+    admission.acquire(0).release()
+
+
+def test_estimate_cost_grows_with_the_time_buckets():
+    match_query = get_match_query({"start_date": "2019-01-01",
+                                   "end_date": "2019-03-01"})
+    costs = [estimate_cost(match_query, {"client": "$client", name: 1})
+             for name in ["week", "day", "hour"]]
+    assert costs == sorted(costs) and len(set(costs)) == 3
@@ -0,0 +1,49 @@
+from .. import indexes
+
+EXPLAIN_OUTPUT = {
+    "stages": [
+        {"$cursor": {
+            "queryPlanner": {
+                "winningPlan": {
+                    "stage": "FETCH",
+                    "inputStage": {"stage": "COLLSCAN"},
+                },
+            },
+            "executionStats": {
+                "nReturned": 10,
+                "totalKeysExamined": 0,
+                "totalDocsExamined": 1000,
+            },
+        }},
+        {"$group": {}},
+    ],
+}
+
+
+def test_indexes_end_with_timestamp():
+    assert indexes.INDEXES[0] == [("timestamp", 1)]
+    assert [("client", 1), ("timestamp", 1)] in indexes.INDEXES
+    assert all(keys[-1] == ("timestamp", 1) for keys in indexes.INDEXES)
+
+
+def test_can_get_plan_summary():
+    assert indexes.get_plan_summary(EXPLAIN_OUTPUT) == {
+        "stages": ["FETCH", "COLLSCAN"],
+        "keys_examined": 0,
+        "docs_examined": 1000,
+        "returned": 10,
+    }
+
+
+def test_can_get_index_suggestion():
+    pipeline = [
+        {"$match": {
+            "timestamp": {"$gte": "2019-01-01"},
+            "client": {"$in": [1, 2]},
+            "valid": {"$eq": True},
+        }},
+        {"$group": {"_id": "$client"}},
+    ]
+    assert indexes.get_index_suggestion(pipeline) == [
+        ("client", 1), ("valid", 1), ("timestamp", 1)]
+    assert indexes.get_index_suggestion([{"$match": {}}]) == []
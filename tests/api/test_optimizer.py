@@ -0,0 +1,71 @@
+from .. import EventMongoQuery, build_pipeline, optimize_pipeline
+
+
+def test_optimizer_drops_empty_stages():
+    pipeline = [{"$match": {}}, None,
+                {"$group": {"_id": "$client", "count": {"$sum": 1}}},
+                {"$skip": 0}, {"$limit": 5}]
+    assert optimize_pipeline(pipeline) == [
+        {"$project": {"client": 1, "_id": 0}},
+        {"$group": {"_id": "$client", "count": {"$sum": 1}}},
+        {"$limit": 5},
+    ]
+
+
+def test_optimizer_moves_the_sort_after_the_group():
+    pipeline = EventMongoQuery(group_by=["client", "valid"],
+                               order_by=["-valid"]).build_pipeline()
+    optimized = optimize_pipeline(pipeline)
+    assert [next(iter(stage)) for stage in optimized] == \
+        ["$project", "$group", "$sort", "$limit"]
+    assert optimized[2] == {"$sort": {"_id.valid": -1}}
+
+
+def test_optimizer_keeps_the_sort_the_group_depends_on():
+    pipeline = [{"$sort": {"timestamp": 1}},
+                {"$group": {"_id": "$client", "last": {"$last": "$value"}}}]
+    assert optimize_pipeline(pipeline) == [
+        {"$sort": {"timestamp": 1}},
+        {"$project": {"client": 1, "value": 1, "_id": 0}},
+        {"$group": {"_id": "$client", "last": {"$last": "$value"}}},
+    ]
+
+
+def test_optimizer_keeps_the_sort_before_a_limit():
+    pipeline = [{"$sort": {"value": -1}}, {"$limit": 10},
+                {"$group": {"_id": "$client", "sum": {"$sum": "$value"}}}]
+    assert optimize_pipeline(pipeline)[:2] == pipeline[:2]
+
+
+def test_optimizer_lets_the_last_sort_win():
+    pipeline = [{"$group": {"_id": "$client", "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}, {"$sort": {"count": -1}}]
+    assert optimize_pipeline(pipeline)[2:] == [{"$sort": {"count": -1}}]
+
+
+def test_optimizer_projects_the_grouped_fields():
+    optimized = optimize_pipeline(build_pipeline(group_by=["client",
+                                                           "date"]))
+    assert optimized[0] == {"$project": {
+        "client": 1, "day": 1, "value": 1, "_id": 0}}
+
+
+def test_optimizer_skips_the_projection_of_variables():
+    pipeline = [{"$group": {"_id": "$client", "docs": {"$sum": "$$ROOT"}}}]
+    assert optimize_pipeline(pipeline) == pipeline
+
+
+def test_optimizer_puts_the_timestamp_range_first():
+    pipeline = build_pipeline(clients=[1], valid=True,
+                              start_date="2019-01-01")
+    match = optimize_pipeline(pipeline)[0]["$match"]
+    assert list(match) == ["timestamp", "client", "valid"]
+    assert match == pipeline[0]["$match"]
+
+
+def test_optimizer_leaves_the_pipeline_as_it_is():
+    pipeline = build_pipeline(clients=[1], start_date="2019-01-01")
+    copy = [dict(stage) for stage in pipeline]
+    optimize_pipeline(pipeline)
+    assert pipeline == copy
+    assert list(pipeline[0]["$match"]) == ["client", "timestamp"]
@@ -0,0 +1,126 @@
+import datetime
+
+import pytest
+
+from .. import (EventMongoQuery,
+                MONGO_DB_NAME,
+                buckets,
+                build_pipeline,
+                build_rollup_pipeline,
+                connections,
+                optimize_pipeline,
+                rollups)
+
+pytest.importorskip("numpy")
+hypothesis = pytest.importorskip("hypothesis")
+strategies = pytest.importorskip("hypothesis.strategies")
+
+from app.data.generator import EventGenerator, to_documents  # noqa
+
+TEST_COLLECTION = connections.collection("events")
+TEST_ROLLUP_COLLECTION = connections.collection("events_daily")
+TODAY = datetime.datetime(2019, 3, 1)
+
+GROUPS = ["client", "client_group", "device_type", "category", "valid",
+          "date", "hour", "week"]
+ORDERS = GROUPS + [f"-{name}" for name in GROUPS]
+DATES = [TODAY - datetime.timedelta(days=days, hours=hours)
+         for days in range(0, 30, 5) for hours in (0, 7)]
+
+
+def setup_module(module):
+    connections.configure(database_name="test")
+    TEST_COLLECTION.delete_many({})
+    generator = EventGenerator(11, today=TODAY)
+    for batch in generator.get_batches(30, 20, batch_size=500):
+        TEST_COLLECTION.insert_many([
+            buckets.add_buckets(document)
+            for document in to_documents(batch, id_key="_id")])
+    # Null and missing fields group apart, the projection must keep that
+    documents = [
+        {"_id": "null", "client": None, "valid": None, "value": 1.0,
+         "timestamp": TODAY - datetime.timedelta(days=1)},
+        {"_id": "missing", "value": 2.0,
+         "timestamp": TODAY - datetime.timedelta(days=2)},
+    ]
+    TEST_COLLECTION.insert_many([buckets.add_buckets(document)
+                                 for document in documents])
+    rollups.rebuild(TEST_COLLECTION)
+
+
+def teardown_module(module):
+    TEST_COLLECTION.delete_many({})
+    TEST_ROLLUP_COLLECTION.delete_many({})
+    connections.configure(database_name=MONGO_DB_NAME)
+
+
+@strategies.composite
+def report_options(draw):
+    options = {
+        "group_by": draw(strategies.lists(strategies.sampled_from(GROUPS),
+                                          min_size=1, max_size=4,
+                                          unique=True)),
+        "offset": draw(strategies.integers(0, 20)),
+        "limit": draw(strategies.integers(1, 50)),
+    }
+    options["order_by"] = draw(strategies.lists(
+        strategies.sampled_from(ORDERS), max_size=2, unique=True))
+    if draw(strategies.booleans()):
+        start, end = sorted(draw(strategies.lists(
+            strategies.sampled_from(DATES), min_size=2, max_size=2)))
+        options.update(start_date=start, end_date=end)
+    if draw(strategies.booleans()):
+        options["device_types"] = draw(strategies.lists(
+            strategies.sampled_from(["desktop", "mobile", "tablet"]),
+            min_size=1, unique=True))
+    if draw(strategies.booleans()):
+        options["valid"] = draw(strategies.booleans())
+    return options
+
+
+def run(target, pipeline):
+    return list(target.aggregate(pipeline))
+
+
+def assert_same_rows(rows, optimized_rows):
+    assert len(optimized_rows) == len(rows)
+    for optimized_row, row in zip(optimized_rows, rows):
+        # Sums may differ in the last bits, the documents come in another order
+        assert optimized_row.pop("_id") == row.pop("_id")
+        assert optimized_row == pytest.approx(row)
+
+
+@hypothesis.settings(max_examples=100, deadline=None)
+@hypothesis.given(report_options())
+def test_optimized_pipeline_returns_the_same_page(options):
+    pipeline = build_pipeline(**options)
+    assert_same_rows(run(TEST_COLLECTION, pipeline),
+                     run(TEST_COLLECTION, optimize_pipeline(pipeline)))
+
+
+@hypothesis.settings(max_examples=50, deadline=None)
+@hypothesis.given(report_options())
+def test_optimized_rollup_pipeline_returns_the_same_page(options):
+    options["group_by"] = [name for name in options["group_by"]
+                           if name in rollups.DIMENSIONS] or ["client"]
+    for name in ["start_date", "end_date"]:
+        if name in options:
+            options[name] = options[name].replace(hour=0)
+    pipeline = build_rollup_pipeline(**options)
+    assert_same_rows(run(TEST_ROLLUP_COLLECTION, pipeline),
+                     run(TEST_ROLLUP_COLLECTION, optimize_pipeline(pipeline)))
+
+
+@hypothesis.settings(max_examples=50, deadline=None)
+@hypothesis.given(report_options())
+def test_optimized_event_query_returns_the_same_groups(options):
+    # The groups come out in no particular order, compare them all
+    options.update(offset=0, limit=10 ** 6)
+    pipeline = EventMongoQuery(**options).build_pipeline()
+
+    def key(row):
+        return repr(sorted(row["_id"].items()))
+    rows = sorted(run(TEST_COLLECTION, pipeline), key=key)
+    optimized_rows = sorted(run(TEST_COLLECTION, optimize_pipeline(pipeline)),
+                            key=key)
+    assert_same_rows(rows, optimized_rows)
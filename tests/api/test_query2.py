@@ -1,6 +1,19 @@
 import datetime
 
-from .. import build_pipeline
+import pytest
+
+from .. import (build_pipeline,
+                build_rollup_pipeline,
+                can_use_rollups,
+                count_only_pipeline,
+                count_pipeline,
+                decode_cursor,
+                encode_cursor,
+                get_group_sort_query,
+                get_keyset_query,
+                get_row_projection,
+                normalize_options,
+                verify_options)
 
 
 def test_build_pipeline():
@@ -23,13 +36,174 @@ def test_build_pipeline():
                 '$lte': end_date,
             }
         }},
-        {'$sort': {'_id': 1, 'client': 1}},
         {'$group': {
             '_id': {'client': '$client'},
             'mean': {'$avg': '$value'},
             'sum': {'$sum': '$value'},
             'count': {'$sum': 1}}},
+        {'$sort': {'_id.client': 1}},
         {'$skip': 0},
         {'$limit': 5},
+        {'$project': get_row_projection()},
     ]
     assert pipeline == test_pipeline
+
+
+def test_can_use_rollups_with_coarse_options():
+    assert can_use_rollups({})
+    assert can_use_rollups({"group_by": ["client", "valid"]})
+    assert can_use_rollups({"group_by": ["client", "date"]})
+    assert can_use_rollups({"group_by": ["device_type"],
+                            "categories": [1],
+                            "start_date": "2019-01-01",
+                            "end_date": datetime.datetime(2019, 1, 5)})
+
+
+def test_can_not_use_rollups_with_fine_options():
+    assert not can_use_rollups({"group_by": ["client", "hour"]})
+    assert not can_use_rollups({"group_by": ["week"]})
+    assert not can_use_rollups({
+        "group_by": ["client"],
+        "start_date": datetime.datetime(2019, 1, 1, 10),
+    })
+
+
+def test_build_rollup_pipeline():
+    pipeline = build_rollup_pipeline(
+        clients=[1, 2],
+        group_by=["client"],
+        start_date="2019-01-01",
+        end_date="2019-01-05",
+    )
+    test_pipeline = [
+        {'$match': {
+            'client': {'$in': [1, 2]},
+            'day': {'$gte': '2019-01-01', '$lt': '2019-01-05'},
+            'count': {'$gt': 0},
+        }},
+        {'$group': {
+            '_id': {'client': '$client'},
+            'sum': {'$sum': '$sum'},
+            'count': {'$sum': '$count'},
+            'value_count': {'$sum': {'$ifNull': ['$value_count', '$count']}}}},
+        {'$addFields': {'mean': {'$cond': [
+            {'$gt': ['$value_count', 0]},
+            {'$divide': ['$sum', '$value_count']},
+            None]}}},
+        {'$sort': {'_id.client': 1}},
+        {'$skip': 0},
+        {'$limit': 5},
+        {'$project': get_row_projection()},
+    ]
+    assert pipeline == test_pipeline
+
+
+def test_count_pipeline_moves_page_into_facet():
+    pipeline = build_pipeline(group_by=["client"], offset=10)
+    test_pipeline = pipeline[:2] + [
+        {'$facet': {
+            'rows': [{'$sort': {'_id.client': 1}},
+                     {'$skip': 10},
+                     {'$limit': 5},
+                     {'$project': get_row_projection()}],
+            'total_count': [{'$count': 'count'}],
+        }},
+    ]
+    assert count_pipeline(pipeline) == test_pipeline
+
+
+def test_get_group_sort_query_sorts_by_every_grouped_field():
+    options = {
+        "group_by": ["client", "date", "valid"],
+        "order_by": ["-valid", "date"],
+    }
+    assert list(get_group_sort_query(options).items()) == [
+        ("_id.valid", -1),
+        ("_id.day", 1),
+        ("_id.client", 1),
+    ]
+
+
+def test_get_keyset_query():
+    sort_query = {"_id.valid": -1, "_id.category": 1, "_id.client": 1}
+    group_id = {"valid": True, "category": None, "client": 3}
+    assert get_keyset_query(sort_query, group_id) == {"$or": [
+        {"valid": {"$not": {"$gte": True}}},
+        {"valid": True, "category": {"$ne": None}},
+        {"valid": True, "category": None, "client": {"$gt": 3}},
+    ]}
+
+
+def test_build_pipeline_matches_the_cursor_before_grouping_when_estimated():
+    cursor = encode_cursor({"client": 3})
+    pipeline = build_pipeline(group_by=["client"], clients=[1, 5],
+                              cursor=cursor, offset=10,
+                              count_mode="estimated")
+    assert pipeline[0] == {'$match': {'client': {'$in': [1, 5]},
+                                      '$or': [{'client': {'$gt': 3}}]}}
+    assert pipeline[-3:-1] == [{'$skip': 0}, {'$limit': 5}]
+
+
+def test_exact_count_counts_the_rows_before_the_cursor():
+    cursor = encode_cursor({"client": 3})
+    pipeline = build_pipeline(group_by=["client"], clients=[1, 5],
+                              cursor=cursor, offset=10)
+    assert pipeline[0] == {'$match': {'client': {'$in': [1, 5]}}}
+    facet = count_pipeline(pipeline)[-1]['$facet']
+    assert facet['rows'][:3] == [
+        {'$match': {'$or': [{'_id.client': {'$gt': 3}}]}},
+        {'$sort': {'_id.client': 1}},
+        {'$skip': 0}]
+    assert facet['total_count'] == [{'$count': 'count'}]
+
+
+def test_order_by_only_sorts_the_grouped_fields():
+    assert verify_options({"group_by": ["client", "date"],
+                           "order_by": ["-date", "client"]})
+    with pytest.raises(ValueError, match="Invalid order_by: -category"):
+        verify_options({"group_by": ["client"],
+                        "order_by": ["client", "-category"]})
+
+
+def test_cursor_round_trip():
+    start_date = datetime.datetime(2019, 1, 1, 10, 30)
+    group_id = {"client": 3, "timestamp": start_date, "category": None}
+    assert decode_cursor(encode_cursor(group_id)) == group_id
+    with pytest.raises(ValueError):
+        decode_cursor("foo")
+
+
+def test_normalize_options_makes_equivalent_options_equal():
+    options = normalize_options({"clients": [2, 1], "group_by": ["client"]})
+    assert options == normalize_options({
+        "clients": [1, 2], "group_by": ["client"], "offset": 0})
+    assert options == {
+        "offset": 0,
+        "limit": 5,
+        "group_by": ["client"],
+        "count_mode": "exact",
+        "clients": [1, 2],
+    }
+
+
+def test_get_row_projection_fills_in_defaults():
+    projection = get_row_projection()
+    assert projection["category"] == {'$ifNull': ['$_id.category', 0]}
+    assert projection["valid"] == {'$ifNull': ['$_id.valid', None]}
+    assert projection["count"] == {'$ifNull': ['$count', 0]}
+    assert "_id" not in projection
+
+
+def test_count_only_pipeline_drops_the_page():
+    pipeline = build_pipeline(group_by=["client"])
+    assert count_only_pipeline(pipeline) == pipeline[:2] + [
+        {'$count': 'count'}]
+
+
+def test_build_pipeline_groups_time_on_the_buckets():
+    for name, field in [("date", "day"), ("hour", "hour"), ("week", "week")]:
+        pipeline = build_pipeline(group_by=["client", name])
+        assert pipeline[1]["$group"]["_id"] == {"client": "$client",
+                                                field: f"${field}"}
+        assert get_row_projection()[field] == {
+            '$ifNull': [f'$_id.{field}', None]}
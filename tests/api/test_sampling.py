@@ -0,0 +1,96 @@
+import pytest
+
+from .. import (build_pipeline,
+                get_sample_rate,
+                optimize_pipeline,
+                sampling,
+                verify_options)
+
+
+@pytest.fixture
+def no_rollups(monkeypatch):
+    monkeypatch.setattr("app.api.query2.USE_ROLLUPS", False)
+
+
+def get_row(count=100, total=1000.0, squares=12000.0):
+    return {"client": 1, "count": count, "sum": total, "mean": total / count,
+            "sum_squares": squares, "values": count}
+
+
+def test_id_bound_is_the_share_of_the_uuid_range():
+    assert sampling.get_id_bound(0.5) == "80000000"
+    assert sampling.get_id_bound(0.25) == "40000000"
+    assert sampling.get_id_bound(0.001) == "00418937"
+
+
+def test_scale_row_scales_up_sums_and_counts():
+    row = sampling.scale_row(get_row(), 0.1)
+    assert row["count"] == 1000
+    assert row["sum"] == pytest.approx(10000.0)
+    assert row["mean"] == pytest.approx(10.0)
+    assert "sum_squares" not in row and "values" not in row
+
+
+def test_scale_row_intervals_contain_the_estimates():
+    row = sampling.scale_row(get_row(), 0.1)
+    for name in ["mean", "sum", "count"]:
+        low, high = row["confidence"][name]
+        assert low < row[name] < high
+
+
+def test_scale_row_intervals_narrow_with_the_sample_rate():
+    def width(sample_rate, name):
+        low, high = sampling.scale_row(get_row(), sample_rate)[
+            "confidence"][name]
+        return high - low
+
+    for name in ["mean", "sum", "count"]:
+        assert width(0.5, name) < width(0.1, name)
+        assert width(1, name) == 0
+
+
+def test_scale_row_without_enough_values_has_no_mean_interval():
+    row = sampling.scale_row(get_row(count=1, total=5.0, squares=25.0), 0.5)
+    assert row["confidence"]["mean"] == [None, None]
+    assert row["count"] == 2
+
+
+def test_build_pipeline_reads_and_groups_the_sample(no_rollups):
+    pipeline = build_pipeline(group_by=["client"], sample_rate=0.25)
+    match, group = pipeline[0]["$match"], pipeline[1]["$group"]
+    assert match["_id"] == {"$lt": "40000000"}
+    assert set(sampling.SAMPLE_ACCUMULATORS) <= set(group)
+    assert set(sampling.SAMPLE_ACCUMULATORS) <= set(pipeline[-1]["$project"])
+
+
+def test_build_pipeline_is_exact_without_sample_rate(no_rollups):
+    for options in [{}, {"sample_rate": 1}]:
+        pipeline = build_pipeline(group_by=["client"], **options)
+        assert "_id" not in pipeline[0]["$match"]
+        assert "sum_squares" not in pipeline[1]["$group"]
+
+
+def test_optimized_pipeline_keeps_the_sample_fields(no_rollups):
+    pipeline = optimize_pipeline(build_pipeline(group_by=["client"],
+                                                sample_rate=0.25))
+    projection = next(stage["$project"] for stage in pipeline
+                      if "$project" in stage)
+    assert projection["value"] == 1
+
+
+def test_sample_rate_is_ignored_with_rollups():
+    options = {"group_by": ["client"], "start_date": "2019-01-01",
+               "end_date": "2019-01-07", "sample_rate": 0.1}
+    assert get_sample_rate(options) is None
+    assert get_sample_rate(dict(options, group_by=["hour"])) == 0.1
+
+
+@pytest.mark.parametrize("sample_rate", [0, -0.5, 1.5])
+def test_verify_options_rejects_invalid_sample_rates(sample_rate):
+    with pytest.raises(ValueError):
+        verify_options({"sample_rate": sample_rate})
+
+
+def test_verify_options_accepts_sample_rates():
+    assert verify_options({"sample_rate": 0.01})
+    assert verify_options({"sample_rate": 1})
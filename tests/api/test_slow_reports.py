@@ -0,0 +1,124 @@
+import json
+import threading
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+from .. import SlowReportLog, build_pipeline, get_docs_examined, get_fingerprint
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.commands = []
+
+    def command(self, command):
+        self.commands.append(command)
+        return {"stages": [{"$cursor": {"executionStats": {
+            "totalDocsExamined": 42}}}]}
+
+
+class FakeCollection:
+    name = "events"
+
+    def __init__(self):
+        self.database = FakeDatabase()
+
+
+def test_fingerprint_ignores_the_values():
+    pipeline = build_pipeline(clients=[1, 2], limit=5)
+    assert get_fingerprint(pipeline) == \
+        get_fingerprint(build_pipeline(clients=[3], limit=10))
+    assert get_fingerprint(pipeline) != \
+        get_fingerprint(build_pipeline(categories=[1], limit=5))
+    assert get_fingerprint(pipeline) != \
+        get_fingerprint(build_pipeline(clients=[1], group_by=["client"]))
+
+
+def test_docs_examined_are_summed():
+    explain = {"shards": {"a": {"executionStats": {"totalDocsExamined": 3}},
+                          "b": {"executionStats": {"totalDocsExamined": 4}}}}
+    assert get_docs_examined(explain) == 7
+    assert get_docs_examined({"ok": 1}) == 0
+
+
+def test_fast_reports_are_not_logged(tmp_path):
+    log = SlowReportLog(threshold_ms=100, path=str(tmp_path / "slow.log"))
+    assert not log.record({}, FakeCollection(), [], 0.05)
+    assert log.top() == []
+    assert not (tmp_path / "slow.log").exists()
+
+
+def test_slow_reports_are_logged_and_counted_by_shape(tmp_path):
+    path = tmp_path / "slow.log"
+    log = SlowReportLog(threshold_ms=100, explain_rate=0, path=str(path))
+    collection = FakeCollection()
+    log.record({"clients": [1]}, collection,
+               build_pipeline(clients=[1]), 0.2)
+    log.record({"clients": [2]}, collection,
+               build_pipeline(clients=[2]), 0.4)
+    log.record({"categories": [1]}, collection,
+               build_pipeline(categories=[1]), 0.3)
+    log.executor.shutdown(wait=True)
+
+    first, second = log.top()
+    assert (first["count"], first["max_ms"], first["mean_ms"]) == \
+        (2, 400.0, 300.0)
+    assert first["options"] == {"clients": [2]}
+    assert second["count"] == 1
+    assert log.top(limit=1) == [first]
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["duration_ms"] for record in records] == [200, 400, 300]
+    assert records[0]["pipeline"][0] == {"$match": {"client": {"$in": [1]}}}
+    assert collection.database.commands == []
+
+
+def test_sampled_slow_reports_are_explained(tmp_path):
+    path = tmp_path / "slow.log"
+    log = SlowReportLog(threshold_ms=100, explain_rate=1, path=str(path))
+    collection = FakeCollection()
+    pipeline = build_pipeline(clients=[1])
+    log.record({"clients": [1]}, collection, pipeline, 0.2)
+    log.executor.shutdown(wait=True)
+
+    command, = collection.database.commands
+    assert command["explain"]["pipeline"] == pipeline
+    assert command["verbosity"] == "executionStats"
+    record = json.loads(path.read_text())
+    assert record["docs_examined"] == 42
+    assert log.top()[0]["docs_examined"] == 42
+
+
+def test_slow_reports_are_written_off_the_calling_thread(tmp_path):
+    log = SlowReportLog(threshold_ms=100, explain_rate=0,
+                        path=str(tmp_path / "slow.log"))
+    threads = []
+    log.write = lambda record: threads.append(threading.current_thread())
+    log.record({}, FakeCollection(), build_pipeline(), 0.2)
+    log.executor.shutdown(wait=True)
+    assert threads and threads[0] is not threading.current_thread()
+
+
+def test_failed_aggregations_are_logged_with_their_error(tmp_path):
+    path = tmp_path / "slow.log"
+    log = SlowReportLog(threshold_ms=0, explain_rate=0, path=str(path))
+    with pytest.raises(ExecutionTimeout):
+        with log.measure({}, FakeCollection(), build_pipeline()):
+            raise ExecutionTimeout("operation exceeded time limit")
+    log.executor.shutdown(wait=True)
+
+    record = json.loads(path.read_text())
+    assert record["error"] == \
+        "ExecutionTimeout: operation exceeded time limit"
+    assert (log.top()[0]["count"], log.top()[0]["errors"]) == (1, 1)
+
+    log = SlowReportLog(threshold_ms=0, explain_rate=0,
+                        path=str(tmp_path / "slow.log"), max_shapes=2)
+    for name in ["clients", "categories", "clients", "device_types"]:
+        log.record({}, FakeCollection(), build_pipeline(**{name: [1]}), 0.1)
+    fingerprints = {shape["fingerprint"] for shape in log.top()}
+    assert fingerprints == {
+        get_fingerprint(build_pipeline(clients=[1])),
+        get_fingerprint(build_pipeline(device_types=[1])),
+    }
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from .. import MONGO_DB_NAME, connections
+
+pytest.importorskip("motor")
+
+from app.data.async_models import AsyncEventDocument, motor_connections  # noqa
+
+TEST_COLLECTION = connections.collection("events")
+TEST_ROLLUP_COLLECTION = connections.collection("events_daily")
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def destroy_data():
+    TEST_COLLECTION.delete_many({})
+    TEST_ROLLUP_COLLECTION.delete_many({})
+
+
+def setup_module(module):
+    connections.configure(database_name="test")
+    motor_connections.configure(database_name="test")
+
+
+def teardown_module(module):
+    destroy_data()
+    connections.configure(database_name=MONGO_DB_NAME)
+    motor_connections.configure(database_name=MONGO_DB_NAME)
+
+
+def test_async_event_document_can_create_and_get_object():
+    destroy_data()
+    document = AsyncEventDocument({"id": "testid1", "foo": "bar"})
+    assert run(document.create()) == {"id": "testid1", "foo": "bar"}
+    stored = run(document.get_object())
+    assert stored.pop("_version")
+    assert stored == {"_id": "testid1", "foo": "bar"}
+
+
+def test_async_event_document_can_save_to_update():
+    destroy_data()
+    TEST_COLLECTION.insert_one({"_id": "testid2", "foo": "bar"})
+    document = AsyncEventDocument({"id": "testid2", "xyz": "tzy"})
+    run(document.save())
+    assert document.pop_keys(["_version"]) == {
+        "id": "testid2", "_id": "testid2", "foo": "bar", "xyz": "tzy"}
+
+
+def test_async_event_document_can_remove_and_update_rollups():
+    destroy_data()
+    event = {"id": "testid3", "client": 1, "value": 2.0,
+             "timestamp": "2019-01-01T10:00:00"}
+    run(AsyncEventDocument(event).create())
+    rollup = TEST_ROLLUP_COLLECTION.find_one({"client": 1})
+    assert (rollup["sum"], rollup["count"]) == (2.0, 1)
+
+    document = run(AsyncEventDocument({"id": "testid3"}).remove())
+    assert not document
+    assert not TEST_COLLECTION.find_one({"_id": "testid3"})
+    rollup = TEST_ROLLUP_COLLECTION.find_one({"client": 1})
+    assert rollup["count"] == 0
+
+
+def test_async_event_document_can_insert_many_with_duplicates():
+    destroy_data()
+    TEST_COLLECTION.insert_one({"_id": "testid4"})
+    documents = [
+        AsyncEventDocument({"id": "testid4"}),
+        AsyncEventDocument({"id": "testid5"}),
+    ]
+    assert run(AsyncEventDocument.insert_many(documents)) == {0}
+    assert TEST_COLLECTION.count_documents({}) == 2
+
+
+def test_async_event_document_save_with_awaits_the_update():
+    destroy_data()
+    run(AsyncEventDocument({"id": "testid6", "value": 1.0}).create())
+    document = AsyncEventDocument({"id": "testid6", "value": 3.0})
+    run(document.save_with(obj=run(document.get_object())))
+    assert TEST_COLLECTION.find_one({"_id": "testid6"})["value"] == 3.0
@@ -0,0 +1,52 @@
+import datetime
+
+from .. import EventDocument, buckets
+
+EVENT = {
+    "id": "testid1",
+    "client": 1,
+    "timestamp": datetime.datetime(2019, 1, 13, 23, 30),
+    "value": 10.5,
+}
+
+
+def test_buckets_of_a_datetime():
+    assert buckets.get_buckets(EVENT["timestamp"]) == {
+        "day": "2019-01-13",
+        "hour": "2019-01-13T23:00:00",
+        "week": "2019-01-07",
+    }
+
+
+def test_buckets_of_an_iso_string():
+    assert buckets.get_buckets("2019-01-14T08:15:00Z") == {
+        "day": "2019-01-14",
+        "hour": "2019-01-14T08:00:00",
+        "week": "2019-01-14",
+    }
+    assert buckets.get_buckets("2019-01-14")["hour"] == "2019-01-14T00:00:00"
+
+
+def test_buckets_of_unreadable_timestamps_are_null():
+    for timestamp in [None, "yesterday", 1547424000]:
+        assert buckets.get_buckets(timestamp) == dict.fromkeys(
+            buckets.FIELDS)
+
+
+def test_add_buckets_skips_documents_without_timestamp():
+    assert buckets.add_buckets({"_id": "a", "value": 1}) == {
+        "_id": "a", "value": 1}
+
+
+def test_event_document_writes_its_buckets():
+    document = EventDocument(EVENT).mongo()
+    assert document["day"] == "2019-01-13"
+    assert document["week"] == "2019-01-07"
+    assert document["_id"] == "testid1"
+
+
+def test_event_document_serializes_without_its_buckets():
+    event = EventDocument({**EVENT, "day": "2019-01-13",
+                           "hour": "2019-01-13T23:00:00"})
+    assert event.serialize() == EVENT
+    assert "day" not in event.pure()
@@ -0,0 +1,132 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.data.columnar import ColumnarStore  # noqa
+
+TS = datetime.datetime(2019, 1, 1, 10)
+
+EVENTS = [
+    {"_id": "a", "client": 1, "client_group": 10, "category": 5,
+     "device_type": "mobile", "valid": True, "timestamp": TS, "value": 1.0},
+    {"_id": "b", "client": 1, "client_group": 10, "category": None,
+     "device_type": "desktop", "valid": False,
+     "timestamp": TS + datetime.timedelta(days=1), "value": 2.0},
+    {"_id": "c", "client": 2, "client_group": 11, "category": 5,
+     "device_type": None, "valid": True,
+     "timestamp": "2019-01-03T10:00:00Z", "value": 4.0},
+    {"_id": "d", "client": 2, "client_group": 11, "category": 5,
+     "valid": True, "timestamp": TS},
+]
+
+
+def get_store(events=EVENTS):
+    store = ColumnarStore(capacity=2)
+    store.extend(events)
+    return store
+
+
+def group(store, match_query, *names):
+    rows = store.group(match_query, {name: f"${name}" for name in names})
+    return sorted(rows, key=lambda row: repr(row["_id"]))
+
+
+def test_columnar_store_groups_with_mean_sum_and_count():
+    rows = group(get_store(), {}, "client")
+    assert rows == [
+        {"_id": {"client": 1}, "mean": 1.5, "sum": 3.0, "count": 2},
+        {"_id": {"client": 2}, "mean": 4.0, "sum": 4.0, "count": 2},
+    ]
+
+
+def test_columnar_store_groups_missing_apart_from_null():
+    rows = group(get_store(), {"client": {"$in": [2]}}, "device_type")
+    assert [row["_id"] for row in rows] == [{"device_type": None}, {}]
+    assert [row["mean"] for row in rows] == [4.0, None]
+
+
+def test_columnar_store_groups_by_the_time_buckets():
+    store = get_store()
+    days = group(store, {}, "day")
+    assert [(row["_id"], row["count"]) for row in days] == [
+        ({"day": "2019-01-01"}, 2), ({"day": "2019-01-02"}, 1),
+        ({"day": "2019-01-03"}, 1)]
+    assert [row["_id"] for row in group(store, {}, "hour")] == [
+        {"hour": "2019-01-01T10:00:00"}, {"hour": "2019-01-02T10:00:00"},
+        {"hour": "2019-01-03T10:00:00"}]
+    assert [(row["_id"], row["count"]) for row in group(store, {}, "week")] \
+        == [({"week": "2018-12-31"}, 4)]
+
+
+def test_columnar_store_filters_like_the_match_query():
+    store = get_store()
+    assert len(group(store, {"category": {"$in": [None]}}, "client")) == 1
+    assert group(store, {"valid": {"$eq": True},
+                         "device_type": {"$in": ["mobile", None]}},
+                 "client")[0]["count"] == 1
+    rows = group(store, {"timestamp": {"$gte": TS + datetime.timedelta(
+        hours=1)}}, "timestamp")
+    assert [row["_id"]["timestamp"] for row in rows] == [
+        TS + datetime.timedelta(days=1), TS + datetime.timedelta(days=2)]
+
+
+def test_columnar_store_applies_writes_by_id():
+    store = get_store()
+    store.loaded_at = 0
+    store.apply([(EVENTS[0], dict(EVENTS[0], client=3)),
+                 (EVENTS[1], None)])
+    assert len(store) == 3
+    assert [row["_id"] for row in group(store, {}, "client")] == [
+        {"client": 2}, {"client": 3}]
+
+
+def test_columnar_store_ignores_writes_before_loading():
+    store = ColumnarStore()
+    store.apply([(None, EVENTS[0])])
+    assert len(store) == 0
+
+
+class FakeCollection:
+
+    def __init__(self, documents, on_find=None):
+        self.documents = documents
+        self.on_find = on_find
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def find(self, batch_size=None):
+        for document in list(self.documents):
+            yield document
+            if self.on_find:
+                self.on_find()
+                self.on_find = None
+
+
+def test_columnar_store_load_keeps_the_writes_made_meanwhile():
+    store = ColumnarStore()
+    written = dict(EVENTS[1], client=3)
+
+    def write():
+        # Serving reports and writes doesn't wait for the load
+        assert store.lock.acquire(blocking=False)
+        store.lock.release()
+        store.apply([(EVENTS[1], written)])
+
+    store.load(FakeCollection(EVENTS[:2], on_find=write))
+    assert store.loaded_at is not None and store.pending is None
+    assert [row["_id"] for row in group(store, {}, "client")] == [
+        {"client": 1}, {"client": 3}]
+
+
+def test_columnar_store_reloads_in_the_background():
+    store = ColumnarStore()
+    store.ensure_loaded(FakeCollection(EVENTS[:1]))
+    assert len(store) == 1
+
+    store.loaded_at -= 120
+    store.ensure_loaded(FakeCollection(EVENTS), interval=60)
+    with store.load_lock:  # Released once the reload is swapped in
+        assert len(store) == len(EVENTS)
@@ -0,0 +1,34 @@
+import datetime as _dt
+
+from pymongo.monitoring import CommandFailedEvent, CommandSucceededEvent
+
+from .. import COMMAND_DOCUMENTS, COMMAND_ERRORS, CommandMetricsListener
+
+ADDRESS = ("mongo", 27017)
+DURATION = _dt.timedelta(milliseconds=3)
+
+
+def succeeded(command_name, reply):
+    return CommandSucceededEvent(DURATION, reply, command_name, 1, ADDRESS, 1)
+
+
+def test_command_metrics_count_documents():
+    listener = CommandMetricsListener()
+    before = COMMAND_DOCUMENTS.collect()
+    listener.succeeded(succeeded("find", {"cursor": {"firstBatch": [{}, {}]}}))
+    listener.succeeded(succeeded("getMore", {"cursor": {"nextBatch": [{}]}}))
+    listener.succeeded(succeeded("insert", {"n": 5}))
+    listener.succeeded(succeeded("ping", {"ok": 1}))
+
+    after = COMMAND_DOCUMENTS.collect()
+    for command, count in [("find", 2), ("getMore", 1), ("insert", 5)]:
+        assert after[(command,)] - before.get((command,), 0) == count
+    assert ("ping",) not in after
+
+
+def test_command_metrics_count_errors():
+    listener = CommandMetricsListener()
+    before = COMMAND_ERRORS.collect().get(("aggregate",), 0)
+    listener.failed(CommandFailedEvent(DURATION, {"ok": 0}, "aggregate", 1,
+                                       ADDRESS, 1))
+    assert COMMAND_ERRORS.collect()[("aggregate",)] == before + 1
@@ -0,0 +1,48 @@
+from pymongo import MongoClient
+
+from .. import ConnectionRegistry, LazyCollection
+
+
+def create_registry():
+    created = []
+
+    def factory():
+        created.append(MongoClient(connect=False))
+        return created[-1]
+
+    return ConnectionRegistry(factory, database_name="test"), created
+
+
+def test_registry_creates_the_client_on_first_use():
+    registry, created = create_registry()
+    collection = registry.collection("events")
+    assert isinstance(collection, LazyCollection)
+    assert not registry.is_connected and not created
+
+    assert collection.full_name == "test.events"
+    assert collection.full_name == "test.events"
+    assert len(created) == 1
+
+
+def test_lazy_collection_follows_the_registry_configuration():
+    registry, created = create_registry()
+    collection = registry.collection("events")
+    assert collection.full_name == "test.events"
+
+    client = MongoClient(connect=False)
+    registry.configure(client=client, database_name="other")
+    assert collection.full_name == "other.events"
+    assert collection.database.client is client
+
+    registry.configure()
+    assert collection.database.client is not client
+    assert len(created) == 2
+
+
+def test_registry_forgets_the_client_of_the_parent_process():
+    registry, created = create_registry()
+    registry.client
+    registry.forget()
+    assert not registry.is_connected
+    registry.client
+    assert len(created) == 2
@@ -0,0 +1,61 @@
+import asyncio
+
+from .. import WriteGeneration
+
+
+class FakeCounters:
+    """
+    The counter document of the counters collection, shared by every
+    WriteGeneration given the same collection
+    """
+
+    def __init__(self):
+        self.document = None
+
+    def find_one(self, filter):
+        return self.document
+
+    def find_one_and_update(self, filter, update, upsert, return_document):
+        generation = self.document["generation"] if self.document else 0
+        self.document = {**filter, "generation": generation + 1}
+        return self.document
+
+
+class AsyncFakeCounters(FakeCounters):
+
+    async def find_one(self, filter):
+        return super().find_one(filter)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return super().find_one_and_update(*args, **kwargs)
+
+
+def test_shared_generation_counts_the_writes_of_every_process():
+    counters = FakeCounters()
+    first, second = (WriteGeneration(counters, shared=True),
+                     WriteGeneration(counters, shared=True))
+    assert first.get() == 0
+    assert first.bump() == 1
+    assert second.bump() == 2
+    assert first.get() == 2
+
+
+def test_local_generation_counts_the_writes_of_this_process():
+    counters = FakeCounters()
+    first, second = (WriteGeneration(counters, shared=False),
+                     WriteGeneration(counters, shared=False))
+    assert first.bump() == 1
+    assert second.get() == 0
+    assert counters.document is None
+
+
+def test_async_generation_shares_the_counter():
+    counters = AsyncFakeCounters()
+    generation = WriteGeneration(counters, shared=True)
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(generation.bump_async(counters)) == 1
+        assert loop.run_until_complete(generation.get_async(counters)) == 1
+    finally:
+        loop.close()
+    assert generation.value == 1
@@ -0,0 +1,64 @@
+import datetime
+import uuid
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.data.generator import (EventGenerator,  # noqa
+                                batch_length,
+                                get_uuids,
+                                to_documents)
+from app.data.utils import DEVICES  # noqa
+
+TODAY = datetime.datetime(2019, 1, 10)
+
+
+def get_documents(seed, days=3, events_per_day=1000, batch_size=400):
+    generator = EventGenerator(seed, today=TODAY)
+    batches = generator.get_batches(days, events_per_day, batch_size)
+    return [document for batch in batches for document in to_documents(batch)]
+
+
+def test_generator_is_reproducible_with_a_seed():
+    assert get_documents(1) == get_documents(1)
+    assert get_documents(1) != get_documents(2)
+
+
+def test_generator_yields_batches_of_at_most_batch_size():
+    generator = EventGenerator(1, today=TODAY)
+    lengths = [batch_length(batch)
+               for batch in generator.get_batches(1, 1000, 400)]
+    assert max(lengths) == 400
+    assert 800 <= sum(lengths) <= 1200
+
+
+def test_generated_uuids_are_version_4():
+    for value in get_uuids(np.random.default_rng(0), 100):
+        assert str(uuid.UUID(value, version=4)) == value
+
+
+def test_generated_events_follow_the_distributions():
+    documents = get_documents(1, days=5)
+    assert set(documents[0]) == {"id", "device_type", "category", "client",
+                                 "client_group", "timestamp", "valid", "value"}
+
+    for day in range(5):
+        start = TODAY - datetime.timedelta(days=5 - day)
+        end = start + datetime.timedelta(days=1)
+        timestamps = [document["timestamp"] for document in documents
+                      if start <= document["timestamp"] < end]
+        assert 800 <= len(timestamps) <= 1200
+        assert timestamps == sorted(timestamps)
+
+    groups = {}
+    for document in documents:
+        groups.setdefault(document["client"], set()).add(
+            document["client_group"])
+        assert document["device_type"] in DEVICES
+        assert 0 <= document["value"] < 100
+        assert round(document["value"], 2) == document["value"]
+    assert all(len(client_groups) == 1 for client_groups in groups.values())
+
+    valid_ratio = sum(document["valid"] for document in documents) / len(documents)
+    assert 0.75 < valid_ratio < 0.85
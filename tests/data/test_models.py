@@ -40,3 +40,16 @@ def test_mongo_model_can_serialize_with_id():
     model = MongoModel({"id": "test-id1", "_id": "dummy", "foo": "bar"})
     serialized_dict = model.serialize()
     assert serialized_dict == {"id": "test-id1", "foo": "bar"}
+
+
+def test_mongo_model_versioned_dict_has_a_new_version():
+    model = MongoModel({"id": "test-id1", "foo": "bar"})
+    first, second = model.versioned(), model.versioned()
+    assert first["_version"] != second["_version"]
+    assert first.pop("_version") and first == model.mongo()
+
+
+def test_mongo_model_never_serializes_its_version():
+    model = MongoModel({"id": "test-id1", "_version": "v", "foo": "bar"})
+    assert model.serialize() == {"id": "test-id1", "foo": "bar"}
+    assert model.pure() == {"foo": "bar"}
@@ -1,11 +1,55 @@
+import pytest
+
+from bson import ObjectId
+from pymongo import MongoClient, monitoring
+from pymongo.errors import DuplicateKeyError
+
 from .. import EventDocument
-from .. import MONGO_CLIENT
+from .. import MONGO_COUNTERS_COLLECTION_NAME, MONGO_DB_NAME, MONGO_HOST, \
+    MONGO_PORT
+from .. import connections, rollups
+
+TEST_COLLECTION = connections.collection("events")
+TEST_ROLLUP_COLLECTION = connections.collection("events_daily")
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Records the name of every command sent to the server, per collection"""
+
+    def __init__(self):
+        self.commands = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self.commands.setdefault(collection, []).append(event.command_name)
 
-TEST_COLLECTION = MONGO_CLIENT["test"]["events"]
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def count_commands(func):
+    """
+    Commands sent by func per collection name. Every collection goes through
+    the counting client, the rollups included
+    """
+    counter = CommandCounter()
+    client = MongoClient(host=MONGO_HOST, port=MONGO_PORT,
+                         event_listeners=[counter])
+    connections.configure(client=client)
+    try:
+        func()
+    finally:
+        connections.configure()
+        client.close()
+    return counter.commands
 
 
 def destroy_data():
     TEST_COLLECTION.delete_many({})
+    TEST_ROLLUP_COLLECTION.delete_many({})
 
 
 def create_data():
@@ -15,11 +59,12 @@ def create_data():
 
 
 def setup_module(module):
-    EventDocument.collection = TEST_COLLECTION
+    connections.configure(database_name="test")
 
 
 def teardown_module(module):
     destroy_data()
+    connections.configure(database_name=MONGO_DB_NAME)
 
 
 def test_mongo_model_can_get_object():
@@ -55,6 +100,7 @@ def test_mongo_model_can_save_without_object_to_create():
     document.save_with()
     assert document == {"id": "testid3", "_id": "testid3", "xyz": "tzy"}
     test_dict = TEST_COLLECTION.find_one({"_id": "testid3"})
+    assert isinstance(test_dict.pop("_version"), ObjectId)
     assert test_dict == {"_id": "testid3", "xyz": "tzy"}
 
 
@@ -69,7 +115,7 @@ def test_mongo_model_can_save_with_object_to_update():
         "foo1": "bar1",
         "xyz": "tzy",
     }
-    assert document == test_dict
+    assert document.pop_keys(["_version"]) == test_dict
     test_dict = TEST_COLLECTION.find_one({"_id": "testid4"})
     assert document.get_object() == test_dict
 
@@ -78,10 +124,22 @@ def test_mongo_model_can_save_and_create():
     document = EventDocument({"id": "testid6", "foo": "bar"})
     document.save()
     test_dict = TEST_COLLECTION.find_one({"_id": "testid6"})
-    assert document == {"id": "testid6", "_id": "testid6", "foo": "bar"}
+    assert document._version == test_dict.pop("_version")
+    assert document.pop_keys(["_version"]) == {"id": "testid6",
+                                               "_id": "testid6", "foo": "bar"}
     assert test_dict == {"_id": "testid6", "foo": "bar"}
 
 
+def test_mongo_model_writes_stamp_a_new_version():
+    document = EventDocument({"id": "testid8", "foo": "bar"})
+    document.save()
+    first = TEST_COLLECTION.find_one({"_id": "testid8"})["_version"]
+    EventDocument({"id": "testid8", "foo": "baz"}).update_with()
+    second = TEST_COLLECTION.find_one({"_id": "testid8"})["_version"]
+    assert first != second
+    assert "_version" not in document.serialize()
+
+
 def test_mongo_model_can_remove():
     create_data()
     document = EventDocument({"id": "testid1"})
@@ -98,3 +156,73 @@ def test_event_document_can_remove_all():
     EventDocument.remove_all()
     assert TEST_COLLECTION.count_documents({}) == 0
     assert EventDocument.collection.count_documents({}) == 0
+
+
+def test_event_document_can_insert_many_with_duplicates():
+    create_data()
+    documents = [
+        EventDocument({"id": "testid1", "foo": "bar"}),
+        EventDocument({"id": "testid7", "foo": "bar"}),
+        EventDocument({"id": "testid7", "foo": "baz"}),
+    ]
+    duplicates = EventDocument.insert_many(documents)
+    assert duplicates == {0, 2}
+    assert TEST_COLLECTION.find_one({"_id": "testid7"},
+                                    {"_version": 0}) == {"_id": "testid7",
+                                                         "foo": "bar"}
+
+
+def test_event_document_create_costs_an_insert_and_a_rollup_update():
+    destroy_data()
+    document = EventDocument({"id": "testid8", "foo": "bar"})
+    commands = count_commands(document.create)
+    assert commands[TEST_COLLECTION.name] == ["insert"]
+    assert commands[TEST_ROLLUP_COLLECTION.name] == ["update"]
+    # The write generation is counted per process by default
+    assert MONGO_COUNTERS_COLLECTION_NAME not in commands
+    assert len(commands) == 2
+    assert TEST_COLLECTION.find_one({"_id": "testid8"},
+                                    {"_version": 0}) == {"_id": "testid8",
+                                                         "foo": "bar"}
+
+
+def test_event_document_create_raises_on_duplicate():
+    create_data()
+    with pytest.raises(DuplicateKeyError):
+        EventDocument({"id": "testid1"}).create()
+
+
+def test_event_document_update_costs_one_round_trip():
+    create_data()
+    document = EventDocument({"id": "testid1", "xyz": "tzy"})
+    commands = count_commands(document.save)
+    assert commands[TEST_COLLECTION.name] == ["findAndModify"]
+    # Neither the rollup key nor the value changed
+    assert TEST_ROLLUP_COLLECTION.name not in commands
+    assert document.pop_keys(["_version"]) == {
+        "id": "testid1", "_id": "testid1", "foo1": "bar1", "xyz": "tzy"}
+
+
+def test_event_document_writes_keep_rollups_up_to_date():
+    destroy_data()
+    event = {"client": 1, "timestamp": "2019-01-01T10:00:00", "value": 2.0}
+    EventDocument(dict(event, id="testid9")).create()
+    EventDocument(dict(event, id="testid10", value=3.0)).save()
+    EventDocument({"id": "testid10", "value": 5.0}).save()
+
+    EventDocument(dict(event, id="testid11", value=None)).create()
+
+    rollup = TEST_ROLLUP_COLLECTION.find_one({"client": 1}, {"_id": 0})
+    assert rollup["day"] == "2019-01-01"
+    assert (rollup["sum"], rollup["count"]) == (7.0, 3)
+    assert rollup["value_count"] == 2
+    EventDocument({"id": "testid11"}).remove()
+
+    EventDocument({"id": "testid9"}).remove()
+    rollup = TEST_ROLLUP_COLLECTION.find_one({"client": 1})
+    assert (rollup["sum"], rollup["count"]) == (5.0, 1)
+
+    assert rollups.rebuild(TEST_COLLECTION) == 1
+    rollup = TEST_ROLLUP_COLLECTION.find_one({"client": 1})
+    assert (rollup["sum"], rollup["count"]) == (5.0, 1)
+    assert (rollup["min"], rollup["max"]) == (5.0, 5.0)
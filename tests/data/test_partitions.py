@@ -0,0 +1,167 @@
+import datetime
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from .. import PartitionedCollection, connections, partitions, retention
+
+MONTHLY = PartitionedCollection(connections, "events", partitions.MONTH)
+WEEKLY = PartitionedCollection(connections, "events", partitions.WEEK)
+NAMES = ["events_daily", "events", "events_20190101", "events_20190201",
+         "events_20190301"]
+
+
+def test_partition_name_is_the_start_of_the_period():
+    timestamp = datetime.datetime(2019, 2, 13, 10, 30)
+    assert MONTHLY.get_partition_name(timestamp) == "events_20190201"
+    assert WEEKLY.get_partition_name(timestamp) == "events_20190211"
+    assert MONTHLY.get_partition_name("2019-12-31T23:59:59Z") == \
+        "events_20191201"
+
+
+def test_events_without_a_readable_timestamp_stay_in_the_events():
+    for timestamp in [None, "yesterday"]:
+        assert MONTHLY.get_partition_name(timestamp) == "events"
+
+
+def test_period_of_a_partition():
+    assert MONTHLY.get_period("events_20191201") == (
+        datetime.datetime(2019, 12, 1), datetime.datetime(2020, 1, 1))
+    assert WEEKLY.get_period("events_20181231") == (
+        datetime.datetime(2018, 12, 31), datetime.datetime(2019, 1, 7))
+    assert MONTHLY.get_period("events") is None
+    assert MONTHLY.get_period("events_daily") is None
+
+
+def test_unsupported_partitioning():
+    with pytest.raises(ValueError):
+        PartitionedCollection(connections, "events", "day")
+
+
+def test_select_names_without_range_reads_every_partition():
+    assert MONTHLY.select_names(NAMES) == [
+        "events_20190301", "events_20190201", "events_20190101", "events"]
+
+
+def test_select_names_keeps_the_partitions_overlapping_the_range():
+    query = {"client": {"$in": [1]}, "timestamp": {
+        "$gte": datetime.datetime(2019, 2, 1), "$lte": "2019-02-28"}}
+    assert MONTHLY.select_names(NAMES, query) == ["events_20190201",
+                                                  "events"]
+    query = {"timestamp": {"$gte": "2019-01-31T10:00:00"}}
+    assert MONTHLY.select_names(NAMES, query) == [
+        "events_20190301", "events_20190201", "events_20190101", "events"]
+    query = {"timestamp": {"$lte": datetime.datetime(2018, 12, 31)}}
+    assert MONTHLY.select_names(NAMES, query) == ["events"]
+
+
+def test_union_pipeline_runs_the_leading_stages_on_every_partition():
+    branch = [{"$match": {"client": 1}}, {"$project": {"value": 1}}]
+    rest = [{"$group": {"_id": None, "sum": {"$sum": "$value"}}},
+            {"$match": {"sum": {"$gt": 0}}}]
+    name, pipeline = MONTHLY.get_union_pipeline(
+        ["events_20190201", "events_20190101", "events"], branch + rest)
+    assert name == "events_20190201"
+    assert pipeline == branch + [
+        {"$unionWith": {"coll": "events_20190101", "pipeline": branch}},
+        {"$unionWith": {"coll": "events", "pipeline": branch}},
+    ] + rest
+
+
+def test_union_pipeline_of_a_single_partition_is_unchanged():
+    pipeline = [{"$group": {"_id": "$client"}}]
+    assert MONTHLY.get_union_pipeline(["events"], pipeline) == (
+        "events", pipeline)
+
+
+def test_positions_of_the_documents_per_partition():
+    documents = [{"timestamp": datetime.datetime(2019, 1, 2)},
+                 {"timestamp": None},
+                 {"timestamp": "2019-01-31"},
+                 {"timestamp": "2019-02-01"}]
+    assert MONTHLY.get_positions(documents) == {
+        "events_20190101": [0, 2], "events": [1], "events_20190201": [3]}
+
+
+def test_write_errors_are_merged_at_their_positions():
+    errors = []
+    exc = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}],
+                          "nInserted": 1})
+    partitions.merge_write_errors(errors, [3, 5], exc)
+    with pytest.raises(BulkWriteError) as info:
+        partitions.raise_write_errors(errors, 4)
+    assert info.value.details["writeErrors"] == [{"index": 5, "code": 11000}]
+    assert info.value.details["nInserted"] == 4
+    partitions.raise_write_errors([], 4)
+
+
+def test_written_positions_of_an_insert():
+    errors = [{"index": 1, "code": 11000}]
+    assert partitions.get_written([4, 5, 6], errors, False) == [4, 6]
+    assert partitions.get_written([4, 5, 6], errors, True) == [4]
+    assert partitions.get_written([4, 5, 6], [], True) == [4, 5, 6]
+
+
+def test_unwritten_ids_are_released_except_the_duplicates():
+    errors = [{"index": 1, "code": 11000}, {"index": 2, "code": 121}]
+    assert partitions.get_unwritten([0, 1, 2, 3], {0}, errors) == [2, 3]
+
+
+def test_id_entries_point_at_the_partitions():
+    documents = [{"_id": "a", "timestamp": datetime.datetime(2019, 2, 3)},
+                 {"timestamp": None}]
+    entries = MONTHLY.get_id_entries(documents)
+    assert entries[0] == {"_id": "a", "partition": "events_20190201"}
+    assert entries[1] == {"_id": documents[1]["_id"], "partition": "events"}
+
+
+class NamedCollection(PartitionedCollection):
+
+    def __init__(self, names):
+        super().__init__(connections, "events", partitions.MONTH)
+        self.names = names
+
+    def get_names(self, query=None):
+        return self.select_names(self.names, query)
+
+
+def test_reads_by_id_start_with_the_partition_the_filter_points_at():
+    collection = PartitionedCollection(connections, "events",
+                                       partitions.MONTH)
+    names = MONTHLY.select_names(NAMES)
+    assert collection.order_names(names, {"_id": "a"}) == names
+    collection.remember({"_id": "a"}, "events_20190101")
+    assert collection.order_names(names, {"_id": "a"})[0] == \
+        "events_20190101"
+    assert collection.order_names(names, {
+        "_id": "b", "timestamp": datetime.datetime(2019, 2, 3)})[0] == \
+        "events_20190201"
+    assert collection.order_names(names, {"_id": {"$in": ["a"]}}) == names
+
+    collection.forget("events_20190101")
+    assert collection.get_hint({"_id": "a"}) is None
+
+
+def test_partition_names_are_cached_until_dropped():
+    collection = PartitionedCollection(connections, "events",
+                                       partitions.MONTH)
+    assert collection.get_cached_names() is None
+    collection.set_names(NAMES)
+    collection.add_name("events_20190401")
+    assert "events_20190401" in collection.get_cached_names()
+    collection.forget("events_20190101")
+    assert "events_20190101" not in collection.get_cached_names()
+    collection.names_at -= partitions.EVENT_PARTITION_NAMES_TTL + 1
+    assert collection.get_cached_names() is None
+
+
+def test_expired_partitions_ended_before_the_retention():
+    collection = NamedCollection(NAMES)
+    now = datetime.datetime(2019, 3, 31)
+    assert retention.get_expired(collection, 30, now) == [
+        ("events_20190201", (datetime.datetime(2019, 2, 1),
+                             datetime.datetime(2019, 3, 1))),
+        ("events_20190101", (datetime.datetime(2019, 1, 1),
+                             datetime.datetime(2019, 2, 1))),
+    ]
+    assert retention.get_expired(collection, 60, now) == []
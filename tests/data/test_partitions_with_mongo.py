@@ -0,0 +1,156 @@
+import datetime
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .. import MONGO_DB_NAME, PartitionedCollection, connections, partitions
+from .. import retention, rollups
+
+PARTITIONED = PartitionedCollection(connections, "events_partitioned",
+                                    partitions.MONTH)
+UNPARTITIONED = connections.collection("events_unpartitioned")
+
+
+def get_event(number, timestamp):
+    return {"_id": f"{number:08x}", "client": number % 3,
+            "value": float(number), "timestamp": timestamp}
+
+
+EVENTS = [get_event(number, datetime.datetime(2019, 1 + number % 3,
+                                              1 + number % 28, number % 24))
+          for number in range(60)] + [get_event(60, None)]
+
+
+def destroy_data():
+    PARTITIONED.drop()
+    UNPARTITIONED.drop()
+    rollups.collection.drop()
+
+
+def setup_module(module):
+    connections.configure(database_name="test")
+    destroy_data()
+
+
+def teardown_module(module):
+    destroy_data()
+    connections.configure(database_name=MONGO_DB_NAME)
+
+
+def setup_function(function):
+    destroy_data()
+
+
+def test_events_are_stored_in_the_partition_of_their_timestamp():
+    PARTITIONED.insert_many(EVENTS)
+    assert PARTITIONED.get_names() == [
+        "events_partitioned_20190301", "events_partitioned_20190201",
+        "events_partitioned_20190101", "events_partitioned"]
+    partition = connections.collection("events_partitioned_20190201")
+    assert partition.count_documents({}) == 20
+    assert PARTITIONED.count_documents({}) == len(EVENTS)
+    assert PARTITIONED.find_one({"_id": EVENTS[-1]["_id"]})["value"] == 60
+
+
+def test_event_moves_when_its_timestamp_changes():
+    PARTITIONED.insert_one(get_event(1, datetime.datetime(2019, 1, 5)))
+    previous = PARTITIONED.find_one_and_update(
+        {"_id": "00000001"},
+        {"$set": {"timestamp": datetime.datetime(2019, 2, 5), "value": 2.0}})
+    assert previous["value"] == 1.0
+    assert connections.collection(
+        "events_partitioned_20190101").count_documents({}) == 0
+    moved = connections.collection("events_partitioned_20190201").find_one()
+    assert moved["value"] == 2.0
+
+
+def test_split_moves_the_events_to_their_partitions():
+    connections.collection("events_partitioned").insert_many(EVENTS)
+    assert PARTITIONED.split(batch_size=7) == len(EVENTS) - 1
+    assert connections.collection("events_partitioned").count_documents(
+        {}) == 1
+    assert PARTITIONED.count_documents({}) == len(EVENTS)
+
+
+def test_aggregations_match_the_unpartitioned_collection():
+    PARTITIONED.insert_many(EVENTS)
+    UNPARTITIONED.insert_many(EVENTS)
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": datetime.datetime(2019, 1, 20),
+                                  "$lte": datetime.datetime(2019, 2, 10)}}},
+        {"$group": {"_id": "$client", "sum": {"$sum": "$value"},
+                    "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+    assert list(PARTITIONED.aggregate(pipeline)) == \
+        list(UNPARTITIONED.aggregate(pipeline))
+
+
+def test_reads_by_id_find_the_partitions_of_the_other_processes():
+    PARTITIONED.insert_many(EVENTS)
+    searched = []
+
+    def find_one(partition):
+        searched.append(partition.name)
+        return partition.find_one({"_id": EVENTS[1]["_id"]})
+
+    assert PARTITIONED.search({"_id": EVENTS[1]["_id"]}, find_one)
+    assert searched == ["events_partitioned_20190201"]
+
+    other = PartitionedCollection(connections, "events_partitioned",
+                                  partitions.MONTH)
+    other.insert_one(get_event(61, datetime.datetime(2019, 4, 2)))
+    assert PARTITIONED.find_one({"_id": "0000003d"})["value"] == 61
+
+
+def test_ids_are_unique_across_the_partitions():
+    PARTITIONED.insert_one(get_event(1, datetime.datetime(2019, 1, 5)))
+    with pytest.raises(DuplicateKeyError):
+        PARTITIONED.insert_one(get_event(1, datetime.datetime(2019, 2, 5)))
+
+    with pytest.raises(BulkWriteError) as info:
+        PARTITIONED.insert_many([
+            get_event(2, datetime.datetime(2019, 3, 5)),
+            get_event(1, datetime.datetime(2019, 3, 5)),
+            get_event(2, datetime.datetime(2019, 1, 5))])
+    assert [error["index"] for error in info.value.details[
+        "writeErrors"]] == [1, 2]
+    assert PARTITIONED.count_documents({}) == 2
+    assert connections.collection("events_partitioned_ids").find_one(
+        {"_id": "00000002"})["partition"] == "events_partitioned_20190301"
+
+    PARTITIONED.find_one_and_delete({"_id": "00000001"})
+    PARTITIONED.insert_one(get_event(1, datetime.datetime(2019, 2, 5)))
+
+
+def test_move_stopped_half_way_is_completed_by_the_next_save():
+    PARTITIONED.insert_one(get_event(1, datetime.datetime(2019, 1, 5)))
+    # The id index points at the new partition, the event wasn't copied
+    connections.collection("events_partitioned_ids").update_one(
+        {"_id": "00000001"},
+        {"$set": {"partition": "events_partitioned_20190201"}})
+
+    previous = PARTITIONED.find_one_and_update(
+        {"_id": "00000001"},
+        {"$set": {"timestamp": datetime.datetime(2019, 2, 5), "value": 2.0}})
+    assert previous["value"] == 1.0
+    assert connections.collection(
+        "events_partitioned_20190101").count_documents({}) == 0
+    assert connections.collection(
+        "events_partitioned_20190201").find_one()["value"] == 2.0
+
+
+def test_expire_drops_the_partitions_and_only_their_rollups():
+    PARTITIONED.insert_many(EVENTS)
+    rollups.collection.insert_many([{"day": day, "count": 1} for day in (
+        "2019-01-31", "2019-02-01", "2019-03-01", None)])
+    generation = retention.write_generation.value
+
+    assert retention.expire(PARTITIONED, 30, datetime.datetime(2019, 3, 5)) \
+        == ["events_partitioned_20190101"]
+    assert sorted(rollups.collection.distinct("day"), key=str) == [
+        "2019-02-01", "2019-03-01", None]
+    assert PARTITIONED.count_documents({}) == 41
+    assert connections.collection("events_partitioned_ids").count_documents(
+        {}) == 41
+    assert retention.write_generation.value > generation
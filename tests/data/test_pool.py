@@ -0,0 +1,58 @@
+from pymongo.monitoring import (ConnectionCheckedInEvent,
+                                ConnectionCheckedOutEvent,
+                                ConnectionCheckOutFailedEvent,
+                                ConnectionCheckOutStartedEvent,
+                                ConnectionClosedEvent,
+                                ConnectionCreatedEvent,
+                                PoolClearedEvent)
+
+from .. import PoolStatsListener
+
+ADDRESS = ("mongo", 27017)
+
+
+def check_out(listener, connection_id=1):
+    listener.connection_check_out_started(
+        ConnectionCheckOutStartedEvent(ADDRESS))
+    listener.connection_checked_out(
+        ConnectionCheckedOutEvent(ADDRESS, connection_id))
+
+
+def test_pool_stats_counts_checkouts_and_checkins():
+    listener = PoolStatsListener()
+    listener.connection_created(ConnectionCreatedEvent(ADDRESS, 1))
+    listener.connection_created(ConnectionCreatedEvent(ADDRESS, 2))
+    check_out(listener, 1)
+    check_out(listener, 2)
+    listener.connection_checked_in(ConnectionCheckedInEvent(ADDRESS, 1))
+
+    stats = listener.stats()
+    assert stats["open"] == 2
+    assert stats["checked_out"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["failed_checkouts"] == 0
+    assert stats["max_wait_ms"] >= stats["mean_wait_ms"] >= 0
+
+
+def test_pool_stats_counts_failed_checkouts_and_clears():
+    listener = PoolStatsListener()
+    listener.connection_check_out_started(
+        ConnectionCheckOutStartedEvent(ADDRESS))
+    listener.connection_check_out_failed(
+        ConnectionCheckOutFailedEvent(ADDRESS, "timeout"))
+    listener.pool_cleared(PoolClearedEvent(ADDRESS))
+    listener.connection_created(ConnectionCreatedEvent(ADDRESS, 1))
+    listener.connection_closed(ConnectionClosedEvent(ADDRESS, 1, "stale"))
+
+    stats = listener.stats()
+    assert stats["failed_checkouts"] == 1
+    assert stats["checkouts"] == 0
+    assert stats["clears"] == 1
+    assert stats["open"] == 0
+
+
+def test_pool_stats_can_reset():
+    listener = PoolStatsListener()
+    check_out(listener)
+    listener.reset()
+    assert listener.stats()["checkouts"] == 0
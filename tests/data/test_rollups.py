@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+
+from pymongo import UpdateOne
+
+from .. import rollups
+
+EVENT = {
+    "_id": "testid1",
+    "client": 1,
+    "client_group": 2,
+    "device_type": "mobile",
+    "category": None,
+    "valid": True,
+    "timestamp": datetime.datetime(2019, 1, 1, 10, 30),
+    "value": 10.5,
+}
+
+
+def test_rollup_can_get_day():
+    assert rollups.get_day(datetime.datetime(2019, 1, 1, 10)) == "2019-01-01"
+    assert rollups.get_day("2019-01-01T10:00:00Z") == "2019-01-01"
+    assert rollups.get_day(None) is None
+
+
+def test_rollup_can_get_key():
+    assert rollups.get_key(EVENT) == {
+        "day": "2019-01-01",
+        "client": 1,
+        "client_group": 2,
+        "device_type": "mobile",
+        "category": None,
+        "valid": True,
+    }
+
+
+def test_rollup_updates_for_insert_and_delete():
+    key = rollups.get_key(EVENT)
+    assert rollups.get_updates(None, EVENT) == [
+        UpdateOne(key, {"$inc": {"sum": 10.5, "count": 1, "value_count": 1},
+                        "$min": {"min": 10.5},
+                        "$max": {"max": 10.5}}, upsert=True),
+    ]
+    assert rollups.get_updates(EVENT, None) == [
+        UpdateOne(key, {"$inc": {"sum": -10.5, "count": -1,
+                                 "value_count": -1}}),
+    ]
+
+
+def test_rollup_updates_only_count_events_without_value():
+    event = dict(EVENT, value=None)
+    key = rollups.get_key(event)
+    assert rollups.get_updates(None, event) == [
+        UpdateOne(key, {"$inc": {"count": 1}}, upsert=True),
+    ]
+    assert rollups.get_updates(event, None) == [
+        UpdateOne(key, {"$inc": {"count": -1}}),
+    ]
+    assert rollups.get_updates(dict(EVENT, value=0), event) == [
+        rollups.get_update(dict(EVENT, value=0), -1),
+        rollups.get_update(event, 1),
+    ]
+
+
+def test_rollup_updates_for_unchanged_and_moved_event():
+    assert rollups.get_updates(EVENT, dict(EVENT, foo="bar")) == []
+
+    moved = dict(EVENT, client=3)
+    delete, insert = rollups.get_updates(EVENT, moved)
+    assert delete == rollups.get_update(EVENT, -1)
+    assert insert == rollups.get_update(moved, 1)
+
+
+class FakeRollups:
+
+    def __init__(self, days):
+        self.days = days
+        self.counts = 0
+
+    def estimated_document_count(self):
+        self.counts += 1
+        return len(self.days)
+
+    def find_one(self, filter, projection, sort):
+        days = sorted(self.days, reverse=sort[0][1] < 0)
+        return {"day": days[0]} if days else None
+
+
+class AsyncFakeRollups(FakeRollups):
+
+    async def estimated_document_count(self):
+        return super().estimated_document_count()
+
+    async def find_one(self, filter, projection, sort):
+        return super().find_one(filter, projection, sort)
+
+
+def test_rollup_stats_average_the_documents_per_day():
+    stats = rollups.RollupStats()
+    source = FakeRollups(["2019-01-01"] * 20 + ["2019-01-10"] * 10)
+    assert stats.get_per_day(source) == 3.0
+    assert stats.get_per_day(FakeRollups([])) == 3.0  # Cached
+    assert source.counts == 1
+    assert rollups.RollupStats(ttl=0).get_per_day(FakeRollups([])) == 0.0
+
+
+def test_rollup_stats_async():
+    stats = rollups.RollupStats()
+    source = AsyncFakeRollups(["2019-01-01", "2019-01-01", "2019-01-02"])
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(stats.get_per_day_async(source)) == 1.5
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from benchmarks import suite
+
+
+def test_every_benchmark_case_runs():
+    for name, (func, inputs) in suite.get_cases().items():
+        func(inputs[0])
+
+
+def test_compare_reports_slowdowns_above_the_threshold():
+    baselines = {"cases": {"fast": {"relative": 1.0},
+                           "slow": {"relative": 1.0}}}
+    results = {"cases": {"fast": {"relative": 1.1},
+                         "slow": {"relative": 1.5},
+                         "new": {"relative": 9.0}}}
+    regressions = suite.compare(results, baselines, threshold=0.3)
+    assert list(regressions) == ["slow"]
+    assert round(regressions["slow"], 6) == 0.5
+
+
+# Wall clock timings, only meaningful on an otherwise idle machine
+@pytest.mark.skipif(not os.environ.get("BENCHMARKS"),
+                    reason="set BENCHMARKS=1 to compare with the baselines")
+def test_no_case_is_slower_than_its_baseline():
+    baselines = suite.load_baselines()
+    if baselines is None:
+        pytest.skip("no baselines recorded, see benchmarks/suite.py")
+    results = suite.run_cases(suite.get_cases())
+    assert set(results["cases"]) <= set(baselines["cases"])
+    assert suite.compare(results, baselines, suite.DEFAULT_THRESHOLD) == {}
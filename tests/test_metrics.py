@@ -0,0 +1,84 @@
+import threading
+
+from app.metrics import (SHARD_COUNT, Counter, Gauge, Histogram, Registry,
+                         get_status, timed)
+
+
+def test_counter_sums_the_shards_of_every_thread():
+    counter = Counter("events_total", "Events", ["kind"])
+    threads = [threading.Thread(target=lambda: [counter.inc("a")
+                                                for _ in range(1000)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc("b", amount=2)
+    assert counter.collect() == {("a",): 4000, ("b",): 2}
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency", ["operation"],
+                          buckets=[0.1, 1.0])
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value, "get_report")
+    lines = histogram.render()
+    assert lines[:2] == ["# HELP latency_seconds Latency",
+                         "# TYPE latency_seconds histogram"]
+    assert lines[2:] == [
+        'latency_seconds_bucket{operation="get_report",le="0.1"} 2',
+        'latency_seconds_bucket{operation="get_report",le="1.0"} 3',
+        'latency_seconds_bucket{operation="get_report",le="+Inf"} 4',
+        'latency_seconds_sum{operation="get_report"} 2.65',
+        'latency_seconds_count{operation="get_report"} 4',
+    ]
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    gauge = registry.register(Gauge("in_flight", "In flight", ["operation"]))
+    gauge.inc("get_event")
+    gauge.inc("get_event")
+    gauge.dec("get_event")
+    assert registry.render() == ("# HELP in_flight In flight\n"
+                                 "# TYPE in_flight gauge\n"
+                                 'in_flight{operation="get_event"} 1\n')
+
+
+def test_get_status():
+    assert get_status(({}, 404)) == 404
+    assert get_status(type("Response", (), {"status_code": 201})()) == 201
+    assert get_status({}) == 200
+
+
+def test_timed_records_requests_and_failures():
+    from app.metrics import REQUESTS, REQUEST_DURATION, REQUESTS_IN_FLIGHT
+
+    @timed("test_operation")
+    def handler(fail=False):
+        if fail:
+            raise ValueError()
+        return {}, 201
+
+    handler()
+    try:
+        handler(fail=True)
+    except ValueError:
+        pass
+    requests = REQUESTS.collect()
+    assert requests[("test_operation", "201")] == 1
+    assert requests[("test_operation", "500")] == 1
+    assert REQUEST_DURATION.collect()[("test_operation",)][-1] >= 0
+    assert REQUESTS_IN_FLIGHT.collect()[("test_operation",)] == 0
+
+
+def test_shards_dont_grow_with_the_threads():
+    counter = Counter("events_total", "Events")
+    for _ in range(3):
+        threads = [threading.Thread(target=counter.inc) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(counter.shards) == SHARD_COUNT
+    assert counter.collect() == {(): 150}
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.startup import ROOT, measure_startup
+
+# Import of the app, spec loading and the first request, in seconds
+STARTUP_BUDGET = 3.0
+
+
+@pytest.fixture(scope="module")
+def startup():
+    probe = subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if probe.returncode:
+        pytest.skip("the app can't be imported with this interpreter")
+    return min((measure_startup() for _ in range(3)),
+               key=lambda result: result["total"])
+
+
+def test_startup_is_within_budget(startup):
+    assert startup["status"] == 200
+    assert startup["total"] < STARTUP_BUDGET
+
+
+def test_startup_does_not_create_a_mongo_client(startup):
+    assert not startup["connected"]
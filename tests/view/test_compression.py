@@ -0,0 +1,79 @@
+import gzip
+
+import pytest
+
+from .. import compression
+
+DATA = b'{"rows":[' + b",".join([b'{"client":1,"sum":1.5}'] * 200) + b"]}"
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+def test_parse_accept_encoding():
+    assert compression.parse_accept_encoding("gzip, br;q=0.5, *;q=0") == {
+        "gzip": 1.0, "br": 0.5, "*": 0.0}
+    assert compression.parse_accept_encoding(None) == {}
+    assert compression.parse_accept_encoding("gzip;q=x") == {"gzip": 0.0}
+
+
+def test_negotiate_prefers_the_quality_then_the_server_order():
+    encodings = ["br", "gzip"]
+    assert compression.negotiate("gzip, br", encodings) == "br"
+    assert compression.negotiate("gzip, br;q=0.5", encodings) == "gzip"
+    assert compression.negotiate("*", encodings) == "br"
+    assert compression.negotiate("br;q=0, *", encodings) == "gzip"
+    assert compression.negotiate("identity", encodings) is None
+    assert compression.negotiate("", encodings) is None
+
+
+def test_negotiate_skips_brotli_when_it_is_not_installed(gzip_only):
+    assert compression.negotiate("br, gzip") == "gzip"
+    assert compression.negotiate("br") is None
+
+
+def test_compress_body_with_gzip(gzip_only):
+    headers = {}
+    body = compression.compress_body(DATA, 200, "application/json", headers,
+                                     "gzip")
+    assert gzip.decompress(body) == DATA
+    assert len(body) < len(DATA)
+    assert headers == {"Content-Encoding": "gzip",
+                       "Vary": "Accept-Encoding"}
+
+
+def test_compress_body_with_brotli():
+    brotli = pytest.importorskip("brotli")
+    headers = {"Vary": "Accept"}
+    body = compression.compress_body(DATA, 200, "application/json", headers,
+                                     "gzip, br")
+    assert brotli.decompress(body) == DATA
+    assert headers == {"Content-Encoding": "br",
+                       "Vary": "Accept, Accept-Encoding"}
+
+
+@pytest.mark.parametrize("status, mimetype, data, headers", [
+    (200, "application/json", b"{}", {}),
+    (400, "application/json", DATA, {}),
+    (200, "application/vnd.apache.parquet", DATA, {}),
+    (200, "application/json", DATA, {"Content-Encoding": "gzip"}),
+])
+def test_compress_body_leaves_the_other_bodies(status, mimetype, data,
+                                               headers):
+    assert compression.compress_body(data, status, mimetype, headers,
+                                     "gzip") is data
+
+
+def test_compress_body_varies_even_without_compression():
+    headers = {}
+    assert compression.compress_body(DATA, 200, "application/json", headers,
+                                     "identity") is DATA
+    assert headers == {"Vary": "Accept-Encoding"}
+
+
+def test_compress_body_names_the_encoding_in_the_etag(gzip_only):
+    headers = {"ETag": '"abc"'}
+    compression.compress_body(DATA, 200, "application/json", headers, "gzip")
+    assert headers["ETag"] == '"abc-gzip"'
@@ -0,0 +1,59 @@
+import datetime
+import decimal
+import json
+
+import pytest
+from bson import Decimal128, ObjectId
+
+from .. import JsonEncoder, OrjsonEncoder, encoding
+
+ROW = {"client": 1, "device_type": None, "valid": True, "sum": 1.5,
+       "day": "2019-01-07", "timestamp": datetime.datetime(2019, 1, 7, 10)}
+
+
+def get_encoders():
+    encoders = [JsonEncoder()]
+    if encoding.orjson is not None:
+        encoders.append(OrjsonEncoder())
+    return encoders
+
+
+@pytest.mark.parametrize("encoder", get_encoders())
+def test_encoders_write_compact_json(encoder):
+    data = encoder.encode([ROW])
+    assert data == (b'[{"client":1,"device_type":null,"valid":true,"sum":1.5,'
+                    b'"day":"2019-01-07","timestamp":"2019-01-07T10:00:00Z"}]')
+    assert encoder.dumps([ROW]) == data + b"\n"
+
+
+@pytest.mark.parametrize("encoder", get_encoders())
+def test_encoders_write_mongo_values(encoder):
+    value = {"_id": ObjectId("5c33a0f5e1382300018c6a9d"),
+             "date": datetime.date(2019, 1, 7),
+             "aware": datetime.datetime(2019, 1, 7,
+                                        tzinfo=datetime.timezone.utc),
+             "decimal": decimal.Decimal("1.25"),
+             "decimal128": Decimal128("2.5")}
+    assert json.loads(encoder.encode(value)) == {
+        "_id": "5c33a0f5e1382300018c6a9d", "date": "2019-01-07",
+        "aware": "2019-01-07T00:00:00+00:00", "decimal": 1.25,
+        "decimal128": 2.5}
+
+
+@pytest.mark.parametrize("encoder", get_encoders())
+def test_encoders_reject_unknown_values(encoder):
+    with pytest.raises(TypeError):
+        encoder.encode({"value": object()})
+
+
+@pytest.mark.parametrize("encoder", get_encoders())
+def test_encoders_decode_request_bodies(encoder):
+    assert encoder.loads(b'{"id": "a", "value": 1}') == {"id": "a",
+                                                         "value": 1}
+    assert encoder.loads("not json") == "not json"
+
+
+def test_load_encoder_falls_back_without_orjson(monkeypatch):
+    monkeypatch.setattr(encoding, "orjson", None)
+    loaded = encoding.load_encoder("app.view.encoding.OrjsonEncoder")
+    assert isinstance(loaded, JsonEncoder)
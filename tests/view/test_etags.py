@@ -0,0 +1,64 @@
+from bson import ObjectId
+
+from .. import etags
+
+OPTIONS = {"group_by": ["client", "device_type"], "clients": [3, 1]}
+JSON = "application/json"
+
+
+def test_report_etag_ignores_the_order_of_the_options():
+    etag = etags.get_report_etag(OPTIONS, JSON, generation=1, now=0)
+    same = etags.get_report_etag({"clients": [1, 3], "limit": 5,
+                                  "group_by": ["client", "device_type"]},
+                                 JSON, generation=1, now=0)
+    assert etag == same
+    assert etag.startswith('"') and etag.endswith('"')
+
+
+def test_report_etag_changes_with_the_report_and_the_writes():
+    etag = etags.get_report_etag(OPTIONS, JSON, generation=1, now=0)
+    changes = [
+        etags.get_report_etag(dict(OPTIONS, limit=10), JSON, 1, 0),
+        etags.get_report_etag(OPTIONS, "application/x-ndjson", 1, 0),
+        etags.get_report_etag(OPTIONS, JSON, generation=2, now=0),
+        etags.get_report_etag(OPTIONS, JSON, generation=1,
+                              now=etags.REPORT_CACHE_TTL),
+    ]
+    assert etag not in changes
+    assert len(set(changes)) == len(changes)
+
+
+def test_report_etag_is_unique_to_the_process(monkeypatch):
+    etag = etags.get_report_etag(OPTIONS, JSON, generation=1, now=0)
+    monkeypatch.setattr(etags, "PROCESS_TOKEN", "other")
+    assert etags.get_report_etag(OPTIONS, JSON, generation=1, now=0) != etag
+
+
+def test_event_etag_is_its_version():
+    version = ObjectId()
+    assert etags.get_event_etag({"_id": "a", "_version": version}) == \
+        f'"{version}"'
+
+
+def test_event_etag_without_version_hashes_the_content():
+    etag = etags.get_event_etag({"_id": "a", "value": 1})
+    assert etag == etags.get_event_etag({"value": 1, "_id": "a"})
+    assert etag != etags.get_event_etag({"_id": "a", "value": 2})
+
+
+def test_matches_compares_the_tags_without_weakness_and_encoding():
+    etag = '"abc"'
+    assert etags.matches('"abc"', etag)
+    assert etags.matches('"xyz", W/"abc"', etag)
+    assert etags.matches('"abc-gzip"', etag)
+    assert etags.matches('"abc-br"', etag)
+    assert etags.matches("*", etag)
+    assert not etags.matches('"abcd"', etag)
+    assert not etags.matches(None, etag)
+    assert not etags.matches("*", None)
+
+
+def test_not_modified_sends_the_etag_back():
+    body, status, headers = etags.not_modified('"abc"')
+    assert status == 304
+    assert headers == {"ETag": '"abc"'}
@@ -0,0 +1,25 @@
+from .. import events
+
+EVENT_ID = "3fa85f64-5717-4562-b3fc-2c963f66afa6"
+
+
+def test_split_chunk_rejects_events_against_the_schema():
+    chunk = [
+        {"id": EVENT_ID, "value": 1.5, "device_type": "mobile"},
+        {"id": EVENT_ID, "value": "1.5"},
+        {"id": EVENT_ID, "device_type": "toaster"},
+        {"id": EVENT_ID, "client": None},
+        {"id": "not a uuid"},
+        None,
+    ]
+    statuses, documents, positions = events.split_chunk(chunk)
+    assert positions == [0]
+    assert len(documents) == 1
+    assert [status["id"] for status in statuses] == \
+        [EVENT_ID] * 4 + ["not a uuid", None]
+    assert {status["status"] for status in statuses} == {events.EVENT_INVALID}
+
+
+def test_null_values_are_valid_where_the_schema_allows_them():
+    assert events.is_valid_event({"id": EVENT_ID, "device_type": None,
+                                  "category": None})
@@ -0,0 +1,45 @@
+import io
+
+from .. import STREAMED_BODY_KEY, chunked, read_ndjson, stream_body
+
+
+def test_read_ndjson_decodes_lines_lazily():
+    data = b'{"id": "a"}\n\n{"id": "b"}\nnot json\n'
+    events = read_ndjson(data)
+    assert next(events) == {"id": "a"}
+    assert list(events) == [{"id": "b"}, None]
+
+
+def test_read_ndjson_reads_streams_and_a_last_line_without_newline():
+    assert list(read_ndjson(io.BytesIO(b'{"id": "a"}\n{"id": "b"}'))) == \
+        [{"id": "a"}, {"id": "b"}]
+    assert list(read_ndjson('{"id": "a"}')) == [{"id": "a"}]
+
+
+def test_stream_body_moves_the_body_aside():
+    seen = {}
+
+    def app(environ, start_response):
+        seen.update(body=environ["wsgi.input"].read(),
+                    stream=environ.get(STREAMED_BODY_KEY))
+        return []
+
+    middleware = stream_body(app, "/events", "application/x-ndjson")
+    body = b'{"id": "a"}\n{"id": "b"}\n'
+    environ = {"REQUEST_METHOD": "POST", "PATH_INFO": "/events",
+               "CONTENT_TYPE": "application/x-ndjson; charset=utf-8",
+               "CONTENT_LENGTH": str(len(body)),
+               "wsgi.input": io.BytesIO(body + b"trailing")}
+    middleware(environ, None)
+    assert seen["body"] == b""
+    assert list(read_ndjson(seen["stream"])) == [{"id": "a"}, {"id": "b"}]
+
+    middleware({"REQUEST_METHOD": "POST", "PATH_INFO": "/events",
+                "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": "2",
+                "wsgi.input": io.BytesIO(b"[]")}, None)
+    assert seen == {"body": b"[]", "stream": None}
+
+
+def test_chunked_splits_into_sized_lists():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []